@@ -0,0 +1,125 @@
+"""
+Booking latency: DB overlap query vs in-memory interval index.
+
+    cd backend
+    python -m benchmarks.bench_booking --history 20000 --bookings 2000
+
+Seeds a SQLite file with `--history` reservations spread over the 60 default
+spots, then replays the same random booking attempts through
+`ReservationService.create_reservation` with and without the interval index.
+Prints p50/p99 latency (ms) per mode as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sanic.exceptions import InvalidUsage
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata, reservations_table, spots_table, users_table, user_roles_table
+from repositories.reservation_index import SpotIntervalIndex
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_repository import SpotRepository
+from repositories.user_repository import UserRepository
+from services.reservation_service import ReservationService
+
+SPOTS = [f"{row}{i:02d}" for row in "ABCDEF" for i in range(1, 11)]
+EMAIL = "bench@company.com"
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def _seed(db_file: Path, history: int, rng: random.Random, today: datetime) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    async with async_sessionmaker(engine)() as session:
+        await session.execute(insert(spots_table), [{"id": s, "is_free": True, "electrical": s[0] in "AF"} for s in SPOTS])
+        await session.execute(insert(users_table).values(id=1, email=EMAIL, nom="Bench", prenom="Mark"))
+        await session.execute(insert(user_roles_table).values(user_id=1, role="MANAGER"))
+        rows = []
+        for _ in range(history):
+            start = today + timedelta(days=rng.randint(-365, 60))
+            rows.append({
+                "spot_id": rng.choice(SPOTS),
+                "user_id": 1,
+                "start_date": start,
+                "end_date": start + timedelta(hours=rng.choice((4, 9, 24))),
+                "checked_in": False,
+            })
+        await session.execute(insert(reservations_table), rows)
+        await session.commit()
+    await engine.dispose()
+
+
+def _attempts(bookings: int, rng: random.Random, today: datetime) -> list[tuple[str, datetime, datetime]]:
+    out = []
+    for _ in range(bookings):
+        start = today + timedelta(days=rng.randint(0, 60), hours=rng.choice((8, 14)))
+        out.append((rng.choice(SPOTS), start, start + timedelta(hours=4)))
+    return out
+
+
+async def _run(db_file: Path, attempts, *, use_index: bool) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}")
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    index = SpotIntervalIndex() if use_index else None
+    if index is not None:
+        async with Session() as session:
+            await ReservationRepository(session, index=index).warm_index()
+
+    latencies, booked = [], 0
+    for spot_id, start, end in attempts:
+        async with Session() as session:
+            service = ReservationService(
+                session, ReservationRepository(session, index=index), SpotRepository(session), UserRepository(session)
+            )
+            t0 = time.perf_counter()
+            try:
+                await service.create_reservation(spot_id, EMAIL, start, end)
+                booked += 1
+            except InvalidUsage:
+                pass
+            latencies.append((time.perf_counter() - t0) * 1000)
+    await engine.dispose()
+    return {
+        "attempts": len(attempts),
+        "booked": booked,
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+    }
+
+
+async def main(history: int, bookings: int, seed: int) -> dict:
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    attempts = _attempts(bookings, random.Random(seed + 1), today)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, use_index in (("db_query", False), ("interval_index", True)):
+            # same starting data for both modes
+            db_file = Path(tmp) / f"{mode}.db"
+            await _seed(db_file, history, random.Random(seed), today)
+            results[mode] = await _run(db_file, attempts, use_index=use_index)
+    return {"history": history, "seed": seed, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--history", type=int, default=20000)
+    parser.add_argument("--bookings", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.history, args.bookings, args.seed)), indent=2))
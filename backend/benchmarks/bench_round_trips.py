@@ -0,0 +1,99 @@
+"""
+DB round trips per endpoint, RETURNING vs emulated (MySQL) write path.
+
+    cd backend
+    python -m benchmarks.bench_round_trips
+
+Boots create_app() on a temporary SQLite file, calls each write endpoint once
+and counts what reaches the DB (cursor executions + commits). The run is done
+twice: with RETURNING, then with the dialect flags switched off, which is the
+INSERT/UPDATE + SELECT path MySQL still takes (and what every dialect did
+before). Prints the counts as JSON.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import event
+
+# counter of the request being served (the startup hooks and background tasks are not counted)
+_current: contextvars.ContextVar = contextvars.ContextVar("round_trips", default=None)
+
+SECRETARY = {"X-User-Id": "1", "X-User-Roles": "SECRETAIRE", "X-User-Email": "sec@company.com"}
+
+
+def _scenario():
+    # (label, method, path, json body, headers)
+    return [
+        ("POST /auth/register", "post", "/auth/register",
+         {"email": "new@company.com", "nom": "New", "prenom": "User"}, {}),
+        ("POST /users/", "post", "/users/",
+         {"email": "sec@company.com", "nom": "Sec", "prenom": "Retary", "roles": ["SECRETAIRE", "MANAGER"]}, SECRETARY),
+        ("PUT /users/<id>/roles", "put", "/users/1/roles", {"roles": ["SECRETAIRE", "MANAGER"]}, SECRETARY),
+        ("PATCH /users/<id>", "patch", "/users/1", {"nom": "Renamed"}, SECRETARY),
+        ("POST /spots/", "post", "/spots/", {"id": "G01", "electrical": False}, SECRETARY),
+        ("PATCH /spots/<id>", "patch", "/spots/G01", {"is_free": False}, SECRETARY),
+        ("POST /reservations/", "post", "/reservations/",
+         {"spot_id": "A01", "start_date": "2030-01-07T00:00:00", "end_date": "2030-01-08T23:59:59"}, SECRETARY),
+        ("PATCH /reservations/<id>/checkin", "patch", "/reservations/1/checkin", None, SECRETARY),
+        ("PUT /parking/config", "put", "/parking/config", {"slots_max": 70}, SECRETARY),
+        ("POST /hello", "post", "/hello", {"message": "hello"}, {}),
+    ]
+
+
+async def _measure(db_file: Path, *, returning: bool) -> dict:
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_file}"
+    os.environ["SANIC_TEST_MODE"] = "1"
+    os.environ["DISABLE_MQ"] = "1"
+    from app import create_app
+
+    app = create_app()
+    counts: dict[str, int] = {}
+    last = {}
+
+    def _on_round_trip(*_args):
+        counter = _current.get()
+        if counter is not None:
+            counter["n"] += 1
+
+    @app.on_request
+    async def _start_counting(request):
+        request.ctx.round_trips = {"n": 0}
+        _current.set(request.ctx.round_trips)
+
+    @app.on_response
+    async def _stop_counting(request, _response):
+        last["n"] = request.ctx.round_trips["n"]
+
+    async with app.asgi_client as client:
+        await client.get("/health")  # triggers the startup hooks
+        engine = app.ctx.engine
+        engine.dialect.insert_returning = returning
+        engine.dialect.update_returning = returning
+        event.listen(engine.sync_engine, "before_cursor_execute", _on_round_trip)
+        event.listen(engine.sync_engine, "commit", _on_round_trip)
+        for label, method, path, body, headers in _scenario():
+            _req, res = await getattr(client, method)(path, json=body, headers=headers)
+            if res.status >= 300:
+                raise RuntimeError(f"{label} -> {res.status}: {res.body[:200]!r}")
+            counts[label] = last["n"]
+    return counts
+
+
+async def main() -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        emulated = await _measure(Path(tmp) / "emulated.db", returning=False)
+        returning = await _measure(Path(tmp) / "returning.db", returning=True)
+    return {
+        label: {"emulated": emulated[label], "returning": returning[label]}
+        for label in emulated
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main()), indent=2))
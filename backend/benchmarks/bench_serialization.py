@@ -0,0 +1,85 @@
+"""
+Encoding cost of a 10k-reservation list response.
+
+    cd backend
+    python -m benchmarks.bench_serialization --rows 10000 --repeat 20
+
+Compares the former path (recursive `_jsonable` walk into dicts, then
+sanic.response.json) with utils.serialization.json, which hands the
+Reservation dataclasses to orjson directly. Prints the median time (ms) and
+body size per variant as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sanic.response import json as sanic_json
+
+from model.reservation import Reservation
+from utils.serialization import json as orjson_response
+
+
+def _legacy_jsonable(v):
+    # the helper formerly copied in reservations_controller
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, dict):
+        return {k: _legacy_jsonable(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_legacy_jsonable(x) for x in v]
+    if hasattr(v, "__slots__"):
+        return {s: _legacy_jsonable(getattr(v, s)) for s in v.__slots__}
+    return v
+
+
+def _reservations(n: int) -> list[Reservation]:
+    base = datetime(2030, 1, 7, 8)
+    return [
+        Reservation(
+            id=i,
+            spot_id=f"{'ABCDEF'[i % 6]}{i % 10 + 1:02d}",
+            user_id=i % 250,
+            start_date=base + timedelta(days=i % 365),
+            end_date=base + timedelta(days=i % 365, hours=10),
+            checked_in=bool(i % 3),
+            created_at=base - timedelta(days=1, microseconds=i),
+            updated_at=base,
+        )
+        for i in range(n)
+    ]
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def main(rows: int, repeat: int) -> dict:
+    data = _reservations(rows)
+    variants = {
+        "jsonable + sanic.json": lambda: sanic_json(_legacy_jsonable(data)),
+        "utils.serialization.json": lambda: orjson_response(data),
+    }
+    bodies = {name: fn().body for name, fn in variants.items()}
+    # same payload either way
+    assert json.loads(bodies["jsonable + sanic.json"]) == json.loads(bodies["utils.serialization.json"])
+    return {
+        name: {"median_ms": _median_ms(fn, repeat), "bytes": len(bodies[name])}
+        for name, fn in variants.items()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(main(args.rows, args.repeat), indent=2))
@@ -1,9 +1,14 @@
 import os
 from sqlalchemy import (
-    MetaData, Table, Column, Integer, String, DateTime, Boolean,
-    ForeignKey, UniqueConstraint, func
+    MetaData, Table, Column, Integer, String, Text, Date, DateTime, Time, Boolean,
+    ForeignKey, UniqueConstraint, Index, func, inspect
 )
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sanic.log import logger
+from utils.db_pool import PoolSettings, pool_options
+from utils.query_stats import track_queries
+from utils.read_replica import SessionRouter
 
 metadata = MetaData()
 
@@ -67,8 +72,75 @@ reservations_table = Table(
     Column("start_date", DateTime, nullable=False),
     Column("end_date", DateTime, nullable=False),
     Column("checked_in", Boolean, nullable=False, default=False),
+    Column("released_at", DateTime, nullable=True),  # set when release_unchecked freed the spot
+    # materialized occurrence (checked in / released) of a reservation series
+    Column("series_id", Integer, ForeignKey("reservation_series.id", ondelete="SET NULL"), nullable=True),
     Column("created_at", DateTime, server_default=func.now(), nullable=False),
     Column("updated_at", DateTime, server_default=func.now(), onupdate=func.now(), nullable=False),
+    # has_overlap / create (conditional insert) / availability join
+    Index("ix_reservations_spot_period", "spot_id", "start_date", "end_date"),
+    # get_by_user
+    Index("ix_reservations_user", "user_id"),
+    # no-shows of the parking view
+    Index("ix_reservations_checkin_start", "checked_in", "start_date"),
+    # release_unchecked: unchecked, not released yet, still running at the cutoff
+    Index("ix_reservations_unreleased", "checked_in", "released_at", "end_date"),
+    # list_by_date_range / interval index warm-up ("still running after X" is the selective side)
+    Index("ix_reservations_end_start", "end_date", "start_date"),
+    # occurrences of a series that have a row of their own
+    Index("ix_reservations_series", "series_id", "start_date"),
+)
+
+# --- RESERVATION SERIES (recurring bookings, occurrences expanded when read) ---
+reservation_series_table = Table(
+    "reservation_series",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("spot_id", String(3), ForeignKey("spots.id", ondelete="CASCADE"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("weekdays", Integer, nullable=False),   # bit 0 = Monday ... bit 6 = Sunday
+    Column("start_time", Time, nullable=False),
+    Column("end_time", Time, nullable=False),
+    Column("first_day", Date, nullable=False),
+    Column("last_day", Date, nullable=False),
+    Column("created_at", DateTime, server_default=func.now(), nullable=False),
+    # overlap checks: series of a spot still running after X
+    Index("ix_reservation_series_spot_days", "spot_id", "last_day", "first_day"),
+    Index("ix_reservation_series_user", "user_id"),
+)
+
+
+# --- SPOT/DAY LOCKS (bookings of the same spot and day serialize on their row) ---
+spot_day_locks_table = Table(
+    "spot_day_locks",
+    metadata,
+    Column("spot_id", String(3), ForeignKey("spots.id", ondelete="CASCADE"), primary_key=True),
+    Column("day", Date, primary_key=True),
+)
+
+
+# --- OUTBOX (domain events, written in the transaction of the change they describe) ---
+outbox_table = Table(
+    "outbox",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),  # relay batches (insert order, not commit order)
+    Column("event_type", String(64), nullable=False),               # ex: "ReservationCreated"
+    Column("payload", Text, nullable=False),                        # JSON message body
+    Column("created_at", DateTime, server_default=func.now(), nullable=False),
+    Column("sent_at", DateTime, nullable=True),                     # set once the broker confirmed it
+    # relay: oldest unsent first / prune: sent before X
+    Index("ix_outbox_sent_id", "sent_at", "id"),
+)
+
+
+# --- LEASES (leader election of the background jobs) ---
+leases_table = Table(
+    "leases",
+    metadata,
+    Column("name", String(64), primary_key=True),          # ex: "background-jobs"
+    Column("holder", String(128), nullable=False),         # host:pid:token of the owner
+    Column("expires_at", DateTime, nullable=False),
+    Column("acquired_at", DateTime, nullable=False),
 )
 
 
@@ -77,12 +149,69 @@ def get_database_url() -> str:
     # Exemple tests: sqlite+aiosqlite:///:memory:
     return os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./dev.db")
 
-def make_engine():
-    return create_async_engine(get_database_url(), pool_pre_ping=True)
+def make_engine(url=None, pool=None):
+    # pool sizing / timeouts from DB_POOL_* (see utils/db_pool.py)
+    url = url or get_database_url()
+    engine = create_async_engine(url, **pool_options(url, pool or PoolSettings.from_env()))
+    # per-request statement counts and DB time (Server-Timing, /metrics, query budgets)
+    track_queries(engine)
+    return engine
+
+def make_session_factory(engine, replica=None, sticky_s=5.0):
+    # Session() on `engine`; read-only operations on `replica` if given (see utils/read_replica.py)
+    primary = async_sessionmaker(engine, expire_on_commit=False)
+    reads = async_sessionmaker(replica, expire_on_commit=False, info={"replica": True}) if replica is not None else None
+    return SessionRouter(primary, reads, sticky_s=sticky_s)
 
-def make_session_factory(engine):
-    return async_sessionmaker(engine, expire_on_commit=False)
+def _add_missing_columns(sync_conn):
+    """create_all() does not alter existing tables: add the (nullable) columns declared since."""
+    insp = inspect(sync_conn)
+    preparer = sync_conn.dialect.identifier_preparer
+    for table in metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} automatically")
+            logger.info(f"Adding missing column {column.name} to {table.name}")
+            try:
+                sync_conn.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(sync_conn.dialect)} NULL"
+                )
+            except DBAPIError as e:
+                # Tolerated only when another worker added it first (a fresh inspector: no cache)
+                if column.name not in {c["name"] for c in inspect(sync_conn).get_columns(table.name)}:
+                    raise
+                logger.warning(f"Column {table.name}.{column.name} not added: {e.orig}")
+
+def _create_missing_indexes(sync_conn):
+    """create_all() skips existing tables, and their new indexes with them: add those here."""
+    insp = inspect(sync_conn)
+    for table in metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            logger.info(f"Creating missing index {index.name} on {table.name}")
+            try:
+                # MySQL (InnoDB) builds secondary indexes online: reads/writes are not blocked
+                index.create(sync_conn)
+            except DBAPIError as e:
+                # Tolerated only when another worker created it first (a fresh inspector: no cache)
+                if index.name not in {ix["name"] for ix in inspect(sync_conn).get_indexes(table.name)}:
+                    raise
+                logger.warning(f"Index {index.name} not created: {e.orig}")
 
 async def init_db(engine):
     async with engine.begin() as conn:
         await conn.run_sync(metadata.create_all)
+    async with engine.begin() as conn:
+        await conn.run_sync(_add_missing_columns)
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_missing_indexes)
@@ -0,0 +1,65 @@
+"""
+Archive export of the reservation history, without going through the API.
+
+    cd backend
+    python export_reservations.py --format csv --from 2024-01-01 --to 2025-01-01 --gzip -o reservations-2024.csv.gz
+
+Same rows as GET /reservations/export, read from DATABASE_URL in server-side
+batches. Writes to stdout when -o is omitted.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from datetime import datetime
+
+from db import make_engine, make_session_factory
+from repositories.reservation_repository import ReservationRepository
+from services.reservation_export import FORMATS, export_chunks, gzip_chunks
+
+
+async def export(out, *, fmt: str, start_date=None, end_date=None, compress: bool = False, batch_size: int = 1000) -> int:
+    engine = make_engine()
+    Session = make_session_factory(engine)
+    written = 0
+    try:
+        async with Session() as session:
+            rows = ReservationRepository(session).iter_export(
+                start_date=start_date, end_date=end_date, batch_size=batch_size
+            )
+            chunks = export_chunks(rows, fmt)
+            if compress:
+                chunks = gzip_chunks(chunks)
+            async for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+    finally:
+        await engine.dispose()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--from", dest="start_date", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--to", dest="end_date", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("-o", "--output", default=None, help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        written = asyncio.run(export(
+            out, fmt=args.format, start_date=args.start_date, end_date=args.end_date,
+            compress=args.gzip, batch_size=args.batch_size,
+        ))
+    finally:
+        if args.output:
+            out.close()
+    print(f"[*] {written} bytes written", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
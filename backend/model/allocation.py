@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional, Protocol
+
+if TYPE_CHECKING:
+    from sqlalchemy import Table
+
+
+@dataclass(slots=True)
+class AllocationRequest:
+    """What POST /reservations/auto asks for: any spot matching these, free on the period."""
+    start_date: datetime
+    end_date: datetime
+    electrical: bool = False
+    preferred_row: Optional[str] = None     # "A".."F"
+    associated_spot: Optional[str] = None   # users.spot_associe
+
+
+class ScoringStrategy(Protocol):
+    """Ranks the free spots: `order_by` returns the ORDER BY clauses (best first) of the
+    INSERT ... SELECT that books the first one, so the pick happens inside the DB.
+    Implementations: services/spot_allocator.py."""
+
+    name: str
+
+    def order_by(self, spots: Table, request: AllocationRequest) -> List: ...
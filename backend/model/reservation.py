@@ -13,8 +13,11 @@ class Reservation:
     start_date: datetime
     end_date: datetime
     checked_in: bool = False
+    released_at: Optional[datetime] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    # occurrence of a ReservationSeries (id is None while it is not materialized)
+    series_id: Optional[int] = None
 
     def __post_init__(self) -> None:
         if self.start_date > self.end_date:
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Collection, Iterator, Optional, Tuple
+
+# RRULE BYDAY codes, in datetime.weekday() order (bit i of the mask = day i)
+WEEKDAY_CODES = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def parse_rrule(rule: str) -> Tuple[int, date]:
+    """(weekday mask, last day) of "FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20300630".
+
+    Only the weekly frequency is supported, and UNTIL is required: a series is
+    always bounded. UNTIL may be a date (YYYYMMDD) or a date-time (YYYYMMDDTHHMMSS).
+    """
+    parts = {}
+    for part in rule.strip().upper().split(";"):
+        key, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Invalid RRULE part: {part!r}")
+        parts[key] = value
+
+    if parts.pop("FREQ", None) != "WEEKLY":
+        raise ValueError("Only FREQ=WEEKLY is supported")
+    if "BYDAY" not in parts or "UNTIL" not in parts:
+        raise ValueError("BYDAY and UNTIL are required")
+    mask = 0
+    for code in parts.pop("BYDAY").split(","):
+        if code not in WEEKDAY_CODES:
+            raise ValueError(f"Invalid BYDAY value: {code!r}")
+        mask |= 1 << WEEKDAY_CODES.index(code)
+    until = parts.pop("UNTIL")
+    try:
+        last_day = datetime.strptime(until[:8], "%Y%m%d").date()
+    except ValueError:
+        raise ValueError(f"Invalid UNTIL value: {until!r}")
+    if parts:
+        raise ValueError(f"Unsupported RRULE parts: {', '.join(sorted(parts))}")
+    return mask, last_day
+
+
+def has_weekday(first_day: date, last_day: date, mask: int) -> bool:
+    """Whether [first_day, last_day] contains a day of `mask`, in constant time."""
+    if last_day < first_day or not mask:
+        return False
+    span = (last_day - first_day).days
+    if span >= 6:  # every weekday is in there
+        return True
+    wd = first_day.weekday()
+    return any(mask >> ((wd + k) % 7) & 1 for k in range(span + 1))
+
+
+@dataclass(slots=True)
+class ReservationSeries:
+    """
+    Recurring reservation: the same spot, from start_time to end_time, on every
+    weekday of `weekdays` (bit 0 = Monday) between first_day and last_day.
+
+    Stored as one row; occurrences are computed when read, never stored, except
+    the ones that got a state of their own (checked in, released), which are
+    materialized as reservations carrying the series_id.
+    """
+    id: Optional[int]
+    spot_id: str
+    user_id: int
+    weekdays: int
+    start_time: time
+    end_time: time
+    first_day: date
+    last_day: date
+    created_at: Optional[datetime] = None
+
+    def __post_init__(self) -> None:
+        if not 0 < self.weekdays < 1 << 7:
+            raise ValueError("weekdays must select at least one day")
+        if self.start_time >= self.end_time:
+            raise ValueError("start_time must be before end_time")
+        if self.first_day > self.last_day:
+            raise ValueError("first_day cannot be after last_day")
+
+    @property
+    def rrule(self) -> str:
+        days = ",".join(code for i, code in enumerate(WEEKDAY_CODES) if self.weekdays >> i & 1)
+        return f"FREQ=WEEKLY;BYDAY={days};UNTIL={self.last_day:%Y%m%d}"
+
+    def _days_touching(self, start: datetime, end: datetime) -> Tuple[date, date]:
+        # The occurrence of day d overlaps [start, end) iff d + start_time < end and
+        # d + end_time > start: a contiguous range of days, clipped to the series.
+        lo = start.date() if self.end_time > start.time() else start.date() + timedelta(days=1)
+        hi = end.date() if self.start_time < end.time() else end.date() - timedelta(days=1)
+        return max(lo, self.first_day), min(hi, self.last_day)
+
+    def overlaps(self, start: datetime, end: datetime, *, skip: Collection[date] = ()) -> bool:
+        """Whether an occurrence overlaps [start, end), ignoring the days in `skip`.
+
+        Constant time without `skip`; otherwise walks the days of [start, end) only.
+        """
+        lo, hi = self._days_touching(start, end)
+        if not skip:
+            return has_weekday(lo, hi, self.weekdays)
+        return any(
+            self.weekdays >> d.weekday() & 1 and d not in skip
+            for d in (lo + timedelta(days=k) for k in range((hi - lo).days + 1))
+        )
+
+    def occurrences(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Iterator[Tuple[datetime, datetime]]:
+        """(start, end) of the occurrences overlapping [start, end) (default: all), in order."""
+        lo, hi = self._days_touching(
+            start or datetime.combine(self.first_day, time.min),
+            end or datetime.combine(self.last_day, time.max),
+        )
+        day = lo
+        while day <= hi:
+            if self.weekdays >> day.weekday() & 1:
+                yield datetime.combine(day, self.start_time), datetime.combine(day, self.end_time)
+            day += timedelta(days=1)
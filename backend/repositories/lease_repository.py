@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import case, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import leases_table
+
+
+class LeaseRepository:
+    """Named, time-bounded ownership rows: at most one live holder per name."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def try_acquire(self, name: str, holder: str, ttl_s: float, now: datetime) -> bool:
+        """Take or renew the lease; True when `holder` owns it until now + ttl_s."""
+        expires_at = now + timedelta(seconds=ttl_s)
+        l = leases_table
+        # renew our own lease, or take over an expired one: a single conditional UPDATE
+        res = await self.session.execute(
+            update(l)
+            .where(l.c.name == name, or_(l.c.holder == holder, l.c.expires_at < now))
+            .values(
+                holder=holder,
+                expires_at=expires_at,
+                acquired_at=case((l.c.holder == holder, l.c.acquired_at), else_=now),
+            )
+        )
+        await self.session.commit()
+        if res.rowcount == 1:
+            return True
+        if (await self.get(name)) is not None:
+            return False  # held by someone else
+
+        # first acquisition ever: the primary key arbitrates between concurrent inserts
+        try:
+            await self.session.execute(
+                insert(l).values(name=name, holder=holder, expires_at=expires_at, acquired_at=now)
+            )
+            await self.session.commit()
+            return True
+        except IntegrityError:
+            await self.session.rollback()
+            return False
+
+    async def release(self, name: str, holder: str) -> bool:
+        l = leases_table
+        res = await self.session.execute(delete(l).where(l.c.name == name, l.c.holder == holder))
+        await self.session.commit()
+        return res.rowcount > 0
+
+    async def get(self, name: str) -> Optional[dict]:
+        row = (
+            await self.session.execute(select(leases_table).where(leases_table.c.name == name))
+        ).mappings().one_or_none()
+        return dict(row) if row else None
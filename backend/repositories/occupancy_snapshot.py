@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+
+class OccupancySnapshot:
+    """Per-worker in-memory state behind /parking/view.
+
+    Seeded (and periodically reconciled) by `ParkingRepository.reload_snapshot`,
+    then kept current by the spot / reservation / config writes of this worker.
+    Writes made by other workers only show up at the next reconciliation, so
+    readers fall back to a reload when the snapshot is older than `max_age_s`.
+    """
+
+    def __init__(self, max_age_s: float = 60.0, clock=time.monotonic):
+        self.max_age_s = max_age_s
+        self._clock = clock
+        self.slots_max = 60
+        # spot_id -> (is_free, electrical)
+        self._spots: dict[str, tuple[bool, bool]] = {}
+        self._occupied = 0
+        self._electric = 0
+        # unchecked reservations touching `day`: id -> (start_date, end_date)
+        self._unchecked: dict[int, tuple[datetime, datetime]] = {}
+        self.day: Optional[date] = None
+        self.refreshed_at: Optional[float] = None
+
+    # --- reconciliation ---
+    def reset(self, *, slots_max: int, spots: Iterable, unchecked: Iterable, day: date) -> None:
+        self.slots_max = slots_max
+        self._spots.clear()
+        self._occupied = self._electric = 0
+        for s in spots:
+            self.put_spot(s["id"], is_free=s["is_free"], electrical=s["electrical"])
+        self.day = day
+        self._unchecked = {r["id"]: (r["start_date"], r["end_date"]) for r in unchecked}
+        self.refreshed_at = self._clock()
+
+    def age(self) -> Optional[float]:
+        return None if self.refreshed_at is None else self._clock() - self.refreshed_at
+
+    def is_fresh(self, today: date) -> bool:
+        age = self.age()
+        return age is not None and age <= self.max_age_s and self.day == today
+
+    # --- write-through updates ---
+    def put_spot(self, spot_id: str, *, is_free: bool, electrical: bool) -> None:
+        self.remove_spot(spot_id)
+        self._spots[spot_id] = (bool(is_free), bool(electrical))
+        self._occupied += not is_free
+        self._electric += bool(electrical)
+
+    def remove_spot(self, spot_id: str) -> None:
+        old = self._spots.pop(spot_id, None)
+        if old is not None:
+            self._occupied -= not old[0]
+            self._electric -= old[1]
+
+    def put_reservation(self, rid: int, start_date: datetime, end_date: datetime, *, checked_in: bool = False) -> None:
+        self._unchecked.pop(rid, None)
+        if checked_in or self.day is None:
+            return
+        day_start = datetime.combine(self.day, datetime.min.time())
+        if start_date < day_start + timedelta(days=1) and end_date >= day_start:
+            self._unchecked[rid] = (start_date, end_date)
+
+    def remove_reservation(self, rid: int) -> None:
+        self._unchecked.pop(rid, None)
+
+    def release_unchecked(self, before_time: datetime, ids: Optional[Iterable[int]] = None) -> None:
+        # mirror of ReservationRepository.release_unchecked (end_date = before_time)
+        selected = None if ids is None else set(ids)
+        for rid, (start, end) in list(self._unchecked.items()):
+            if (selected is None or rid in selected) and start < before_time < end:
+                self._unchecked[rid] = (start, before_time)
+
+    # --- read ---
+    def view(self, now: datetime) -> dict:
+        """Same payload as ParkingRepository.get_parking_view, computed from memory."""
+        total = len(self._spots)
+        slots_max = self.slots_max or 60
+        day_start = now.replace(hour=0, minute=0, second=0)
+        no_shows = sum(1 for start, end in self._unchecked.values() if start <= now and end >= day_start)
+        return {
+            "slots": total,
+            "slots_max": slots_max,
+            "occupied": self._occupied,
+            "free": max(0, total - self._occupied),
+            "occupation_rate": (self._occupied / slots_max) if slots_max else 0.0,
+            "electric_spots": self._electric,
+            "electric_ratio": (self._electric / slots_max) if slots_max else 0.0,
+            "no_shows": no_shows,
+        }
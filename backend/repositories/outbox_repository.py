@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import outbox_table
+from utils.serialization import dumps
+
+
+class OutboxRepository:
+    """Domain events waiting for the relay (services/outbox_relay.py).
+
+    `add` never commits: the events belong to the transaction of the change
+    they describe, and are lost or kept with it.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add(self, events: Iterable[Tuple[str, dict]]) -> None:
+        """Queue (event_type, data) events; each payload is {"type": event_type, **data}."""
+        rows = [
+            {"event_type": event_type, "payload": dumps({"type": event_type, **data}).decode()}
+            for event_type, data in events
+        ]
+        if rows:
+            await self.session.execute(insert(outbox_table), rows)
+
+    async def next_batch(self, limit: int) -> List[dict]:
+        """Unsent events by id: [{"id", "event_type", "payload"}, ...].
+
+        Ids follow the inserts, not the commits: an event committed late can
+        come after higher ids that were already relayed.
+        """
+        o = outbox_table
+        stmt = (
+            select(o.c.id, o.c.event_type, o.c.payload)
+            .where(o.c.sent_at.is_(None))
+            .order_by(o.c.id)
+            .limit(limit)
+        )
+        return [dict(r) for r in (await self.session.execute(stmt)).mappings().all()]
+
+    async def after(self, after_id: int, limit: int, *, also: Iterable[int] = ()) -> List[dict]:
+        """Events with an id above `after_id`, plus those of `also`, sent or not, by id.
+
+        For readers tailing the table (services/feed_tail.py): `also` re-reads ids
+        skipped earlier, whose transaction may commit after higher ids.
+        """
+        o = outbox_table
+        cond = o.c.id > after_id
+        also = list(also)
+        if also:
+            cond = or_(cond, o.c.id.in_(also))
+        stmt = select(o.c.id, o.c.event_type, o.c.payload).where(cond).order_by(o.c.id).limit(limit)
+        return [dict(r) for r in (await self.session.execute(stmt)).mappings().all()]
+
+    async def last_id(self) -> int:
+        return (await self.session.execute(select(func.max(outbox_table.c.id)))).scalar() or 0
+
+    async def mark_sent(self, ids: List[int], at: datetime) -> None:
+        await self.session.execute(update(outbox_table).where(outbox_table.c.id.in_(ids)).values(sent_at=at))
+        await self.session.commit()
+
+    async def prune(
+        self, sent_before: datetime, *, unsent_before: Optional[datetime] = None, batch_size: int = 5000
+    ) -> int:
+        """Delete the events sent before `sent_before`, `batch_size` rows per transaction.
+
+        With `unsent_before` (no relay will ever send them), the unsent events
+        created before it go as well.
+        """
+        o = outbox_table
+        cond = o.c.sent_at < sent_before
+        if unsent_before is not None:
+            cond = or_(cond, and_(o.c.sent_at.is_(None), o.c.created_at < unsent_before))
+        pruned = 0
+        while True:
+            ids = (
+                await self.session.execute(select(o.c.id).where(cond).limit(batch_size))
+            ).scalars().all()
+            if not ids:
+                return pruned
+            await self.session.execute(delete(o).where(o.c.id.in_(ids)))
+            await self.session.commit()
+            pruned += len(ids)
+            if len(ids) < batch_size:
+                return pruned
+
+    async def pending(self) -> int:
+        stmt = select(func.count()).select_from(outbox_table).where(outbox_table.c.sent_at.is_(None))
+        return (await self.session.execute(stmt)).scalar_one()
@@ -1,52 +1,105 @@
 from __future__ import annotations
 
+from datetime import datetime, timedelta
+from typing import Optional
+
 from sqlalchemy import delete, insert, select, update, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import parking_config_table, spots_table
+from db import parking_config_table, reservations_table, spots_table
+from repositories.occupancy_snapshot import OccupancySnapshot
+from repositories.returning import insert_returning, update_returning
+from utils.read_replica import on_replica
 
 
 class ParkingRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, snapshot: Optional[OccupancySnapshot] = None):
         self.session = session
+        # Optional per-worker occupancy snapshot (see app.ctx.occupancy_snapshot)
+        self.snapshot = snapshot
+        # age (s) of the snapshot the last get_parking_view answered from; None: counted in the DB
+        self.view_age: Optional[float] = None
+
+    def _remember_slots_max(self, cfg: Optional[dict]) -> Optional[dict]:
+        if self.snapshot is not None and cfg:
+            self.snapshot.slots_max = cfg["slots_max"]
+        return cfg
 
     # --- CRUD config ---
     async def create_or_reset_config(self, slots_max: int = 60) -> dict:
         # On force une seule ligne id=1
         await self.session.execute(delete(parking_config_table).where(parking_config_table.c.id == 1))
-        await self.session.execute(insert(parking_config_table).values(id=1, slots_max=slots_max))
+        row = await insert_returning(
+            self.session, parking_config_table, insert(parking_config_table).values(id=1, slots_max=slots_max)
+        )
         await self.session.commit()
-        return await self.get_config()
+        return self._remember_slots_max(row)
 
     async def get_config(self) -> dict:
         row = (
             await self.session.execute(select(parking_config_table).where(parking_config_table.c.id == 1))
         ).mappings().one_or_none()
 
+        if not row and on_replica(self.session):
+            return {"id": 1, "slots_max": 60}  # the primary creates it on its next read
         if not row:
             # auto-create default
-            await self.session.execute(insert(parking_config_table).values(id=1, slots_max=60))
+            row = await insert_returning(
+                self.session, parking_config_table, insert(parking_config_table).values(id=1, slots_max=60)
+            )
             await self.session.commit()
-            row = (
-                await self.session.execute(select(parking_config_table).where(parking_config_table.c.id == 1))
-            ).mappings().one()
 
         return dict(row)
 
     async def update_config(self, *, slots_max: int) -> dict:
-        await self.session.execute(
-            update(parking_config_table).where(parking_config_table.c.id == 1).values(slots_max=slots_max)
+        row = await update_returning(
+            self.session, parking_config_table, parking_config_table.c.id == 1, {"slots_max": slots_max}
         )
         await self.session.commit()
-        return await self.get_config()
+        # no config row yet: fall back to the auto-created default
+        return self._remember_slots_max(row) if row else await self.get_config()
 
     async def delete_config(self) -> bool:
         res = await self.session.execute(delete(parking_config_table).where(parking_config_table.c.id == 1))
         await self.session.commit()
+        if self.snapshot is not None:
+            self.snapshot.slots_max = 60  # get_config() recreates the default
         return res.rowcount > 0
 
     # --- Parking view / stats ---
+    async def reload_snapshot(self) -> None:
+        """Seed / reconcile the occupancy snapshot from the DB."""
+        cfg = await self.get_config()
+        spots = (
+            await self.session.execute(select(spots_table.c.id, spots_table.c.is_free, spots_table.c.electrical))
+        ).mappings().all()
+
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        unchecked = (
+            await self.session.execute(
+                select(reservations_table.c.id, reservations_table.c.start_date, reservations_table.c.end_date).where(
+                    reservations_table.c.checked_in.is_(False),
+                    reservations_table.c.start_date < today + timedelta(days=1),
+                    reservations_table.c.end_date >= today,
+                )
+            )
+        ).mappings().all()
+
+        self.snapshot.reset(slots_max=cfg["slots_max"], spots=spots, unchecked=unchecked, day=today.date())
+
     async def get_parking_view(self) -> dict:
+        self.view_age = None
+        if self.snapshot is not None:
+            now = datetime.now()
+            if self.snapshot.is_fresh(now.date()):
+                self.view_age = self.snapshot.age()
+                return self.snapshot.view(now)
+            # a replica read does not reseed the per-worker snapshot (it may lag): counted below instead
+            if not on_replica(self.session):
+                await self.reload_snapshot()
+                self.view_age = self.snapshot.age()
+                return self.snapshot.view(now)
+
         cfg = await self.get_config()
 
         total = (await self.session.execute(select(func.count()).select_from(spots_table))).scalar_one()
@@ -63,9 +116,6 @@ class ParkingRepository:
         ).scalar_one()
 
         # Get No-shows (reserved but not checked in today before 11AM)
-        # Using a raw query or joining with reservations
-        from db import reservations_table
-        from datetime import datetime
         now = datetime.now()
         
         # Reservations for today that are not checked in
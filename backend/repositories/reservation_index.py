@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Iterable, Optional
+
+
+class _SpotIntervals:
+    """Reservations of one spot, sorted by start, with a prefix max of the end dates.
+
+    Intervals of a spot can overlap each other (a release rewrites end_date),
+    so a plain sorted list is not enough: `max_end[i]` is the latest end among
+    the first i+1 intervals, which answers an overlap query with one bisect.
+    """
+
+    __slots__ = ("starts", "entries", "max_end")
+
+    def __init__(self):
+        self.starts: list[datetime] = []
+        self.entries: list[tuple[datetime, datetime, int]] = []
+        self.max_end: list[datetime] = []
+
+    def _refresh_from(self, pos: int) -> None:
+        del self.max_end[pos:]
+        current = self.max_end[pos - 1] if pos > 0 else None
+        for _start, end, _rid in self.entries[pos:]:
+            current = end if current is None or end > current else current
+            self.max_end.append(current)
+
+    def add(self, rid: int, start: datetime, end: datetime) -> None:
+        pos = bisect_right(self.starts, start)
+        self.starts.insert(pos, start)
+        self.entries.insert(pos, (start, end, rid))
+        self._refresh_from(pos)
+
+    def remove(self, rid: int, start: datetime) -> None:
+        pos = bisect_left(self.starts, start)
+        while pos < len(self.entries) and self.entries[pos][0] == start:
+            if self.entries[pos][2] == rid:
+                del self.starts[pos]
+                del self.entries[pos]
+                self._refresh_from(pos)
+                return
+            pos += 1
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        # Candidates are the intervals with r.start < end; one of them overlaps iff r.end > start
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.max_end[i - 1] > start
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SpotIntervalIndex:
+    """Per-worker in-memory index of reservations, grouped by spot_id.
+
+    It only holds reservations ending after `horizon` (set at warm-up), which is
+    all that matters for new bookings. Answers are local to the worker: the
+    conditional insert of `ReservationRepository.create` stays the final judge.
+    """
+
+    def __init__(self):
+        self._by_spot: dict[str, _SpotIntervals] = {}
+        # id -> (spot_id, start, end, checked_in)
+        self._by_id: dict[int, tuple[str, datetime, datetime, bool]] = {}
+        self.horizon: Optional[datetime] = None
+        self.ready = False
+
+    # --- build ---
+    def warm(self, rows: Iterable, *, horizon: datetime) -> None:
+        self._by_spot.clear()
+        self._by_id.clear()
+        self.horizon = horizon
+        for r in rows:
+            self.add(r["id"], r["spot_id"], r["start_date"], r["end_date"], checked_in=r["checked_in"])
+        self.ready = True
+
+    def reset_spot(self, spot_id: str, rows: Iterable) -> None:
+        for rid in [rid for rid, v in self._by_id.items() if v[0] == spot_id]:
+            del self._by_id[rid]
+        self._by_spot.pop(spot_id, None)
+        for r in rows:
+            self.add(r["id"], spot_id, r["start_date"], r["end_date"], checked_in=r["checked_in"])
+
+    # --- queries ---
+    def covers(self, start_date: datetime) -> bool:
+        """True when every reservation able to overlap [start_date, ...) is in the index."""
+        return self.ready and self.horizon is not None and start_date >= self.horizon
+
+    def overlaps(self, spot_id: str, start_date: datetime, end_date: datetime) -> bool:
+        intervals = self._by_spot.get(spot_id)
+        return intervals is not None and intervals.overlaps(start_date, end_date)
+
+    def busy_spots(self, start_date: datetime, end_date: datetime) -> set[str]:
+        """Spots holding a reservation that overlaps [start_date, end_date)."""
+        return {spot_id for spot_id, intervals in self._by_spot.items() if intervals.overlaps(start_date, end_date)}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    # --- write-through updates (called by ReservationRepository) ---
+    def add(self, rid: int, spot_id: str, start_date: datetime, end_date: datetime, *, checked_in: bool = False) -> None:
+        if rid in self._by_id:
+            self.remove(rid)
+        if self.horizon is not None and end_date <= self.horizon:
+            return
+        self._by_id[rid] = (spot_id, start_date, end_date, bool(checked_in))
+        self._by_spot.setdefault(spot_id, _SpotIntervals()).add(rid, start_date, end_date)
+
+    def remove(self, rid: int) -> None:
+        entry = self._by_id.pop(rid, None)
+        if entry is None:
+            return
+        spot_id, start, _end, _checked = entry
+        intervals = self._by_spot.get(spot_id)
+        if intervals is not None:
+            intervals.remove(rid, start)
+            if not intervals:
+                del self._by_spot[spot_id]
+
+    def mark_checked_in(self, rid: int) -> None:
+        entry = self._by_id.get(rid)
+        if entry is not None:
+            self._by_id[rid] = (*entry[:3], True)
+
+    def release_unchecked(self, before_time: datetime, ids: Optional[Iterable[int]] = None) -> None:
+        """Mirror of `ReservationRepository.release_unchecked` (end_date = before_time)."""
+        candidates = self._by_id.items() if ids is None else (
+            (rid, self._by_id[rid]) for rid in ids if rid in self._by_id
+        )
+        released = [
+            (rid, v) for rid, v in candidates
+            if not v[3] and v[1] < before_time < v[2]
+        ]
+        for rid, (spot_id, start, _end, checked) in released:
+            self.add(rid, spot_id, start, before_time, checked_in=checked)
@@ -1,15 +1,48 @@
-from typing import List, Optional
-from datetime import datetime
-from sqlalchemy import select, insert, update, delete as sql_delete
+from typing import AsyncIterator, Dict, List, Optional, Set
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import and_, case, false, or_, select, insert, update, literal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from db import reservations_table, spots_table
+from db import reservation_series_table, reservations_table, spots_table, users_table
+from model.allocation import AllocationRequest, ScoringStrategy
 from model.reservation import Reservation
+from model.reservation_series import ReservationSeries
+from repositories.occupancy_snapshot import OccupancySnapshot
+from repositories.outbox_repository import OutboxRepository
+from repositories.reservation_index import SpotIntervalIndex
+from repositories.returning import delete_returning, insert_returning, update_returning
+from repositories.spot_locks import lock_spot_days, lock_spots, spot_days, uses_row_locks
+from repositories.sql_days import day_number, days_since_epoch, greatest, least, second_of_day, seconds, spans_weekday
 
 class ReservationRepository:
-    def __init__(self, session: AsyncSession):
+    # Free spots tried in turn by create_any when the spot/day rows are locked
+    ALLOCATION_CANDIDATES = 5
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        index: Optional[SpotIntervalIndex] = None,
+        snapshot: Optional[OccupancySnapshot] = None,
+    ):
         self.session = session
+        # Optional per-worker interval index (see app.ctx.reservation_index)
+        self.index = index
+        # Optional per-worker occupancy snapshot (see app.ctx.occupancy_snapshot)
+        self.snapshot = snapshot
+        # Domain events for AMQP, committed with the change they describe (see services/outbox_relay.py)
+        self.outbox = OutboxRepository(session)
+
+    @staticmethod
+    def _event_data(reservation: Reservation) -> dict:
+        return {
+            "id": reservation.id,
+            "spot_id": reservation.spot_id,
+            "user_id": reservation.user_id,
+            "start_date": reservation.start_date.isoformat(),
+            "end_date": reservation.end_date.isoformat(),
+            "checked_in": reservation.checked_in,
+        }
 
     def _row_to_entity(self, row) -> Reservation:
         return Reservation(
@@ -19,23 +52,232 @@ class ReservationRepository:
             start_date=row["start_date"],
             end_date=row["end_date"],
             checked_in=row["checked_in"],
+            released_at=row["released_at"],
             created_at=row["created_at"],
-            updated_at=row["updated_at"]
+            updated_at=row["updated_at"],
+            series_id=row["series_id"],
         )
 
-    async def create(self, spot_id: str, user_id: int, start_date: datetime, end_date: datetime) -> Reservation:
-        result = await self.session.execute(
-            insert(reservations_table).values(
-                spot_id=spot_id,
-                user_id=user_id,
-                start_date=start_date,
-                end_date=end_date,
-                checked_in=False
-            )
+    def _overlap_clause(self, spot_id: str, start_date: datetime, end_date: datetime):
+        # A reservation overlaps if (r.start < new_end) AND (r.end > new_start)
+        return (
+            (reservations_table.c.spot_id == spot_id)
+            & (reservations_table.c.start_date < end_date)
+            & (reservations_table.c.end_date > start_date)
+        )
+
+    @classmethod
+    def _series_holds(cls, spot, start_date: datetime, end_date: datetime):
+        """EXISTS: a series of `spot` (a value or a column) has an occurrence overlapping
+        [start_date, end_date), tested day by day in SQL. Occurrences with a row of
+        their own (checked in, released) are left to the overlap test of that row."""
+        s, r = reservation_series_table, reservations_table
+        days = [day for _spot, day in spot_days("", start_date, end_date)]
+        per_day = []
+        for day in days:
+            conditions = cls._series_day_conditions(day)
+            if day == start_date.date():
+                conditions.append(s.c.end_time > start_date.time())
+            if day == end_date.date():
+                conditions.append(s.c.start_time < end_date.time())
+            day_start = datetime.combine(day, time.min)
+            materialized = select(r.c.id).where(
+                r.c.series_id == s.c.id, r.c.start_date >= day_start, r.c.start_date < day_start + timedelta(days=1)
+            ).exists()
+            per_day.append(and_(*conditions, ~materialized))
+        return select(s.c.id).where(s.c.spot_id == spot, or_(false(), *per_day)).exists()
+
+    async def _insert_if_free(self, spot_id: str, user_id: int, start_date: datetime, end_date: datetime) -> Optional[dict]:
+        # Conditional insert: the row is only written if no overlapping reservation or series
+        # occurrence exists, so the DB confirms the booking in the same statement.
+        # Returns None on conflict.
+        free = ~select(reservations_table.c.id).where(
+            self._overlap_clause(spot_id, start_date, end_date)
+        ).exists() & ~self._series_holds(spot_id, start_date, end_date)
+        return await insert_returning(
+            self.session,
+            reservations_table,
+            insert(reservations_table).from_select(
+                ["spot_id", "user_id", "start_date", "end_date", "checked_in"],
+                select(
+                    literal(spot_id), literal(user_id), literal(start_date), literal(end_date), literal(False)
+                ).where(free),
+            ),
+        )
+
+    async def _emit(self, event_type: str, rows, emails: Optional[Dict[int, str]] = None) -> None:
+        # outbox events of reservation rows, in the current transaction; `emails`
+        # (user_id -> email, known to the caller) adds the user_email of the contract
+        events = []
+        for row in rows:
+            data = self._event_data(self._row_to_entity(row))
+            if emails is not None:
+                data["user_email"] = emails.get(row["user_id"])
+            events.append((event_type, data))
+        await self.outbox.add(events)
+
+    def _created(self, reservation: Reservation) -> None:
+        # write-through of a committed booking into the per-worker structures
+        if self.index is not None:
+            self.index.add(reservation.id, reservation.spot_id, reservation.start_date, reservation.end_date)
+        if self.snapshot is not None:
+            self.snapshot.put_reservation(reservation.id, reservation.start_date, reservation.end_date)
+
+    async def create(
+        self, spot_id: str, user_id: int, start_date: datetime, end_date: datetime, *, user_email: Optional[str] = None
+    ) -> Optional[Reservation]:
+        if uses_row_locks(self.session):
+            # bookings of this spot on these days wait for each other, the others do not
+            await lock_spot_days(self.session, spot_days(spot_id, start_date, end_date))
+            await lock_spots(self.session, [spot_id], shared=True)  # against a new series
+        row = await self._insert_if_free(spot_id, user_id, start_date, end_date)
+        if row is not None:
+            await self._emit("ReservationCreated", [row], {user_id: user_email})
+        await self.session.commit()
+        if row is None:
+            if self.index is not None and self.index.ready:
+                await self.refresh_index_spot(spot_id)
+            return None
+
+        reservation = self._row_to_entity(row)
+        self._created(reservation)
+        return reservation
+
+    async def create_any(
+        self, user_id: int, request: AllocationRequest, scoring: ScoringStrategy, *, user_email: Optional[str] = None
+    ) -> Optional[Reservation]:
+        """Book the best free spot matching `request`, as ranked by `scoring`; None when none is free.
+
+        One INSERT ... SELECT picks and books the spot: the DB checks the overlaps of
+        every candidate and keeps the first by score. Spots the interval index knows
+        to be busy, and spots taken by a series, are left out of the candidates.
+        """
+        start_date, end_date = request.start_date, request.end_date
+        in_series = await self._series_busy_spots(start_date, end_date)
+        from_index = self.index is not None and self.index.covers(start_date)
+        excluded = in_series | self.index.busy_spots(start_date, end_date) if from_index else in_series
+
+        row = await self._insert_best(user_id, request, scoring, excluded)
+        if row is None and from_index:
+            # the index may lag behind cancellations of other workers: ask the DB alone
+            row = await self._insert_best(user_id, request, scoring, in_series)
+        if row is not None:
+            await self._emit("ReservationCreated", [row], {user_id: user_email})
+        await self.session.commit()
+        if row is None:
+            return None
+        reservation = self._row_to_entity(row)
+        self._created(reservation)
+        return reservation
+
+    @classmethod
+    def _ranked_free_spots(cls, request: AllocationRequest, scoring: ScoringStrategy, excluded: Set[str], *columns):
+        sp, r = spots_table, reservations_table
+        busy = select(r.c.id).where(
+            r.c.spot_id == sp.c.id, r.c.start_date < request.end_date, r.c.end_date > request.start_date
+        ).exists()
+        in_series = cls._series_holds(sp.c.id, request.start_date, request.end_date)
+        stmt = select(*columns).where(~busy, ~in_series)
+        if request.electrical:
+            stmt = stmt.where(sp.c.electrical.is_(True))
+        if excluded:
+            stmt = stmt.where(sp.c.id.not_in(excluded))
+        return stmt.order_by(*scoring.order_by(sp, request))
+
+    async def _insert_best(
+        self, user_id: int, request: AllocationRequest, scoring: ScoringStrategy, excluded: Set[str]
+    ) -> Optional[dict]:
+        start_date, end_date = request.start_date, request.end_date
+        if uses_row_locks(self.session):
+            # Lock the days of the best candidate, then book it; next one if it was just taken
+            ranked = self._ranked_free_spots(request, scoring, excluded, spots_table.c.id).limit(self.ALLOCATION_CANDIDATES)
+            for spot_id in (await self.session.execute(ranked)).scalars().all():
+                await lock_spot_days(self.session, spot_days(spot_id, start_date, end_date))
+                await lock_spots(self.session, [spot_id], shared=True)
+                row = await self._insert_if_free(spot_id, user_id, start_date, end_date)
+                if row is not None:
+                    return row
+                await self.session.rollback()  # releases the locks before the next candidate
+            return None
+
+        # SQLite (single writer): pick and book in one INSERT ... SELECT
+        pick = self._ranked_free_spots(
+            request, scoring, excluded,
+            spots_table.c.id, literal(user_id), literal(start_date), literal(end_date), literal(False),
+        ).limit(1)
+        r = reservations_table
+        return await insert_returning(
+            self.session,
+            r,
+            insert(r).from_select(["spot_id", "user_id", "start_date", "end_date", "checked_in"], pick),
         )
+
+    async def create_many(
+        self, items: List[tuple], *, atomic: bool, emails: Optional[Dict[int, str]] = None
+    ) -> List[Optional[Reservation]]:
+        """Book (spot_id, user_id, start_date, end_date) tuples in one transaction.
+
+        Each row goes through the same conditional insert as `create`; the result
+        holds None for the conflicting ones. With `atomic`, a single conflict rolls
+        the whole batch back (every result is then None). `emails` (user_id -> email)
+        fills the user_email of the ReservationCreated events.
+        """
+        if uses_row_locks(self.session):
+            # every (spot, day) of the batch up front, in one ordered pass
+            await lock_spot_days(self.session, [
+                key for spot_id, _user_id, start_date, end_date in items
+                for key in spot_days(spot_id, start_date, end_date)
+            ])
+            await lock_spots(self.session, [spot_id for spot_id, *_rest in items], shared=True)
+        rows = []
+        for spot_id, user_id, start_date, end_date in items:
+            row = await self._insert_if_free(spot_id, user_id, start_date, end_date)
+            if row is None and atomic:
+                await self.session.rollback()
+                return [None] * len(items)
+            rows.append(row)
+        await self._emit("ReservationCreated", [row for row in rows if row], emails or {})
         await self.session.commit()
-        inserted_id = result.inserted_primary_key[0]
-        return await self.get(inserted_id)
+
+        created = [self._row_to_entity(row) if row else None for row in rows]
+        for reservation in created:
+            if reservation is not None:
+                self._created(reservation)
+        return created
+
+    async def conflicts(self, items: List[tuple]) -> set[int]:
+        """Positions of the (spot_id, start_date, end_date) items overlapping an existing
+        reservation, found with one query over the spots and the time span involved."""
+        if not items:
+            return set()
+        r = reservations_table
+        stmt = select(r.c.spot_id, r.c.start_date, r.c.end_date).where(
+            r.c.spot_id.in_({spot_id for spot_id, _s, _e in items}),
+            r.c.start_date < max(e for _spot, _s, e in items),
+            r.c.end_date > min(s for _spot, s, _e in items),
+        )
+        existing: dict[str, list[tuple[datetime, datetime]]] = {}
+        for row in (await self.session.execute(stmt)).all():
+            existing.setdefault(row.spot_id, []).append((row.start_date, row.end_date))
+        found = {
+            i for i, (spot_id, start_date, end_date) in enumerate(items)
+            if any(s < end_date and e > start_date for s, e in existing.get(spot_id, ()))
+        }
+
+        # Series of the same spots, tested against each item without expanding them
+        series = await self._series_in(
+            min(s for _spot, s, _e in items), max(e for _spot, _s, e in items),
+            spot_ids={spot_id for spot_id, _s, _e in items},
+        )
+        if series:
+            skip = await self._materialized_days(series)
+            for i, (spot_id, start_date, end_date) in enumerate(items):
+                if i not in found and any(
+                    x.spot_id == spot_id and x.overlaps(start_date, end_date, skip=skip.get(x.id, ()))
+                    for x in series
+                ):
+                    found.add(i)
+        return found
 
     async def get(self, p_id: int) -> Optional[Reservation]:
         stmt = select(reservations_table).where(reservations_table.c.id == p_id)
@@ -46,55 +288,527 @@ class ReservationRepository:
         return None
 
     async def get_by_user(self, user_id: int) -> List[Reservation]:
+        """The user's reservations, followed by the occurrences of their series."""
         stmt = select(reservations_table).where(reservations_table.c.user_id == user_id)
         res = await self.session.execute(stmt)
-        return [self._row_to_entity(r) for r in res.mappings().all()]
+        reservations = [self._row_to_entity(r) for r in res.mappings().all()]
+        series = await self._series_in(user_id=user_id)
+        return reservations + self._expand(series, await self._materialized_days(series))
+
+    async def find_on_spot(self, user_id: int, spot_id: str, day: date) -> Optional[Reservation]:
+        """The user's reservation of `spot_id` touching `day`: a stored one first, else an occurrence of a series."""
+        r = reservations_table
+        start = datetime.combine(day, time.min)
+        end = start + timedelta(days=1)
+        stmt = (
+            select(r)
+            .where(r.c.user_id == user_id, r.c.spot_id == spot_id, r.c.start_date < end, r.c.end_date >= start)
+            .order_by(r.c.id)
+            .limit(1)
+        )
+        row = (await self.session.execute(stmt)).mappings().first()
+        if row:
+            return self._row_to_entity(row)
+        series = [
+            x for x in await self._series_in(start, end, spot_ids={spot_id}, user_id=user_id)
+            if x.overlaps(start, end)
+        ]
+        if not series:
+            return None
+        occurrences = self._expand(series, await self._materialized_days(series, day, day), start, end)
+        return occurrences[0] if occurrences else None
 
     async def check_in(self, p_id: int) -> Optional[Reservation]:
-        stmt = update(reservations_table).where(reservations_table.c.id == p_id).values(checked_in=True)
-        await self.session.execute(stmt)
+        row = await update_returning(
+            self.session, reservations_table, reservations_table.c.id == p_id, {"checked_in": True}
+        )
+        if row:
+            await self._emit("ReservationCheckedIn", [row])
         await self.session.commit()
-        return await self.get(p_id)
+        if self.index is not None:
+            self.index.mark_checked_in(p_id)
+        if self.snapshot is not None:
+            self.snapshot.remove_reservation(p_id)
+        return self._row_to_entity(row) if row else None
 
     async def delete(self, p_id: int) -> None:
-        stmt = sql_delete(reservations_table).where(reservations_table.c.id == p_id)
-        await self.session.execute(stmt)
+        row = await delete_returning(self.session, reservations_table, reservations_table.c.id == p_id)
+        if row:
+            await self._emit("ReservationCancelled", [row])
         await self.session.commit()
+        if self.index is not None:
+            self.index.remove(p_id)
+        if self.snapshot is not None:
+            self.snapshot.remove_reservation(p_id)
 
     async def has_overlap(self, spot_id: str, start_date: datetime, end_date: datetime) -> bool:
-        # A reservation overlaps if (r.start < new_end) AND (r.end > new_start)
-        stmt = select(reservations_table).where(
-            reservations_table.c.spot_id == spot_id,
-            reservations_table.c.start_date < end_date,
-            reservations_table.c.end_date > start_date
+        if self.index is not None and self.index.covers(start_date):
+            # Answered in memory; create() still confirms with its conditional insert.
+            # A hit may be a reservation cancelled or released by another worker:
+            # reload the spot before reporting it busy
+            busy = self.index.overlaps(spot_id, start_date, end_date)
+            if busy:
+                await self.refresh_index_spot(spot_id)
+                busy = self.index.overlaps(spot_id, start_date, end_date)
+        else:
+            stmt = select(reservations_table.c.id).where(
+                self._overlap_clause(spot_id, start_date, end_date)
+            ).limit(1)
+            busy = (await self.session.execute(stmt)).first() is not None
+        return busy or await self._series_overlap(spot_id, start_date, end_date)
+
+    def _unreleased_clause(self, before_time: datetime):
+        # Not checked in, not released yet, started before the cutoff and still running after it.
+        # Released rows end at the cutoff, so they never match again.
+        r = reservations_table
+        return (
+            (r.c.checked_in == False)
+            & r.c.released_at.is_(None)
+            & (r.c.end_date > before_time)
+            & (r.c.start_date < before_time)
         )
-        res = await self.session.execute(stmt)
-        return res.first() is not None
-
-    async def release_unchecked(self, before_time: datetime) -> int:
-        # Release all reservations that have not checked-in and their start_date is < before_time
-        # (Assuming before_time is the "11AM" threshold for today)
-        stmt = update(reservations_table).where(
-            reservations_table.c.checked_in == False,
-            reservations_table.c.start_date < before_time
-        ).values(
-            # We effectively cancel them by adjusting end_date or deleting them?
-            # Easiest way to free the spot is to set the end_date to now so it no longer overlaps.
-            end_date=before_time
+
+    async def release_unchecked(
+        self, before_time: datetime, *, ids: Optional[List[int]] = None, batch_size: int = 500
+    ) -> int:
+        """Free the spots of the reservations not checked in by `before_time` (end_date = before_time).
+
+        Only touches reservations still running at the cutoff and not released yet
+        (restricted to `ids` when given), `batch_size` rows per transaction.
+        Returns the number of rows released.
+        """
+        r = reservations_table
+        released = 0
+        if ids is not None:
+            # targeted release (deadline scheduler): the ids are the batch
+            for i in range(0, len(ids), batch_size):
+                released += await self._release_batch(ids[i:i + batch_size], before_time)
+        else:
+            while True:
+                batch = (
+                    await self.session.execute(
+                        select(r.c.id).where(self._unreleased_clause(before_time)).limit(batch_size)
+                    )
+                ).scalars().all()
+                if not batch:
+                    break
+                released += await self._release_batch(batch, before_time)
+                if len(batch) < batch_size:
+                    break
+
+        if self.index is not None:
+            self.index.release_unchecked(before_time, ids)
+        if self.snapshot is not None:
+            self.snapshot.release_unchecked(before_time, ids)
+        return released
+
+    async def _release_batch(self, ids: List[int], before_time: datetime) -> int:
+        r = reservations_table
+        # whole seconds: read back equal once stored (DATETIME without fractions on MySQL)
+        stamp = datetime.now().replace(microsecond=0)
+        # the clause is repeated: a row checked in since it was picked is left alone
+        res = await self.session.execute(
+            update(r)
+            .where(r.c.id.in_(ids), self._unreleased_clause(before_time))
+            .values(end_date=before_time, released_at=stamp)
         )
-        res = await self.session.execute(stmt)
+        if res.rowcount:
+            rows = (
+                await self.session.execute(select(r).where(r.c.id.in_(ids), r.c.released_at == stamp))
+            ).mappings().all()
+            await self._emit("ReservationReleased", rows)
         await self.session.commit()
         return res.rowcount
 
+    async def pending_releases(self, now: datetime) -> List[tuple]:
+        """(id, start_date, end_date) of the reservations that may still be released after `now`."""
+        r = reservations_table
+        stmt = select(r.c.id, r.c.start_date, r.c.end_date).where(
+            r.c.checked_in == False,
+            r.c.released_at.is_(None),
+            r.c.end_date > now,
+        )
+        return [tuple(row) for row in (await self.session.execute(stmt)).all()]
+
     async def list_all(self) -> List[Reservation]:
         stmt = select(reservations_table)
         res = await self.session.execute(stmt)
         return [self._row_to_entity(r) for r in res.mappings().all()]
+
+    @staticmethod
+    def _filtered(
+        stmt,
+        *,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        spot_id: Optional[str] = None,
+    ):
+        r = reservations_table
+        if start_date is not None:
+            stmt = stmt.where(r.c.end_date > start_date)
+        if end_date is not None:
+            stmt = stmt.where(r.c.start_date < end_date)
+        if user_id is not None:
+            stmt = stmt.where(r.c.user_id == user_id)
+        if spot_id is not None:
+            stmt = stmt.where(r.c.spot_id == spot_id)
+        return stmt
+
+    async def list_page(self, *, limit: int, after_id: Optional[int] = None, **filters) -> List[Reservation]:
+        """Keyset page ordered by id: up to limit + 1 rows after `after_id` (the extra one means "more")."""
+        stmt = self._filtered(select(reservations_table), **filters)
+        if after_id is not None:
+            stmt = stmt.where(reservations_table.c.id > after_id)
+        stmt = stmt.order_by(reservations_table.c.id).limit(limit + 1)
+        res = await self.session.execute(stmt)
+        return [self._row_to_entity(r) for r in res.mappings().all()]
+
+    async def iter_all(self, *, batch_size: int = 500, **filters) -> AsyncIterator[Reservation]:
+        """All matching reservations, fetched from a server-side cursor `batch_size` rows at a time."""
+        stmt = self._filtered(select(reservations_table), **filters).order_by(reservations_table.c.id)
+        result = await self.session.stream(stmt.execution_options(yield_per=batch_size))
+        async for row in result.mappings():
+            yield self._row_to_entity(row)
     
+    async def iter_export(
+        self,
+        *,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[dict]:
+        """Reservations joined with the user email and the spot attributes, for archiving.
+
+        Read from a server-side cursor, `batch_size` rows at a time, ordered by id.
+        """
+        r = reservations_table
+        stmt = (
+            select(
+                r.c.id,
+                r.c.spot_id,
+                spots_table.c.electrical.label("spot_electrical"),
+                r.c.user_id,
+                users_table.c.email.label("user_email"),
+                r.c.start_date,
+                r.c.end_date,
+                r.c.checked_in,
+                r.c.released_at,
+                r.c.created_at,
+            )
+            .select_from(
+                r.outerjoin(users_table, users_table.c.id == r.c.user_id)
+                .outerjoin(spots_table, spots_table.c.id == r.c.spot_id)
+            )
+            .order_by(r.c.id)
+        )
+        stmt = self._filtered(stmt, start_date=start_date, end_date=end_date)
+        result = await self.session.stream(stmt.execution_options(yield_per=batch_size))
+        async for row in result.mappings():
+            yield dict(row)
+
     async def list_by_date_range(self, start_date: datetime, end_date: datetime) -> List[Reservation]:
+        """Reservations overlapping [start_date, end_date), followed by the series occurrences doing so."""
         stmt = select(reservations_table).where(
             reservations_table.c.start_date < end_date,
             reservations_table.c.end_date > start_date
         )
         res = await self.session.execute(stmt)
-        return [self._row_to_entity(r) for r in res.mappings().all()]
+        reservations = [self._row_to_entity(r) for r in res.mappings().all()]
+        series = await self._series_in(start_date, end_date)
+        materialized = await self._materialized_days(series, start_date.date(), end_date.date())
+        return reservations + self._expand(series, materialized, start_date, end_date)
+
+    # --- interval index ---
+    _index_columns = (
+        reservations_table.c.id,
+        reservations_table.c.spot_id,
+        reservations_table.c.start_date,
+        reservations_table.c.end_date,
+        reservations_table.c.checked_in,
+    )
+
+    async def warm_index(self, horizon: Optional[datetime] = None) -> int:
+        """(Re)load the interval index with every reservation ending after `horizon` (default: today 00:00)."""
+        if horizon is None:
+            horizon = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        stmt = select(*self._index_columns).where(reservations_table.c.end_date > horizon)
+        rows = (await self.session.execute(stmt)).mappings().all()
+        self.index.warm(rows, horizon=horizon)
+        return len(rows)
+
+    async def refresh_index_spot(self, spot_id: str) -> None:
+        # Another worker booked this spot behind our back: reload it from the DB
+        stmt = select(*self._index_columns).where(
+            reservations_table.c.spot_id == spot_id,
+            reservations_table.c.end_date > self.index.horizon,
+        )
+        rows = (await self.session.execute(stmt)).mappings().all()
+        self.index.reset_spot(spot_id, rows)
+
+    # --- recurring series ---
+    @staticmethod
+    def _row_to_series(row) -> ReservationSeries:
+        return ReservationSeries(
+            id=row["id"],
+            spot_id=row["spot_id"],
+            user_id=row["user_id"],
+            weekdays=row["weekdays"],
+            start_time=row["start_time"],
+            end_time=row["end_time"],
+            first_day=row["first_day"],
+            last_day=row["last_day"],
+            created_at=row["created_at"],
+        )
+
+    @staticmethod
+    def _series_event_data(series: ReservationSeries) -> dict:
+        return {
+            "id": series.id,
+            "spot_id": series.spot_id,
+            "user_id": series.user_id,
+            "rrule": series.rrule,
+            "start_time": series.start_time.isoformat(),
+            "end_time": series.end_time.isoformat(),
+            "first_day": series.first_day.isoformat(),
+        }
+
+    async def _series_in(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        *,
+        spot_ids: Optional[Set[str]] = None,
+        user_id: Optional[int] = None,
+    ) -> List[ReservationSeries]:
+        """Series whose span [first_day, last_day] meets the days of [start_date, end_date)."""
+        s = reservation_series_table
+        stmt = select(s)
+        if start_date is not None:
+            stmt = stmt.where(s.c.last_day >= start_date.date())
+        if end_date is not None:
+            stmt = stmt.where(s.c.first_day <= end_date.date())
+        if spot_ids is not None:
+            stmt = stmt.where(s.c.spot_id.in_(spot_ids))
+        if user_id is not None:
+            stmt = stmt.where(s.c.user_id == user_id)
+        res = await self.session.execute(stmt)
+        return [self._row_to_series(r) for r in res.mappings().all()]
+
+    async def _materialized_days(
+        self,
+        series: List[ReservationSeries],
+        first_day: Optional[date] = None,
+        last_day: Optional[date] = None,
+    ) -> Dict[int, Set[date]]:
+        """{series id: days} of the occurrences that have a row of their own (checked in,
+        released): the row replaces the computed occurrence on that day."""
+        if not series:
+            return {}
+        r = reservations_table
+        stmt = select(r.c.series_id, r.c.start_date).where(r.c.series_id.in_({x.id for x in series}))
+        if first_day is not None:
+            stmt = stmt.where(r.c.start_date >= datetime.combine(first_day, time.min))
+        if last_day is not None:
+            stmt = stmt.where(r.c.start_date < datetime.combine(last_day + timedelta(days=1), time.min))
+        days: Dict[int, Set[date]] = {}
+        for row in (await self.session.execute(stmt)).all():
+            days.setdefault(row.series_id, set()).add(row.start_date.date())
+        return days
+
+    @staticmethod
+    def _expand(
+        series: List[ReservationSeries],
+        materialized: Dict[int, Set[date]],
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ) -> List[Reservation]:
+        occurrences = []
+        for x in series:
+            skip = materialized.get(x.id, ())
+            for start, end in x.occurrences(start_date, end_date):
+                if start.date() not in skip:
+                    occurrences.append(
+                        Reservation(id=None, spot_id=x.spot_id, user_id=x.user_id,
+                                    start_date=start, end_date=end, series_id=x.id)
+                    )
+        return occurrences
+
+    async def _series_busy_spots(self, start_date: datetime, end_date: datetime) -> Set[str]:
+        series = [x for x in await self._series_in(start_date, end_date) if x.overlaps(start_date, end_date)]
+        if not series:
+            return set()
+        skip = await self._materialized_days(series, start_date.date(), end_date.date())
+        return {x.spot_id for x in series if x.overlaps(start_date, end_date, skip=skip.get(x.id, ()))}
+
+    @staticmethod
+    def _series_day_conditions(day: date) -> list:
+        # a stored series has an occurrence on `day` (span and weekday, compared in SQL)
+        s = reservation_series_table
+        return [s.c.first_day <= day, s.c.last_day >= day, s.c.weekdays.op("&")(1 << day.weekday()) != 0]
+
+    async def _series_overlap(self, spot_id: str, start_date: datetime, end_date: datetime) -> bool:
+        # Pattern test first (constant time), then the materialized days of the candidates only
+        series = [
+            x for x in await self._series_in(start_date, end_date, spot_ids={spot_id})
+            if x.overlaps(start_date, end_date)
+        ]
+        if not series:
+            return False
+        skip = await self._materialized_days(series, start_date.date(), end_date.date())
+        return any(x.overlaps(start_date, end_date, skip=skip.get(x.id, ())) for x in series)
+
+    @staticmethod
+    def _series_conflicts(series: ReservationSeries):
+        """(reserved, held): EXISTS of a reservation, and of another series, of the spot
+        overlapping an occurrence of `series`.
+
+        Computed by span and weekday mask (repositories/sql_days.py), like
+        ReservationSeries.overlaps: the statement stays the same size whatever the
+        number of occurrences.
+        """
+        r, s = reservations_table, reservation_series_table
+        first, last = days_since_epoch(series.first_day), days_since_epoch(series.last_day)
+        start_s, end_s = seconds(series.start_time), seconds(series.end_time)
+
+        # days of a reservation an occurrence would overlap (its first day only from
+        # before end_time, its last day only after start_time), clipped to the series
+        lo = day_number(r.c.start_date) + case((second_of_day(r.c.start_date) >= end_s, 1), else_=0)
+        hi = day_number(r.c.end_date) - case((second_of_day(r.c.end_date) <= start_s, 1), else_=0)
+        reserved = select(r.c.id).where(
+            r.c.spot_id == series.spot_id,
+            r.c.start_date < datetime.combine(series.last_day, series.end_time),
+            r.c.end_date > datetime.combine(series.first_day, series.start_time),
+            spans_weekday(greatest(lo, first), least(hi, last), series.weekdays),
+        ).exists()
+
+        # another series at an overlapping time, with a common weekday in the common span
+        held = select(s.c.id).where(
+            s.c.spot_id == series.spot_id,
+            s.c.first_day <= series.last_day,
+            s.c.last_day >= series.first_day,
+            s.c.start_time < series.end_time,
+            s.c.end_time > series.start_time,
+            spans_weekday(
+                greatest(day_number(s.c.first_day), first), least(day_number(s.c.last_day), last),
+                series.weekdays, s.c.weekdays,
+            ),
+        ).exists()
+        return reserved, held
+
+    async def create_series(self, series: ReservationSeries) -> Optional[ReservationSeries]:
+        """Store `series` if none of its occurrences overlaps a reservation or another
+        series of the spot; None on conflict.
+
+        Like `create`, one conditional INSERT ... SELECT checks and stores, so a
+        concurrent booking or series of the spot cannot slip in between. On
+        row-locking servers the spot is locked exclusively first: bookings hold it
+        shared (see repositories/spot_locks.py), one lock whatever the span.
+        """
+        if uses_row_locks(self.session):
+            await lock_spots(self.session, [series.spot_id])
+
+        s = reservation_series_table
+        reserved, held = self._series_conflicts(series)
+        row = await insert_returning(
+            self.session,
+            s,
+            insert(s).from_select(
+                ["spot_id", "user_id", "weekdays", "start_time", "end_time", "first_day", "last_day"],
+                select(
+                    literal(series.spot_id), literal(series.user_id), literal(series.weekdays),
+                    literal(series.start_time), literal(series.end_time),
+                    literal(series.first_day), literal(series.last_day),
+                ).where(~reserved, ~held),
+            ),
+        )
+        if row is None:
+            await self.session.commit()  # releases the locks
+            return None
+        created = self._row_to_series(row)
+        await self.outbox.add([("ReservationSeriesCreated", self._series_event_data(created))])
+        await self.session.commit()
+        return created
+
+    async def get_series(self, series_id: int) -> Optional[ReservationSeries]:
+        stmt = select(reservation_series_table).where(reservation_series_table.c.id == series_id)
+        row = (await self.session.execute(stmt)).mappings().first()
+        return self._row_to_series(row) if row else None
+
+    async def delete_series(self, series_id: int) -> None:
+        """Drop the series; its materialized occurrences stay, as plain reservations."""
+        await self.session.execute(
+            update(reservations_table).where(reservations_table.c.series_id == series_id).values(series_id=None)
+        )
+        row = await delete_returning(
+            self.session, reservation_series_table, reservation_series_table.c.id == series_id
+        )
+        if row:
+            await self.outbox.add([("ReservationSeriesCancelled", self._series_event_data(self._row_to_series(row)))])
+        await self.session.commit()
+
+    async def check_in_occurrence(self, series: ReservationSeries, day: date) -> Optional[Reservation]:
+        """Materialize the occurrence of `day` as a checked-in reservation; None when
+        that occurrence already has a row (checked in or released)."""
+        r = reservations_table
+        start_date = datetime.combine(day, series.start_time)
+        end_date = datetime.combine(day, series.end_time)
+        absent = ~select(r.c.id).where(r.c.series_id == series.id, r.c.start_date == start_date).exists()
+        row = await insert_returning(
+            self.session,
+            r,
+            insert(r).from_select(
+                ["spot_id", "user_id", "start_date", "end_date", "checked_in", "series_id"],
+                select(
+                    literal(series.spot_id), literal(series.user_id), literal(start_date),
+                    literal(end_date), literal(True), literal(series.id),
+                ).where(absent),
+            ),
+        )
+        if row is not None:
+            await self._emit("ReservationCheckedIn", [row])
+        await self.session.commit()
+        if row is None:
+            return None
+        reservation = self._row_to_entity(row)
+        if self.index is not None:
+            self.index.add(
+                reservation.id, reservation.spot_id, reservation.start_date, reservation.end_date, checked_in=True
+            )
+        return reservation
+
+    async def release_series_occurrences(self, before_time: datetime) -> int:
+        """Release the occurrences of the day running at `before_time` and not checked in:
+        each one is materialized as a reservation ending at `before_time`.
+        Returns the number of occurrences released."""
+        day = before_time.date()
+        s = reservation_series_table
+        stmt = select(s).where(
+            s.c.first_day <= day,
+            s.c.last_day >= day,
+            s.c.start_time < before_time.time(),
+            s.c.end_time > before_time.time(),
+        )
+        series = [
+            self._row_to_series(row) for row in (await self.session.execute(stmt)).mappings().all()
+            if row["weekdays"] >> day.weekday() & 1
+        ]
+        done = await self._materialized_days(series, day, day)
+        rows = [
+            {
+                "spot_id": x.spot_id, "user_id": x.user_id,
+                "start_date": datetime.combine(day, x.start_time), "end_date": before_time,
+                "checked_in": False, "released_at": datetime.now(), "series_id": x.id,
+            }
+            for x in series if day not in done.get(x.id, ())
+        ]
+        if not rows:
+            return 0
+        # one insert per row: the events carry the ids of the released occurrences
+        inserted = [
+            await insert_returning(self.session, reservations_table, insert(reservations_table).values(**row))
+            for row in rows
+        ]
+        await self._emit("ReservationReleased", inserted)
+        await self.session.commit()
+        return len(rows)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import Table, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Insert
+
+
+# Single-statement writes: "INSERT/UPDATE ... RETURNING *" where the dialect
+# supports it (SQLite >= 3.35, MariaDB for INSERT), otherwise the write followed
+# by a SELECT on the primary key inside the same transaction (MySQL).
+
+def _dialect(session: AsyncSession):
+    return session.bind.dialect
+
+
+def _pk_column(table: Table):
+    (pk,) = table.primary_key.columns
+    return pk
+
+
+async def insert_returning(session: AsyncSession, table: Table, stmt: Insert) -> Optional[dict]:
+    """Execute `stmt` and return the inserted row, or None when it inserted nothing."""
+    if _dialect(session).insert_returning:
+        row = (await session.execute(stmt.returning(*table.c))).mappings().first()
+        return dict(row) if row else None
+
+    res = await session.execute(stmt)
+    if res.rowcount == 0:
+        return None
+    # INSERT ... SELECT has no inserted_primary_key: rely on the driver's lastrowid
+    pk_value = res.lastrowid if stmt.select is not None else res.inserted_primary_key[0]
+    return await _select_one(session, table, _pk_column(table) == pk_value)
+
+
+async def update_returning(session: AsyncSession, table: Table, where, values: dict) -> Optional[dict]:
+    """UPDATE the rows matching `where` (one row expected) and return it, or None if none matched."""
+    stmt = update(table).where(where).values(**values)
+    if _dialect(session).update_returning:
+        row = (await session.execute(stmt.returning(*table.c))).mappings().first()
+        return dict(row) if row else None
+
+    # rowcount is not usable here: MySQL reports 0 for a matched row left unchanged
+    await session.execute(stmt)
+    return await _select_one(session, table, where)
+
+
+async def delete_returning(session: AsyncSession, table: Table, where) -> Optional[dict]:
+    """DELETE the row matching `where` and return it, or None if there was none."""
+    stmt = delete(table).where(where)
+    if _dialect(session).delete_returning:
+        row = (await session.execute(stmt.returning(*table.c))).mappings().first()
+        return dict(row) if row else None
+
+    row = await _select_one(session, table, where)
+    if row is not None:
+        await session.execute(stmt)
+    return row
+
+
+async def _select_one(session: AsyncSession, table: Table, where) -> Optional[dict]:
+    row = (await session.execute(select(table).where(where))).mappings().first()
+    return dict(row) if row else None
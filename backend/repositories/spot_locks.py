@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import spot_day_locks_table, spots_table
+
+# Bookings of the same spot on a common day serialize on that (spot_id, day) row,
+# taken with SELECT ... FOR UPDATE before the conditional insert; bookings of
+# other spots or other days never wait for each other. Lock rows are created on
+# first use (in a transaction of their own) and then reused.
+#
+# A recurring series spans many days: rather than one row per occurrence, it
+# locks the spot row itself exclusively, and bookings take it shared after their
+# day rows, so a series and a booking of the same spot serialize too.
+
+
+def uses_row_locks(session: AsyncSession) -> bool:
+    # SQLite has a single writer: each conditional insert is already serialized
+    return session.bind.dialect.name != "sqlite"
+
+
+def spot_days(spot_id: str, start_date: datetime, end_date: datetime) -> List[Tuple[str, date]]:
+    """(spot_id, day) of every day touched by [start_date, end_date)."""
+    last = (end_date - timedelta(microseconds=1)).date() if end_date > start_date else start_date.date()
+    return [(spot_id, start_date.date() + timedelta(days=k)) for k in range((last - start_date.date()).days + 1)]
+
+
+def _insert_ignore(session: AsyncSession):
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql_insert(spot_day_locks_table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite_insert(spot_day_locks_table).on_conflict_do_nothing()
+    # MySQL / MariaDB
+    return insert(spot_day_locks_table).prefix_with("IGNORE")
+
+
+async def lock_spot_days(session: AsyncSession, keys: Iterable[Tuple[str, date]]) -> None:
+    """Lock the (spot_id, day) rows until the end of the current transaction.
+
+    Must be the first statement of the transaction: when rows are missing, the
+    transaction is committed after creating them, then the locks are taken.
+    Rows are locked in (spot_id, day) order, so two bookings never deadlock on them.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    t = spot_day_locks_table
+    stmt = (
+        select(t.c.spot_id, t.c.day)
+        .where(tuple_(t.c.spot_id, t.c.day).in_(keys))
+        .order_by(t.c.spot_id, t.c.day)
+        .with_for_update()
+    )
+    locked = {tuple(row) for row in (await session.execute(stmt)).all()}
+    if len(locked) == len(keys):
+        return
+
+    # First booking of some of these days: create their rows, then lock them all in order
+    await session.rollback()
+    await session.execute(
+        _insert_ignore(session), [{"spot_id": s, "day": d} for s, d in keys if (s, d) not in locked]
+    )
+    await session.commit()
+    await session.execute(stmt)
+
+
+async def lock_spots(session: AsyncSession, spot_ids: Iterable[str], *, shared: bool = False) -> None:
+    """Lock the spot rows until the end of the current transaction, in id order.
+
+    Shared (FOR SHARE) for bookings, exclusive for series: see the header comment.
+    """
+    spot_ids = sorted(set(spot_ids))
+    if not spot_ids:
+        return
+    stmt = (
+        select(spots_table.c.id)
+        .where(spots_table.c.id.in_(spot_ids))
+        .order_by(spots_table.c.id)
+        .with_for_update(read=shared)
+    )
+    await session.execute(stmt)
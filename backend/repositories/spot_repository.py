@@ -1,17 +1,44 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, Optional
 
 from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import spots_table
+from db import reservation_series_table, reservations_table, spots_table
+from repositories.occupancy_snapshot import OccupancySnapshot
+from repositories.outbox_repository import OutboxRepository
+from repositories.returning import insert_returning, update_returning
 
 
 class SpotRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        snapshot: Optional[OccupancySnapshot] = None,
+    ):
         self.session = session
+        # Optional per-worker occupancy snapshot (see app.ctx.occupancy_snapshot)
+        self.snapshot = snapshot
+        # Spot events, committed with the change (tailed by the change feeds, relayed to AMQP)
+        self.outbox = OutboxRepository(session)
+
+    async def _updated(self, row: Optional[dict]) -> None:
+        # outbox event of a written spot row, in the current transaction
+        if row:
+            await self.outbox.add([("SpotUpdated", {
+                "id": row["id"],
+                "is_free": row["is_free"],
+                "electrical": row["electrical"],
+                "reserved_from": row["reserved_from"].isoformat() if row["reserved_from"] else None,
+                "reserved_to": row["reserved_to"].isoformat() if row["reserved_to"] else None,
+            })])
+
+    def _remember(self, row: Optional[dict]) -> Optional[dict]:
+        if row and self.snapshot is not None:
+            self.snapshot.put_spot(row["id"], is_free=row["is_free"], electrical=row["electrical"])
+        return row
 
     async def create(
         self,
@@ -22,17 +49,20 @@ class SpotRepository:
         reserved_from: Optional[datetime] = None,
         reserved_to: Optional[datetime] = None,
     ) -> dict:
-        await self.session.execute(
+        row = await insert_returning(
+            self.session,
+            spots_table,
             insert(spots_table).values(
                 id=spot_id,
                 electrical=electrical,
                 is_free=is_free,
                 reserved_from=reserved_from,
                 reserved_to=reserved_to,
-            )
+            ),
         )
+        await self._updated(row)
         await self.session.commit()
-        return await self.get(spot_id)
+        return self._remember(row)
 
     async def get(self, spot_id: str) -> Optional[dict]:
         row = (
@@ -40,10 +70,39 @@ class SpotRepository:
         ).mappings().one_or_none()
         return dict(row) if row else None
 
+    async def get_many(self, spot_ids: Iterable[str]) -> dict[str, dict]:
+        spot_ids = set(spot_ids)
+        if not spot_ids:
+            return {}
+        rows = (
+            await self.session.execute(select(spots_table).where(spots_table.c.id.in_(spot_ids)))
+        ).mappings().all()
+        return {r["id"]: dict(r) for r in rows}
+
     async def list(self) -> list[dict]:
         rows = (await self.session.execute(select(spots_table))).mappings().all()
         return [dict(r) for r in rows]
 
+    @staticmethod
+    def _filtered(stmt, *, electrical: Optional[bool] = None):
+        if electrical is not None:
+            stmt = stmt.where(spots_table.c.electrical.is_(electrical))
+        return stmt
+
+    async def list_page(self, *, limit: int, after_id: Optional[str] = None, **filters) -> list[dict]:
+        """Keyset page ordered by id: up to limit + 1 spots after `after_id`."""
+        stmt = self._filtered(select(spots_table), **filters)
+        if after_id is not None:
+            stmt = stmt.where(spots_table.c.id > after_id)
+        rows = (await self.session.execute(stmt.order_by(spots_table.c.id).limit(limit + 1))).mappings().all()
+        return [dict(r) for r in rows]
+
+    async def iter_all(self, *, batch_size: int = 500, **filters) -> AsyncIterator[dict]:
+        stmt = self._filtered(select(spots_table), **filters).order_by(spots_table.c.id)
+        result = await self.session.stream(stmt.execution_options(yield_per=batch_size))
+        async for row in result.mappings():
+            yield dict(row)
+
     async def update_spot(
         self,
         spot_id: str,
@@ -63,17 +122,21 @@ class SpotRepository:
         if reserved_to is not None:
             values["reserved_to"] = reserved_to
 
-        if values:
-            await self.session.execute(
-                update(spots_table).where(spots_table.c.id == spot_id).values(**values)
-            )
-            await self.session.commit()
+        if not values:
+            return await self.get(spot_id)
 
-        return await self.get(spot_id)
+        row = await update_returning(self.session, spots_table, spots_table.c.id == spot_id, values)
+        await self._updated(row)
+        await self.session.commit()
+        return self._remember(row)
 
     async def delete(self, spot_id: str) -> bool:
         res = await self.session.execute(delete(spots_table).where(spots_table.c.id == spot_id))
+        if res.rowcount:
+            await self.outbox.add([("SpotDeleted", {"id": spot_id})])
         await self.session.commit()
+        if self.snapshot is not None:
+            self.snapshot.remove_spot(spot_id)
         return res.rowcount > 0
 
     # --- helpers ---
@@ -84,3 +147,44 @@ class SpotRepository:
 
         rows = (await self.session.execute(stmt)).mappings().all()
         return [dict(r) for r in rows]
+
+    async def list_with_reservations(
+        self, start: datetime, end: datetime, *, electrical_required: bool = False
+    ) -> list[dict]:
+        """Spots LEFT JOIN the reservations overlapping [start, end), in one query.
+
+        One row per (spot, reservation) pair; start_date/end_date are None for a spot
+        without any reservation in the window. series_id marks the materialized
+        occurrences of a series (see list_series_between).
+        """
+        r = reservations_table
+        stmt = (
+            select(spots_table.c.id, spots_table.c.electrical, r.c.start_date, r.c.end_date, r.c.series_id)
+            .select_from(
+                spots_table.outerjoin(
+                    r,
+                    (r.c.spot_id == spots_table.c.id) & (r.c.start_date < end) & (r.c.end_date > start),
+                )
+            )
+            .order_by(spots_table.c.id)
+        )
+        if electrical_required:
+            stmt = stmt.where(spots_table.c.electrical.is_(True))
+
+        rows = (await self.session.execute(stmt)).mappings().all()
+        return [dict(r) for r in rows]
+
+    async def list_series_between(
+        self, first_day: date, last_day: date, *, electrical_required: bool = False
+    ) -> list[dict]:
+        """Recurring series (spot_id, weekdays, first_day, last_day) running on a day of
+        [first_day, last_day]; their occurrences are not expanded here."""
+        s = reservation_series_table
+        stmt = select(s.c.id, s.c.spot_id, s.c.weekdays, s.c.first_day, s.c.last_day).where(
+            s.c.first_day <= last_day, s.c.last_day >= first_day
+        )
+        if electrical_required:
+            stmt = stmt.join(spots_table, spots_table.c.id == s.c.spot_id).where(spots_table.c.electrical.is_(True))
+
+        rows = (await self.session.execute(stmt)).mappings().all()
+        return [dict(r) for r in rows]
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from datetime import date, time
+
+from sqlalchemy import Integer, and_, case, false, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# Calendar arithmetic in SQL, so recurring series (weekday mask + day span, see
+# model/reservation_series.py) can be compared in the WHERE of a statement
+# without expanding their occurrences. Days are numbered from 1970-01-01 (a
+# Thursday), times of day in whole seconds.
+
+EPOCH = date(1970, 1, 1)
+_EPOCH_WEEKDAY = EPOCH.weekday()  # 3: Thursday
+
+
+class day_number(FunctionElement):
+    """Days since 1970-01-01 of a DATE or DATETIME expression."""
+
+    type = Integer()
+    name = "day_number"
+    inherit_cache = True
+
+
+class second_of_day(FunctionElement):
+    """Seconds since midnight of a DATETIME expression."""
+
+    type = Integer()
+    name = "second_of_day"
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _day_number(element, compiler, **kw):
+    return f"(CAST({compiler.process(element.clauses, **kw)} AS DATE) - DATE '1970-01-01')"
+
+
+@compiles(day_number, "sqlite")
+def _day_number_sqlite(element, compiler, **kw):
+    return f"(CAST(strftime('%s', {compiler.process(element.clauses, **kw)}) AS INTEGER) / 86400)"
+
+
+@compiles(day_number, "mysql")
+def _day_number_mysql(element, compiler, **kw):
+    return f"(TO_DAYS({compiler.process(element.clauses, **kw)}) - 719528)"
+
+
+@compiles(second_of_day)
+def _second_of_day(element, compiler, **kw):
+    return f"CAST(EXTRACT(EPOCH FROM CAST({compiler.process(element.clauses, **kw)} AS TIME)) AS INTEGER)"
+
+
+@compiles(second_of_day, "sqlite")
+def _second_of_day_sqlite(element, compiler, **kw):
+    return f"(CAST(strftime('%s', {compiler.process(element.clauses, **kw)}) AS INTEGER) % 86400)"
+
+
+@compiles(second_of_day, "mysql")
+def _second_of_day_mysql(element, compiler, **kw):
+    return f"TIME_TO_SEC({compiler.process(element.clauses, **kw)})"
+
+
+def days_since_epoch(day: date) -> int:
+    return (day - EPOCH).days
+
+
+def seconds(t: time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def greatest(a, b):
+    return case((a > b, a), else_=b)
+
+
+def least(a, b):
+    return case((a < b, a), else_=b)
+
+
+def spans_weekday(lo, hi, mask: int, weekdays=None):
+    """SQL twin of model.reservation_series.has_weekday: days lo..hi (day numbers)
+    contain a weekday of `mask`, also set in the `weekdays` column when given.
+
+    One term per weekday of `mask` (at most 7): the next day of weekday w on or
+    after lo is (w - weekday(lo)) mod 7 days away.
+    """
+    weekday_lo = (lo + _EPOCH_WEEKDAY) % 7
+    terms = []
+    for w in range(7):
+        if not mask >> w & 1:
+            continue
+        term = (w + 7 - weekday_lo) % 7 <= hi - lo
+        if weekdays is not None:
+            term = and_(weekdays.op("&")(1 << w) != 0, term)
+        terms.append(term)
+    return and_(hi >= lo, or_(false(), *terms))
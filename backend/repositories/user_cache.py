@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class UserCache:
+    """Bounded LRU + TTL cache of user records ({**users row, "roles": [...]}).
+
+    Keyed by id, with a secondary email -> id map. One instance per worker
+    (app.ctx.user_cache); UserRepository invalidates entries on every write,
+    the TTL bounds how long a write made by another worker can stay unseen.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_s: float = 30.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._by_id: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+        self._id_by_email: dict[str, int] = {}
+        # bumped by every invalidation: a read started before a write must not re-cache old data
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _copy(record: dict) -> dict:
+        # callers get their own roles list
+        return {**record, "roles": list(record.get("roles", []))}
+
+    def get_by_id(self, user_id: int) -> Optional[dict]:
+        entry = self._by_id.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, record = entry
+        if expires_at <= self._clock():
+            self._drop(user_id)
+            self.misses += 1
+            return None
+        self._by_id.move_to_end(user_id)
+        self.hits += 1
+        return self._copy(record)
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        user_id = self._id_by_email.get(email)
+        if user_id is None:
+            self.misses += 1
+            return None
+        return self.get_by_id(user_id)
+
+    def write_token(self) -> int:
+        return self._writes
+
+    def put(self, record: dict, token: Optional[int] = None) -> None:
+        if token is not None and token != self._writes:
+            return
+        user_id = record["id"]
+        self._drop(user_id)
+        self._by_id[user_id] = (self._clock() + self.ttl_s, self._copy(record))
+        self._id_by_email[record["email"]] = user_id
+        while len(self._by_id) > self.max_size:
+            old_id, (_exp, old) = self._by_id.popitem(last=False)
+            if self._id_by_email.get(old["email"]) == old_id:
+                del self._id_by_email[old["email"]]
+            self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        self._writes += 1
+        self._drop(user_id)
+
+    def _drop(self, user_id: int) -> None:
+        entry = self._by_id.pop(user_id, None)
+        if entry is not None and self._id_by_email.get(entry[1]["email"]) == user_id:
+            del self._id_by_email[entry[1]["email"]]
+
+    def clear(self) -> None:
+        self._by_id.clear()
+        self._id_by_email.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._by_id),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            # a hit on get_by_email/get_by_id saves the user row + roles queries
+            "db_round_trips_saved": 2 * self.hits,
+        }
@@ -1,17 +1,22 @@
 from __future__ import annotations
 
-from typing import Iterable, Optional
+from typing import AsyncIterator, Iterable, Optional
 
 from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
 from db import users_table, user_roles_table
+from repositories.returning import insert_returning, update_returning
+from repositories.user_cache import UserCache
+from utils.read_replica import on_replica
 
 
 class UserRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, cache: Optional[UserCache] = None):
         self.session = session
+        # Optional per-worker identity cache (see app.ctx.user_cache)
+        self.cache = cache
 
     # -------- utils --------
 
@@ -21,6 +26,21 @@ class UserRepository:
         )
         return res.scalar_one_or_none() is not None
 
+    def _invalidate(self, user_id: int) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(user_id)
+
+    def _remember(self, user: Optional[dict], token: Optional[int]) -> Optional[dict]:
+        # a replica row may predate a write this worker already invalidated
+        if self.cache is not None and user is not None and not on_replica(self.session):
+            self.cache.put(user, token)
+        return user
+
+    @staticmethod
+    def _normalize_roles(roles: Iterable[str]) -> list[str]:
+        roles = [r.strip().upper() for r in roles]
+        return list(dict.fromkeys(roles))  # unique & stable
+
     async def _fetch_roles(self, user_id: int) -> list[str]:
         rows = (
             await self.session.execute(
@@ -41,24 +61,35 @@ class UserRepository:
         roles: Iterable[str] = (),
         spot_associe: Optional[str] = None,
     ) -> dict:
-        res = await self.session.execute(
+        user_row = await insert_returning(
+            self.session,
+            users_table,
             insert(users_table).values(
                 email=email,
                 nom=nom,
                 prenom=prenom,
                 spot_associe=spot_associe,
-            )
+            ),
         )
-        await self.session.commit()
-        user_id = res.inserted_primary_key[0]
-
+        # user + rôles dans la même transaction : un seul commit
+        roles = self._normalize_roles(roles)
         if roles:
-            # user existe forcément -> on ignore le retour
-            await self.set_roles(user_id, roles)
+            await self.session.execute(
+                insert(user_roles_table),
+                [{"user_id": user_row["id"], "role": role} for role in roles],
+            )
+        await self.session.commit()
 
-        return await self.get_by_id(user_id)
+        return {**user_row, "roles": roles}
 
     async def get_by_id(self, user_id: int) -> Optional[dict]:
+        token = None
+        if self.cache is not None:
+            cached = self.cache.get_by_id(user_id)
+            if cached is not None:
+                return cached
+            token = self.cache.write_token()
+
         user_row = (
             await self.session.execute(
                 select(users_table).where(users_table.c.id == user_id)
@@ -69,9 +100,16 @@ class UserRepository:
             return None
 
         roles = await self._fetch_roles(user_id)
-        return {**dict(user_row), "roles": roles}
+        return self._remember({**dict(user_row), "roles": roles}, token)
 
     async def get_by_email(self, email: str) -> Optional[dict]:
+        token = None
+        if self.cache is not None:
+            cached = self.cache.get_by_email(email)
+            if cached is not None:
+                return cached
+            token = self.cache.write_token()
+
         user_row = (
             await self.session.execute(
                 select(users_table).where(users_table.c.email == email)
@@ -82,44 +120,99 @@ class UserRepository:
             return None
 
         roles = await self._fetch_roles(user_row["id"])
-        return {**dict(user_row), "roles": roles}
+        return self._remember({**dict(user_row), "roles": roles}, token)
+
+    @staticmethod
+    def _with_roles(users):
+        """users LEFT JOIN user_roles, one row per (user, role)."""
+        return select(
+            users.c.id,
+            users.c.email,
+            users.c.nom,
+            users.c.prenom,
+            users.c.spot_associe,
+            user_roles_table.c.role,
+        ).select_from(
+            users.outerjoin(
+                user_roles_table,
+                users.c.id == user_roles_table.c.user_id
+            )
+        )
+
+    @staticmethod
+    def _fold(by_id: dict[int, dict], r) -> None:
+        uid = r["id"]
+        if uid not in by_id:
+            by_id[uid] = {
+                "id": uid,
+                "email": r["email"],
+                "nom": r["nom"],
+                "prenom": r["prenom"],
+                "spot_associe": r["spot_associe"],
+                "roles": [],
+            }
+        if r["role"]:
+            by_id[uid]["roles"].append(r["role"])
 
     async def list(self) -> list[dict]:
+        rows = (await self.session.execute(self._with_roles(users_table))).mappings().all()
+
+        by_id: dict[int, dict] = {}
+        for r in rows:
+            self._fold(by_id, r)
+
+        return list(by_id.values())
+
+    async def get_many_by_email(self, emails: Iterable[str]) -> dict[str, dict]:
+        """email -> user (with roles) for the known ones, in one query."""
+        emails = set(emails)
+        if not emails:
+            return {}
         rows = (
             await self.session.execute(
-                select(
-                    users_table.c.id,
-                    users_table.c.email,
-                    users_table.c.nom,
-                    users_table.c.prenom,
-                    users_table.c.spot_associe,
-                    user_roles_table.c.role,
-                ).select_from(
-                    users_table.outerjoin(
-                        user_roles_table,
-                        users_table.c.id == user_roles_table.c.user_id
-                    )
-                )
+                self._with_roles(users_table).where(users_table.c.email.in_(emails))
             )
         ).mappings().all()
 
         by_id: dict[int, dict] = {}
         for r in rows:
-            uid = r["id"]
-            if uid not in by_id:
-                by_id[uid] = {
-                    "id": uid,
-                    "email": r["email"],
-                    "nom": r["nom"],
-                    "prenom": r["prenom"],
-                    "spot_associe": r["spot_associe"],
-                    "roles": [],
-                }
-            if r["role"]:
-                by_id[uid]["roles"].append(r["role"])
+            self._fold(by_id, r)
+        return {u["email"]: u for u in by_id.values()}
+
+    @staticmethod
+    def _filtered(stmt, *, spot_associe: Optional[str] = None):
+        if spot_associe is not None:
+            stmt = stmt.where(users_table.c.spot_associe == spot_associe)
+        return stmt
+
+    async def list_page(self, *, limit: int, after_id: Optional[int] = None, **filters) -> list[dict]:
+        """Keyset page ordered by id: up to limit + 1 users after `after_id`, with their roles."""
+        page = self._filtered(select(users_table), **filters)
+        if after_id is not None:
+            page = page.where(users_table.c.id > after_id)
+        # paginate the users first, then join their roles
+        page = page.order_by(users_table.c.id).limit(limit + 1).subquery("page")
+        rows = (
+            await self.session.execute(self._with_roles(page).order_by(page.c.id))
+        ).mappings().all()
 
+        by_id: dict[int, dict] = {}
+        for r in rows:
+            self._fold(by_id, r)
         return list(by_id.values())
 
+    async def iter_all(self, *, batch_size: int = 500, **filters) -> AsyncIterator[dict]:
+        """All matching users with their roles, from a server-side cursor ordered by id."""
+        stmt = self._filtered(self._with_roles(users_table), **filters).order_by(users_table.c.id)
+        result = await self.session.stream(stmt.execution_options(yield_per=batch_size))
+        current: dict[int, dict] = {}
+        async for r in result.mappings():
+            if r["id"] not in current and current:
+                yield current.popitem()[1]
+            self._fold(current, r)
+        if current:
+            yield current.popitem()[1]
+
     async def update_user(
         self,
         user_id: int,
@@ -139,13 +232,15 @@ class UserRepository:
         if spot_associe is not None:
             values["spot_associe"] = spot_associe
 
-        if values:
-            await self.session.execute(
-                update(users_table).where(users_table.c.id == user_id).values(**values)
-            )
-            await self.session.commit()
+        if not values:
+            return await self.get_by_id(user_id)
 
-        return await self.get_by_id(user_id)
+        user_row = await update_returning(self.session, users_table, users_table.c.id == user_id, values)
+        await self.session.commit()
+        self._invalidate(user_id)
+        if not user_row:
+            return None
+        return {**user_row, "roles": await self._fetch_roles(user_id)}
 
     async def delete(self, user_id: int) -> bool:
         await self.session.execute(
@@ -155,6 +250,7 @@ class UserRepository:
             delete(users_table).where(users_table.c.id == user_id)
         )
         await self.session.commit()
+        self._invalidate(user_id)
         return res.rowcount > 0
 
     # -------- Roles management --------
@@ -165,15 +261,15 @@ class UserRepository:
         return await self._fetch_roles(user_id)
 
     async def set_roles(self, user_id: int, roles: Iterable[str]) -> Optional[list[str]]:
-        if not await self._user_exists(user_id):
-            return None
+        roles = self._normalize_roles(roles)
 
-        roles = [r.strip().upper() for r in roles]
-        roles = list(dict.fromkeys(roles))  # unique & stable
-
-        await self.session.execute(
+        deleted = await self.session.execute(
             delete(user_roles_table).where(user_roles_table.c.user_id == user_id)
         )
+        # deleted roles prove the user exists: the lookup is only needed for a user without any
+        if deleted.rowcount == 0 and not await self._user_exists(user_id):
+            await self.session.rollback()
+            return None
 
         if roles:
             try:
@@ -183,11 +279,15 @@ class UserRepository:
                 )
             except IntegrityError:
                 await self.session.rollback()
+                self._invalidate(user_id)
                 # renvoie l'état actuel (si concurrent / problème)
                 return await self._fetch_roles(user_id)
 
         await self.session.commit()
-        return await self._fetch_roles(user_id)
+        # after the commit: a reader in between would cache the old roles again
+        self._invalidate(user_id)
+        # la table vient d'être réécrite avec exactement ces rôles
+        return roles
 
     async def add_role(self, user_id: int, role: str) -> Optional[list[str]]:
         if not await self._user_exists(user_id):
@@ -203,6 +303,7 @@ class UserRepository:
         except IntegrityError:
             # rôle déjà présent (ou autre contrainte) -> pas de 500
             await self.session.rollback()
+        self._invalidate(user_id)
 
         return await self._fetch_roles(user_id)
 
@@ -219,4 +320,5 @@ class UserRepository:
             )
         )
         await self.session.commit()
+        self._invalidate(user_id)
         return await self._fetch_roles(user_id)
@@ -1,11 +1,10 @@
 from sanic import Blueprint
-from sanic.response import json
 from sanic.exceptions import InvalidUsage
 from sqlalchemy.exc import IntegrityError
 
 from repositories.user_repository import UserRepository
 from services.user_service import UserService
-from utils.jsonable import to_jsonable
+from utils.serialization import json
 
 bp_auth = Blueprint("auth", url_prefix="/auth")
 
@@ -14,6 +13,10 @@ def _json_body(request) -> dict:
     return request.json or {}
 
 
+def _user_repo(request, session) -> UserRepository:
+    return UserRepository(session, cache=getattr(request.app.ctx, "user_cache", None))
+
+
 @bp_auth.post("/register")
 async def register(request):
     body = _json_body(request)
@@ -32,7 +35,7 @@ async def register(request):
     email = email.strip().lower()
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
 
         # 1) pré-check
@@ -67,7 +70,7 @@ async def register(request):
                 "X-User-Email": created["email"],
             },
         }
-        return json(to_jsonable(payload), status=201)
+        return json(payload, status=201)
 
 
 @bp_auth.post("/login")
@@ -81,7 +84,7 @@ async def login(request):
     email = email.strip().lower()
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
 
         user = await service.get_user_by_email(email)
@@ -96,4 +99,4 @@ async def login(request):
                 "X-User-Email": user["email"],
             },
         }
-        return json(to_jsonable(payload))
+        return json(payload)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+
+from sanic import Blueprint
+from sanic.exceptions import InvalidUsage, ServiceUnavailable
+
+from routes.security import require_auth
+from utils.serialization import dumps
+
+
+bp_events = Blueprint("events", url_prefix="/events")
+
+# Comment line sent when nothing happened, so proxies keep the connection open
+KEEPALIVE_S = 15.0
+
+
+def _sse(event: dict, epoch: str) -> str:
+    return f"id: {epoch}-{event['version']}\nevent: {event['type']}\ndata: {dumps(event['data']).decode()}\n\n"
+
+
+def _resync(feed, reason: str) -> str:
+    return _sse({"version": feed.version, "type": "resync", "data": {"reason": reason}}, feed.epoch)
+
+
+def _parse_since(request):
+    """(epoch, version) from ?since= or the Last-Event-ID sent by EventSource on reconnect.
+
+    Event ids are "<epoch>-<version>"; a bare version is read with no epoch.
+    """
+    raw = request.args.get("since") or request.headers.get("Last-Event-ID")
+    if raw is None or raw == "":
+        return None, None
+    epoch, _, version = raw.rpartition("-")
+    try:
+        return epoch or None, int(version)
+    except ValueError:
+        raise InvalidUsage("since must be an event id or an integer version")
+
+
+@bp_events.get("/stream")
+@require_auth
+async def stream(request):
+    """
+    Server-Sent Events stream of spot / reservation deltas.
+
+    Every event carries "<epoch>-<version>" as SSE id, the epoch naming the
+    worker's feed. A client reconnecting with ?since=<id> (or Last-Event-ID)
+    gets the events it missed; when they are no longer retained, when the id
+    comes from another worker or a restart, or when it reads too slowly, it
+    receives a `resync` event and must reload /spots/available and /parking/view.
+    """
+    feed = getattr(request.app.ctx, "change_feed", None)
+    if feed is None:
+        raise ServiceUnavailable("Event stream not available")
+    epoch, since = _parse_since(request)
+
+    if epoch is not None and epoch != feed.epoch:
+        # versions of another worker's feed (or of a restart) say nothing about this one
+        sub, _ = feed.subscribe()
+        resync = "epoch"
+    else:
+        sub, missed = feed.subscribe(since)
+        resync = "history" if missed else None
+    try:
+        response = await request.respond(
+            content_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        await response.send("retry: 3000\n\n")
+        if resync:
+            await response.send(_resync(feed, resync))
+
+        while True:
+            try:
+                event = await sub.get(timeout=KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                await response.send(": keepalive\n\n")
+                continue
+            if event is None:
+                break
+            await response.send(_sse(event, feed.epoch))
+
+        if sub.dropped:
+            await response.send(_resync(feed, "slow_consumer"))
+        await response.eof()
+    finally:
+        sub.close()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import base64
+import json as pyjson
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Optional
+
+from sanic.exceptions import InvalidUsage
+
+from utils.serialization import dumps
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+# Query parameters that switch a list endpoint to the paginated payload
+PAGE_PARAMS = ("limit", "cursor")
+
+
+def encode_cursor(key: Any) -> str:
+    """Opaque cursor for the last row of a page (its sort key)."""
+    return base64.urlsafe_b64encode(pyjson.dumps({"k": key}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(raw: Optional[str], kind: type = int) -> Any:
+    """Sort key of an encode_cursor cursor; InvalidUsage unless it decodes to a `kind` (int ids, str spot ids)."""
+    if not raw:
+        return None
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        key = pyjson.loads(base64.urlsafe_b64decode(padded.encode()))["k"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidUsage("Invalid cursor")
+    # a forged cursor must not reach the keyset comparison (e.g. a list, or True for an int)
+    if not isinstance(key, kind) or isinstance(key, bool):
+        raise InvalidUsage("Invalid cursor")
+    return key
+
+
+def parse_limit(request) -> int:
+    raw = request.args.get("limit")
+    if raw is None or raw == "":
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise InvalidUsage("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidUsage(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+def parse_int_arg(request, name: str) -> Optional[int]:
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise InvalidUsage(f"{name} must be an integer")
+
+
+def parse_dt_arg(request, name: str) -> Optional[datetime]:
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        raise InvalidUsage(f"Invalid ISO date for {name}")
+
+
+def wants_stream(request) -> bool:
+    return request.args.get("stream", "").lower() in ("1", "true")
+
+
+def wants_page(request, *filters: str) -> bool:
+    """True when the client asked for a page (or filtered): the bare URL keeps the full list."""
+    return any(request.args.get(p) not in (None, "") for p in (*PAGE_PARAMS, *filters))
+
+
+def page_payload(items: list, *, limit: int, key: Callable[[Any], Any]) -> dict:
+    """Body of a paginated list; `items` holds up to limit + 1 rows (the extra one means "more")."""
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(key(items[-1])) if has_more and items else None,
+    }
+
+
+async def stream_json_array(request, rows: AsyncIterator, *, chunk_rows: int = 200) -> None:
+    """Write `rows` as one JSON array while they are fetched (same body as the unpaginated list)."""
+    response = await request.respond(content_type="application/json")
+    buffer = [b"["]
+    first = True
+    async for row in rows:
+        if not first:
+            buffer.append(b",")
+        buffer.append(dumps(row))
+        first = False
+        if len(buffer) >= chunk_rows:
+            await response.send(b"".join(buffer))
+            buffer.clear()
+    buffer.append(b"]")
+    await response.send(b"".join(buffer))
+    await response.eof()
@@ -1,13 +1,13 @@
 from __future__ import annotations
 
 from sanic import Blueprint
-from sanic.response import json
 from sanic.exceptions import InvalidUsage
 
 from routes.security import require_roles
 from repositories.parking_repository import ParkingRepository
 from services.parking_service import ParkingService
-from utils.jsonable import to_jsonable  # ✅
+from utils.read_replica import read_only
+from utils.serialization import json
 
 
 bp_parking = Blueprint("parking", url_prefix="/parking")
@@ -17,24 +17,34 @@ def _json_body(request) -> dict:
     return request.json or {}
 
 
+def _parking_repo(request, session) -> ParkingRepository:
+    return ParkingRepository(session, snapshot=getattr(request.app.ctx, "occupancy_snapshot", None))
+
+
 @bp_parking.get("/view")
 @require_roles("MANAGER", "SECRETAIRE")
+@read_only
 async def view(request):
     async with request.app.ctx.Session() as session:
-        repo = ParkingRepository(session)
+        repo = _parking_repo(request, session)
         service = ParkingService(repo)
         data = await service.get_parking_view()
-        return json(to_jsonable(data))  # ✅
+
+        headers = {}
+        # only when answered from the snapshot (not when counted on the replica)
+        if repo.view_age is not None:
+            headers["X-Snapshot-Age"] = f"{repo.view_age:.3f}"
+        return json(data, headers=headers)
 
 
 @bp_parking.get("/config")
 @require_roles("SECRETAIRE")
 async def get_config(request):
     async with request.app.ctx.Session() as session:
-        repo = ParkingRepository(session)
+        repo = _parking_repo(request, session)
         service = ParkingService(repo)
         data = await service.get_config()
-        return json(to_jsonable(data))  # ✅
+        return json(data)  # ✅
 
 
 @bp_parking.put("/config")
@@ -46,10 +56,10 @@ async def update_config(request):
         raise InvalidUsage('Body must be {"slots_max": 60}')
 
     async with request.app.ctx.Session() as session:
-        repo = ParkingRepository(session)
+        repo = _parking_repo(request, session)
         service = ParkingService(repo)
         data = await service.update_config(slots_max=slots_max)
-        return json(to_jsonable(data))  # ✅
+        return json(data)  # ✅
 
 
 @bp_parking.post("/config/reset")
@@ -61,7 +71,7 @@ async def reset_config(request):
         raise InvalidUsage('Body must be {"slots_max": 60}')
 
     async with request.app.ctx.Session() as session:
-        repo = ParkingRepository(session)
+        repo = _parking_repo(request, session)
         service = ParkingService(repo)
         data = await service.reset_config(slots_max=slots_max)
-        return json(to_jsonable(data))  # ✅
+        return json(data)  # ✅
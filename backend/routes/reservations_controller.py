@@ -1,33 +1,43 @@
+from dataclasses import asdict
 from datetime import datetime
 
 from sanic import Blueprint
-from sanic.response import json
 from sanic.exceptions import InvalidUsage, Forbidden, NotFound
 
+from routes.pagination import (
+    decode_cursor, page_payload, parse_dt_arg, parse_int_arg, parse_limit, stream_json_array, wants_page, wants_stream,
+)
 from routes.security import require_auth, require_roles
 from repositories.reservation_repository import ReservationRepository
 from repositories.spot_repository import SpotRepository
 from repositories.user_repository import UserRepository
+from services.reservation_export import FORMATS, export_chunks, gzip_chunks
 from services.reservation_service import ReservationService
+from utils.read_replica import read_only
+from utils.serialization import json
 
 
 bp_reservations = Blueprint("reservations", url_prefix="/reservations")
 
+# Largest batch accepted by POST /reservations/bulk
+MAX_BULK_ITEMS = 500
+
 
 def _json_body(request) -> dict:
     return request.json or {}
 
-def _jsonable(v):
-    if isinstance(v, datetime):
-        return v.isoformat()
-    if isinstance(v, dict):
-        return {k: _jsonable(x) for k, x in v.items()}
-    if isinstance(v, list):
-        return [_jsonable(x) for x in v]
-    # For dataclasses lacking generic __dict__
-    if hasattr(v, '__slots__'):
-        return {s: _jsonable(getattr(v, s)) for s in v.__slots__}
-    return v
+def _make_service(request, session) -> ReservationService:
+    ctx = request.app.ctx
+    snapshot = getattr(ctx, "occupancy_snapshot", None)
+    reservation_repo = ReservationRepository(
+        session, index=getattr(ctx, "reservation_index", None), snapshot=snapshot
+    )
+    spot_repo = SpotRepository(session, snapshot=snapshot)
+    user_repo = UserRepository(session, cache=getattr(ctx, "user_cache", None))
+    return ReservationService(
+        session, reservation_repo, spot_repo, user_repo,
+        scoring=getattr(ctx, "allocator_scoring", None),
+    )
 
 @bp_reservations.post("/")
 @require_auth
@@ -49,40 +59,128 @@ async def create_reservation(request):
     try:
         user_email = request.ctx.user["email"]
         async with request.app.ctx.Session() as session:
-            reservation_repo = ReservationRepository(session)
-            spot_repo = SpotRepository(session)
-            user_repo = UserRepository(session)
-            
-            # Reusing the AMQP channel from the app context if available
-            amqp_channel = getattr(request.app.ctx, "amqp_channel", None)
-            hello_queue = getattr(request.app.ctx, "hello_queue", None)
-
-            service = ReservationService(
-                session, reservation_repo, spot_repo, user_repo, amqp_channel, hello_queue
-            )
+            service = _make_service(request, session)
 
             reservation = await service.create_reservation(
                 spot_id.strip().upper(), user_email, start_date, end_date
             )
-            return json(_jsonable(reservation), status=201)
+            return json(reservation, status=201)
     except (InvalidUsage, Forbidden) as e:
         return json({"error": str(e)}, status=e.status_code)
     except Exception as e:
         return json({"error": str(e)}, status=400)
 
 
+@bp_reservations.post("/auto")
+@require_auth
+async def auto_reserve(request):
+    """
+    Book any suitable spot: {"start_date", "end_date", "electrical": bool,
+    "preferred_row": "A".."F" (optional)}. The spot is picked server-side among the
+    free ones (associated spot first, then the preferred row) and booked at once.
+    """
+    body = _json_body(request)
+    if not body.get("start_date") or not body.get("end_date"):
+        raise InvalidUsage("start_date and end_date are required")
+    try:
+        start_date = datetime.fromisoformat(body["start_date"])
+        end_date = datetime.fromisoformat(body["end_date"])
+    except (TypeError, ValueError):
+        raise InvalidUsage("Invalid ISO date format")
+    preferred_row = body.get("preferred_row")
+
+    try:
+        async with request.app.ctx.Session() as session:
+            service = _make_service(request, session)
+            reservation = await service.auto_reserve(
+                request.ctx.user["email"], start_date, end_date,
+                electrical=bool(body.get("electrical", False)),
+                preferred_row=preferred_row.strip().upper() if isinstance(preferred_row, str) else None,
+            )
+            return json(reservation, status=201)
+    except (InvalidUsage, Forbidden) as e:
+        return json({"error": str(e)}, status=e.status_code)
+
+
+@bp_reservations.post("/bulk")
+@require_roles("SECRETAIRE")
+async def create_reservations_bulk(request):
+    """
+    Book many reservations at once: {"items": [{"user_email", "spot_id", "start_date",
+    "end_date"}, ...], "mode": "atomic" | "best_effort"} (default atomic).
+    Answers one outcome per item; 201 when all were created, 200 when a best-effort
+    batch was partly created, 400 when nothing was written.
+    """
+    body = _json_body(request)
+    items = body.get("items")
+    mode = body.get("mode", "atomic")
+    if not isinstance(items, list) or not items:
+        raise InvalidUsage("items must be a non-empty list")
+    if len(items) > MAX_BULK_ITEMS:
+        raise InvalidUsage(f"At most {MAX_BULK_ITEMS} items per request")
+    if mode not in ("atomic", "best_effort"):
+        raise InvalidUsage("mode must be 'atomic' or 'best_effort'")
+
+    async with request.app.ctx.Session() as session:
+        service = _make_service(request, session)
+        outcomes = await service.create_reservations_bulk(items, atomic=mode == "atomic")
+
+    created = sum(1 for o in outcomes if o["status"] == "created")
+    status = 201 if created == len(outcomes) else 200 if created else 400
+    return json({"mode": mode, "created": created, "failed": len(outcomes) - created, "items": outcomes}, status=status)
+
+
+@bp_reservations.post("/series")
+@require_auth
+async def create_series(request):
+    """
+    Recurring reservation: {"spot_id", "start_date", "end_date" (first occurrence, same day),
+    "rrule": "FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20300630"}. Stored as one series; its
+    occurrences show up in GET /reservations/me without being stored one by one.
+    """
+    body = _json_body(request)
+    spot_id = body.get("spot_id")
+    rrule = body.get("rrule")
+    if not spot_id or not rrule or not body.get("start_date") or not body.get("end_date"):
+        raise InvalidUsage("spot_id, start_date, end_date and rrule are required")
+    try:
+        start_date = datetime.fromisoformat(body["start_date"])
+        end_date = datetime.fromisoformat(body["end_date"])
+    except (TypeError, ValueError):
+        raise InvalidUsage("Invalid ISO date format")
+
+    try:
+        async with request.app.ctx.Session() as session:
+            service = _make_service(request, session)
+            series = await service.create_series(
+                spot_id.strip().upper(), request.ctx.user["email"], start_date, end_date, rrule
+            )
+            return json({**asdict(series), "rrule": series.rrule}, status=201)
+    except (InvalidUsage, Forbidden) as e:
+        return json({"error": str(e)}, status=e.status_code)
+
+
+@bp_reservations.delete("/series/<series_id:int>")
+@require_auth
+async def cancel_series(request, series_id: int):
+    try:
+        async with request.app.ctx.Session() as session:
+            service = _make_service(request, session)
+            await service.cancel_series(series_id, request.ctx.user["email"])
+            return json({"message": "Series cancelled"}, status=200)
+    except (InvalidUsage, Forbidden) as e:
+        return json({"error": str(e)}, status=e.status_code)
+
+
 @bp_reservations.get("/me")
 @require_auth
 async def my_reservations(request):
     user_email = request.ctx.user["email"]
     async with request.app.ctx.Session() as session:
-        reservation_repo = ReservationRepository(session)
-        spot_repo = SpotRepository(session)
-        user_repo = UserRepository(session)
-        service = ReservationService(session, reservation_repo, spot_repo, user_repo)
+        service = _make_service(request, session)
         
         reservations = await service.get_my_reservations(user_email)
-        return json(_jsonable(reservations))
+        return json(reservations)
 
 
 @bp_reservations.patch("/<reservation_id:int>/checkin")
@@ -91,13 +189,10 @@ async def checkin_reservation(request, reservation_id: int):
     user_email = request.ctx.user["email"]
     try:
         async with request.app.ctx.Session() as session:
-            reservation_repo = ReservationRepository(session)
-            spot_repo = SpotRepository(session)
-            user_repo = UserRepository(session)
-            service = ReservationService(session, reservation_repo, spot_repo, user_repo)
+            service = _make_service(request, session)
 
             checked_in = await service.check_in(reservation_id, user_email)
-            return json(_jsonable(checked_in))
+            return json(checked_in)
     except (InvalidUsage, Forbidden) as e:
         return json({"error": str(e)}, status=e.status_code)
     except Exception as e:
@@ -110,10 +205,7 @@ async def cancel_reservation(request, reservation_id: int):
     user_email = request.ctx.user["email"]
     try:
         async with request.app.ctx.Session() as session:
-            reservation_repo = ReservationRepository(session)
-            spot_repo = SpotRepository(session)
-            user_repo = UserRepository(session)
-            service = ReservationService(session, reservation_repo, spot_repo, user_repo)
+            service = _make_service(request, session)
 
             await service.cancel_reservation(reservation_id, user_email)
             return json({"message": "Reservation cancelled"}, status=200)
@@ -133,43 +225,91 @@ async def qr_checkin(request, spot_id: str):
     user_email = request.ctx.user["email"]
     try:
         async with request.app.ctx.Session() as session:
-            reservation_repo = ReservationRepository(session)
-            spot_repo = SpotRepository(session)
-            user_repo = UserRepository(session)
-            service = ReservationService(session, reservation_repo, spot_repo, user_repo)
-            
-            # Find today's active reservation for this user + spot
-            my_reservations = await service.get_my_reservations(user_email)
-            now = datetime.now()
+            service = _make_service(request, session)
             
-            valid_reservation = None
-            for res in my_reservations:
-                if res.spot_id.upper() == spot_id.upper() and res.start_date.date() <= now.date() <= res.end_date.date():
-                    valid_reservation = res
-                    break
-                    
-            if not valid_reservation:
-                raise Forbidden("No active reservation found for this spot today")
-                
-            if valid_reservation.checked_in:
-                return json({"message": "Already checked in", "reservation": _jsonable(valid_reservation)})
-                
-            checked_in = await service.check_in(valid_reservation.id, user_email)
-            return json(_jsonable(checked_in))
+            # Today's reservation of this user on this spot (one query, plus the series if none)
+            reservation, already = await service.qr_check_in(spot_id.upper(), user_email, datetime.now())
+            if already:
+                return json({"message": "Already checked in", "reservation": reservation})
+            return json(reservation)
     except (InvalidUsage, Forbidden) as e:
         return json({"error": str(e)}, status=e.status_code)
     except Exception as e:
         return json({"error": str(e)}, status=400)
 
 
+_LIST_FILTERS = ("from", "to", "user_id", "spot_id")
+
+
+def _list_filters(request) -> dict:
+    spot_id = request.args.get("spot_id")
+    return {
+        "start_date": parse_dt_arg(request, "from"),
+        "end_date": parse_dt_arg(request, "to"),
+        "user_id": parse_int_arg(request, "user_id"),
+        "spot_id": spot_id.strip().upper() if spot_id else None,
+    }
+
+
 @bp_reservations.get("/")
 @require_roles("MANAGER", "SECRETAIRE")
+@read_only
 async def list_all(request):
+    """
+    All reservations, or with ?limit=&cursor= a keyset page
+    {"items": [...], "next_cursor": "..."} ordered by id.
+    Filters: from / to (ISO, overlapping the range), user_id, spot_id.
+    ?stream=1 writes the whole (filtered) list as it is read from the database.
+    """
     async with request.app.ctx.Session() as session:
-        reservation_repo = ReservationRepository(session)
-        spot_repo = SpotRepository(session)
-        user_repo = UserRepository(session)
-        service = ReservationService(session, reservation_repo, spot_repo, user_repo)
-        
+        service = _make_service(request, session)
+
+        if wants_stream(request):
+            await stream_json_array(request, service.iter_all(**_list_filters(request)))
+            return
+        if wants_page(request, *_LIST_FILTERS):
+            limit = parse_limit(request)
+            items = await service.list_page(
+                limit=limit, after_id=decode_cursor(request.args.get("cursor")), **_list_filters(request)
+            )
+            return json(page_payload(items, limit=limit, key=lambda r: r.id))
+
         reservations = await service.list_all()
-        return json(_jsonable(reservations))
+        return json(reservations)
+
+
+@bp_reservations.get("/export")
+@require_roles("MANAGER", "SECRETAIRE")
+@read_only
+async def export(request):
+    """
+    Archive export of the reservation history (with user email and spot attributes).
+    ?format=ndjson|csv (default ndjson), ?from= / ?to= (ISO, overlapping the range),
+    ?gzip=1 to download it gzip-compressed. Streamed: memory does not depend on the range.
+    """
+    fmt = request.args.get("format", "ndjson").lower()
+    if fmt not in FORMATS:
+        raise InvalidUsage(f"format must be one of {', '.join(FORMATS)}")
+    start_date = parse_dt_arg(request, "from")
+    end_date = parse_dt_arg(request, "to")
+    compress = request.args.get("gzip", "0").lower() in ("1", "true")
+
+    filename = f"reservations-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    content_type = FORMATS[fmt]
+    if compress:
+        filename += ".gz"
+        content_type = "application/gzip"
+
+    async with request.app.ctx.Session() as session:
+        service = _make_service(request, session)
+        chunks = export_chunks(service.export_rows(start_date=start_date, end_date=end_date), fmt)
+        if compress:
+            chunks = gzip_chunks(chunks)
+
+        response = await request.respond(
+            content_type=content_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+        async for chunk in chunks:
+            await response.send(chunk)
+        await response.eof()
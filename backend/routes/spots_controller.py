@@ -3,23 +3,33 @@ from __future__ import annotations
 from datetime import datetime, date
 
 from sanic import Blueprint
-from sanic.response import json
 from sanic.exceptions import InvalidUsage, NotFound, SanicException
 from sqlalchemy.exc import IntegrityError
 
 
+from routes.pagination import decode_cursor, page_payload, parse_limit, stream_json_array, wants_page, wants_stream
 from routes.security import require_auth, require_roles
 from repositories.spot_repository import SpotRepository
 from services.spot_service import SpotService
+from utils.read_replica import read_only
+from utils.serialization import json
 
 
 bp_spots = Blueprint("spots", url_prefix="/spots")
 
+# Largest window accepted by /spots/availability (manager bookings go up to 30 days)
+MAX_AVAILABILITY_DAYS = 62
+
 
 def _json_body(request) -> dict:
     return request.json or {}
 
 
+def _spot_repo(request, session) -> SpotRepository:
+    ctx = request.app.ctx
+    return SpotRepository(session, snapshot=getattr(ctx, "occupancy_snapshot", None))
+
+
 def _parse_dt(value):
     if value is None:
         return None
@@ -31,51 +41,86 @@ def _parse_dt(value):
         raise InvalidUsage("Invalid datetime format (expected ISO 8601)")
 
 
-def _jsonable(v):
-    """Convertit récursivement les objets non sérialisables JSON (datetime/date) en ISO string."""
-    if isinstance(v, (datetime, date)):
-        return v.isoformat()
-    if isinstance(v, dict):
-        return {k: _jsonable(x) for k, x in v.items()}
-    if isinstance(v, (list, tuple)):
-        return [_jsonable(x) for x in v]
-    return v
-
-
 @bp_spots.get("/available")
 @require_auth
+@read_only
 async def available(request):
     electrical_required = (
         request.args.get("electrical_required", "0").lower() in ("1", "true")
     )
 
     async with request.app.ctx.Session() as session:
-        repo = SpotRepository(session)
+        repo = _spot_repo(request, session)
         service = SpotService(repo)
         spots = await service.list_available(electrical_required=electrical_required)
-        return json(_jsonable(spots))
+        return json(spots)
+
+
+def _parse_day(value, name: str) -> date:
+    if not value:
+        raise InvalidUsage(f"{name} is required (YYYY-MM-DD)")
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise InvalidUsage(f"Invalid {name} date (expected YYYY-MM-DD)")
+
+
+@bp_spots.get("/availability")
+@require_auth
+@read_only
+async def availability(request):
+    day_from = _parse_day(request.args.get("from"), "from")
+    day_to = _parse_day(request.args.get("to"), "to")
+    if day_to < day_from:
+        raise InvalidUsage("to must be on or after from")
+    if (day_to - day_from).days + 1 > MAX_AVAILABILITY_DAYS:
+        raise InvalidUsage(f"Window is limited to {MAX_AVAILABILITY_DAYS} days")
+    electrical_required = (
+        request.args.get("electrical_required", "0").lower() in ("1", "true")
+    )
+
+    async with request.app.ctx.Session() as session:
+        repo = _spot_repo(request, session)
+        service = SpotService(repo)
+        matrix = await service.availability_matrix(
+            day_from, day_to, electrical_required=electrical_required
+        )
+        return json(matrix)
 
 
 @bp_spots.get("/")
 @require_roles("SECRETAIRE")
+@read_only
 async def list_spots(request):
+    """All spots, or with ?limit=&cursor= (and optional ?electrical=) a keyset page; ?stream=1 streams the list."""
+    raw = request.args.get("electrical")
+    electrical = None if raw in (None, "") else raw.lower() in ("1", "true")
     async with request.app.ctx.Session() as session:
-        repo = SpotRepository(session)
+        repo = _spot_repo(request, session)
         service = SpotService(repo)
+        if wants_stream(request):
+            await stream_json_array(request, service.iter_spots(electrical=electrical))
+            return
+        if wants_page(request, "electrical"):
+            limit = parse_limit(request)
+            spots = await service.list_spots_page(
+                limit=limit, after_id=decode_cursor(request.args.get("cursor"), str), electrical=electrical
+            )
+            return json(page_payload(spots, limit=limit, key=lambda s: s["id"]))
         spots = await service.list_spots()
-        return json(_jsonable(spots))
+        return json(spots)
 
 
 @bp_spots.get("/<spot_id:str>")
 @require_auth
 async def get_spot(request, spot_id: str):
     async with request.app.ctx.Session() as session:
-        repo = SpotRepository(session)
+        repo = _spot_repo(request, session)
         service = SpotService(repo)
         spot = await service.get_spot(spot_id)
         if not spot:
             raise NotFound("Spot not found")
-        return json(_jsonable(spot))
+        return json(spot)
 
 
 @bp_spots.post("/")
@@ -96,13 +141,13 @@ async def create_spot(request):
     spot_id = spot_id.strip().upper()
 
     async with request.app.ctx.Session() as session:
-        repo = SpotRepository(session)
+        repo = _spot_repo(request, session)
         service = SpotService(repo)
 
         # 1) Idempotence: si déjà là, on renvoie l'existant
         existing = await service.get_spot(spot_id)
         if existing:
-            return json(_jsonable(existing), status=200)
+            return json(existing, status=200)
 
         # 2) Sinon on tente de créer
         try:
@@ -111,14 +156,14 @@ async def create_spot(request):
                 electrical=electrical,
                 is_free=is_free,
             )
-            return json(_jsonable(created), status=201)
+            return json(created, status=201)
 
         except IntegrityError:
             # Concurrent / race condition: quelqu’un a créé entre-temps
             await session.rollback()
             existing = await service.get_spot(spot_id)
             if existing:
-                return json(_jsonable(existing), status=200)
+                return json(existing, status=200)
 
             # Si vraiment pas récupérable -> 409
             raise SanicException("Spot already exists", status_code=409)
@@ -140,7 +185,7 @@ async def patch_spot(request, spot_id: str):
         raise InvalidUsage("electrical must be boolean")
 
     async with request.app.ctx.Session() as session:
-        repo = SpotRepository(session)
+        repo = _spot_repo(request, session)
         service = SpotService(repo)
         updated = await service.update_spot(
             spot_id.strip().upper(),
@@ -151,14 +196,14 @@ async def patch_spot(request, spot_id: str):
         )
         if not updated:
             raise NotFound("Spot not found")
-        return json(_jsonable(updated))
+        return json(updated)
 
 
 @bp_spots.delete("/<spot_id:str>")
 @require_roles("SECRETAIRE")
 async def delete_spot(request, spot_id: str):
     async with request.app.ctx.Session() as session:
-        repo = SpotRepository(session)
+        repo = _spot_repo(request, session)
         service = SpotService(repo)
         ok = await service.delete_spot(spot_id.strip().upper())
         if not ok:
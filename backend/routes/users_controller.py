@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 from sanic import Blueprint
-from sanic.response import json
 from sanic.exceptions import InvalidUsage, NotFound
 
 from routes.security import require_auth, require_roles
 from repositories.user_repository import UserRepository
 from services.user_service import UserService
-from utils.jsonable import to_jsonable
+from routes.pagination import decode_cursor, page_payload, parse_limit, stream_json_array, wants_page, wants_stream
+from utils.read_replica import read_only
+from utils.serialization import json
 
 bp_users = Blueprint("users", url_prefix="/users")
 
@@ -16,17 +17,21 @@ def _json_body(request) -> dict:
     return request.json or {}
 
 
+def _user_repo(request, session) -> UserRepository:
+    return UserRepository(session, cache=getattr(request.app.ctx, "user_cache", None))
+
+
 @bp_users.get("/me")
 @require_auth
 async def me(request):
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
 
         user = await service.get_user(request.ctx.user_id)
         if not user:
             raise NotFound("User not found")
-        return json(to_jsonable(user))
+        return json(user)
 
 
 @bp_users.patch("/me")
@@ -38,7 +43,7 @@ async def patch_me(request):
         raise InvalidUsage(f"Only allowed fields: {sorted(allowed)}")
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
 
         updated = await service.update_user(
@@ -50,19 +55,32 @@ async def patch_me(request):
         )
         if not updated:
             raise NotFound("User not found")
-        return json(to_jsonable(updated))
+        return json(updated)
 
 
 # -------------------- ADMIN (SECRETAIRE) --------------------
 
 @bp_users.get("/")
 @require_roles("SECRETAIRE")
+@read_only
 async def list_users(request):
+    """All users, or with ?limit=&cursor= (and optional ?spot=) a keyset page; ?stream=1 streams the list."""
+    spot = request.args.get("spot")
+    spot_associe = spot.strip().upper() if spot else None
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
+        if wants_stream(request):
+            await stream_json_array(request, service.iter_users(spot_associe=spot_associe))
+            return
+        if wants_page(request, "spot"):
+            limit = parse_limit(request)
+            users = await service.list_users_page(
+                limit=limit, after_id=decode_cursor(request.args.get("cursor")), spot_associe=spot_associe
+            )
+            return json(page_payload(users, limit=limit, key=lambda u: u["id"]))
         users = await service.list_users()
-        return json(to_jsonable(users))
+        return json(users)
 
 
 @bp_users.post("/")
@@ -86,7 +104,7 @@ async def create_user(request):
         raise InvalidUsage("roles must be a list of strings")
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
         created = await service.create_user(
             email=email.strip().lower(),
@@ -95,19 +113,19 @@ async def create_user(request):
             roles=[r.strip().upper() for r in roles],
             spot_associe=spot_associe,
         )
-        return json(to_jsonable(created), status=201)
+        return json(created, status=201)
 
 
 @bp_users.get("/<user_id:int>")
 @require_roles("SECRETAIRE")
 async def get_user(request, user_id: int):
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
         user = await service.get_user(user_id)
         if not user:
             raise NotFound("User not found")
-        return json(to_jsonable(user))
+        return json(user)
 
 
 @bp_users.patch("/<user_id:int>")
@@ -119,7 +137,7 @@ async def patch_user(request, user_id: int):
         raise InvalidUsage(f"Only allowed fields: {sorted(allowed)}")
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
 
         updated = await service.update_user(
@@ -131,14 +149,14 @@ async def patch_user(request, user_id: int):
         )
         if not updated:
             raise NotFound("User not found")
-        return json(to_jsonable(updated))
+        return json(updated)
 
 
 @bp_users.delete("/<user_id:int>")
 @require_roles("SECRETAIRE")
 async def delete_user(request, user_id: int):
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
         ok = await service.delete_user(user_id)
         if not ok:
@@ -152,7 +170,7 @@ async def delete_user(request, user_id: int):
 @require_roles("SECRETAIRE")
 async def get_roles(request, user_id: int):
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         roles = await repo.get_roles(user_id)
         if roles is None:
             raise NotFound("User not found")
@@ -168,7 +186,7 @@ async def set_roles(request, user_id: int):
         raise InvalidUsage('Body must be {"roles":["EMPLOYEE",...]}')
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
         new_roles = await service.set_roles(user_id, [r.strip().upper() for r in roles])
         if new_roles is None:
@@ -185,7 +203,7 @@ async def add_role(request, user_id: int):
         raise InvalidUsage('Body must be {"role":"MANAGER"}')
 
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
         roles = await service.add_role(user_id, role.strip().upper())
         if roles is None:
@@ -197,7 +215,7 @@ async def add_role(request, user_id: int):
 @require_roles("SECRETAIRE")
 async def remove_role(request, user_id: int, role: str):
     async with request.app.ctx.Session() as session:
-        repo = UserRepository(session)
+        repo = _user_repo(request, session)
         service = UserService(repo)
         roles = await service.remove_role(user_id, role.strip().upper())
         if roles is None:
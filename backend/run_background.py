@@ -1,25 +1,114 @@
 import asyncio
+import os
+from datetime import datetime, timedelta
 from sanic.log import logger
+from repositories.outbox_repository import OutboxRepository
+from repositories.parking_repository import ParkingRepository
 from repositories.reservation_repository import ReservationRepository
-from repositories.spot_repository import SpotRepository
-from repositories.user_repository import UserRepository
-from services.reservation_service import ReservationService
+from utils.db_pool import ping_idle_connections, pool_stats
 
-async def cleanup_loop(app):
+async def release_due(app, cutoff, ids):
+    # Deadline handler: releases exactly the reservations due at `cutoff` (guarded, idempotent)
+    if not app.ctx.leader.is_leader:
+        return  # lost the lease since the last reload: the new leader fires them
+    async with app.ctx.metrics.timed("release_due"), app.ctx.Session() as session:
+        reservation_repo = ReservationRepository(
+            session, index=app.ctx.reservation_index, snapshot=app.ctx.occupancy_snapshot
+        )
+        released = await reservation_repo.release_unchecked(cutoff, ids=ids)
+    logger.info(f"Released {released}/{len(ids)} reservations due at {cutoff:%Y-%m-%d %H:%M}")
+
+async def reload_deadlines(app):
+    # Every pending deadline, whichever worker or host booked the reservation
+    async with app.ctx.Session() as session:
+        pending = await ReservationRepository(session).pending_releases(datetime.now())
+    app.ctx.deadlines.clear()
+    return app.ctx.deadlines.load(pending)
+
+async def deadline_loop(app, reload_s):
+    # Leader only: reloads the deadlines from the DB every `reload_s` and sleeps until
+    # the next one in between (a booking made meanwhile is fired at most `reload_s` late)
+    deadlines = app.ctx.deadlines
+    while not deadlines.stopped:
+        if not app.ctx.leader.is_leader:
+            deadlines.clear()
+            await asyncio.sleep(reload_s)
+            continue
+        try:
+            loaded = await reload_deadlines(app)
+            logger.debug(f"Loaded {loaded} check-in deadlines")
+        except Exception as e:
+            logger.error(f"Error loading check-in deadlines: {e}")
+        await deadlines.run(
+            lambda cutoff, ids: release_due(app, cutoff, ids), until=datetime.now() + timedelta(seconds=reload_s)
+        )
+
+def start_deadline_task(app, reload_s):
+    return deadline_loop(app, reload_s)
+
+async def index_resync_loop(app):
+    # Re-sync the interval index (cancellations made by other workers, day change)
+    interval_s = float(os.getenv("INDEX_RESYNC_S", "300"))
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            async with app.ctx.metrics.timed("index_resync"), app.ctx.Session() as session:
+                await ReservationRepository(session, index=app.ctx.reservation_index).warm_index()
+        except Exception as e:
+            logger.error(f"Error in index resync: {e}")
+
+def start_index_resync_task(app):
+    return index_resync_loop(app)
+
+async def snapshot_reconcile_loop(app):
+    # Corrects the drift of the occupancy snapshot (writes made by other workers)
+    interval_s = float(os.getenv("PARKING_SNAPSHOT_RECONCILE_S", "30"))
+    while True:
+        await asyncio.sleep(interval_s)
+        try:
+            async with app.ctx.metrics.timed("snapshot_reconcile"), app.ctx.Session() as session:
+                await ParkingRepository(session, snapshot=app.ctx.occupancy_snapshot).reload_snapshot()
+        except Exception as e:
+            logger.error(f"Error in snapshot reconciliation: {e}")
+
+def start_snapshot_reconcile_task(app):
+    return snapshot_reconcile_loop(app)
+
+async def pool_liveness_loop(app, interval_s):
+    # Pings the idle DB connections of the primary and of the replica
+    # (replaces a ping on every checkout, see utils/db_pool.py)
+    while True:
+        await asyncio.sleep(interval_s)
+        for engine in (app.ctx.engine, app.ctx.replica_engine):
+            if engine is None or pool_stats(engine) is None:
+                continue
+            try:
+                async with app.ctx.metrics.timed("pool_liveness"):
+                    await ping_idle_connections(engine)
+            except Exception as e:
+                logger.error(f"Error in DB pool liveness check: {e}")
+
+def start_pool_liveness_task(app, interval_s):
+    return pool_liveness_loop(app, interval_s)
+
+async def outbox_prune_loop(app, interval_s, retention_s):
+    # Deletes the outbox events older than `retention_s` (leader only). Without a relay
+    # (MQ disabled) nothing will send them: the unsent ones go too
     while True:
+        await asyncio.sleep(interval_s)
+        if not app.ctx.leader.is_leader:
+            continue
         try:
-            async with app.ctx.Session() as session:
-                reservation_repo = ReservationRepository(session)
-                spot_repo = SpotRepository(session)
-                user_repo = UserRepository(session)
-                service = ReservationService(session, reservation_repo, spot_repo, user_repo)
-                
-                await service.release_expired_checkins()
+            async with app.ctx.metrics.timed("outbox_prune"):
+                relay = getattr(app.ctx, "outbox_relay", None)
+                if relay is not None:
+                    await relay.prune()
+                else:
+                    cutoff = datetime.now() - timedelta(seconds=retention_s)
+                    async with app.ctx.Session() as session:
+                        await OutboxRepository(session).prune(cutoff, unsent_before=cutoff)
         except Exception as e:
-            logger.error(f"Error in cleanup task: {e}")
-            
-        # Run every 5 minutes
-        await asyncio.sleep(300)
+            logger.error(f"Error in outbox pruning: {e}")
 
-def start_cleanup_task(app):
-    return cleanup_loop(app)
+def start_outbox_prune_task(app, interval_s, retention_s):
+    return outbox_prune_loop(app, interval_s, retention_s)
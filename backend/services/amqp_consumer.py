@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import aio_pika
+import orjson
+from sanic.log import logger
+
+# handler(event): `event` is the decoded message body, {"type": ..., ...}
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class Poison(Exception):
+    """Raised by a handler for a message that can never succeed: dead-lettered without retrying."""
+
+
+class _Delivery:
+    __slots__ = ("message", "done", "requeued")
+
+    def __init__(self, message):
+        self.message = message
+        self.done = False
+        self.requeued = False  # settled by a reject: never part of a cumulative ack
+
+
+def _percentile(samples, q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+
+
+class AmqpConsumer:
+    """Consumes `queue_name` and dispatches each event to `handlers[event["type"]]`.
+
+    At most `prefetch` messages are delivered unacknowledged, and at most
+    `concurrency` of them are handled at once. Acks are cumulative (multiple=True)
+    up to the last message whose predecessors are all done, every `ack_batch`
+    messages or `ack_interval_s`. A failing handler is retried `max_attempts`
+    times with backoff; then the message, like an undecodable one or a `Poison`,
+    is copied to `<queue_name>.dlq` and acked. Unknown types are acked and
+    counted as skipped. `stop()` stops the deliveries, lets the running handlers
+    finish and acks them; anything left unacked is redelivered by the broker.
+    """
+
+    def __init__(
+        self,
+        channel,
+        queue_name: str,
+        handlers: Dict[str, Handler],
+        *,
+        prefetch: int = 100,
+        concurrency: int = 10,
+        ack_batch: int = 50,
+        ack_interval_s: float = 0.2,
+        max_attempts: int = 3,
+        backoff_base_s: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not 1 <= ack_batch <= prefetch:
+            # the broker stops delivering at `prefetch` unacked messages
+            raise ValueError("ack_batch must be between 1 and prefetch")
+        self.channel = channel
+        self.queue_name = queue_name
+        self.dead_letter_queue = f"{queue_name}.dlq"
+        self.handlers = dict(handlers)
+        self.prefetch = prefetch
+        self.ack_batch = ack_batch
+        self.ack_interval_s = ack_interval_s
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self._clock = clock
+        self._slots = asyncio.Semaphore(concurrency)
+        self._queue = None
+        self._consumer_tag: Optional[str] = None
+        self._stopping = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+        # deliveries in delivery-tag order, until acked
+        self._unacked: deque[_Delivery] = deque()
+        self._ack_upto = None  # last message of the done prefix, not acked yet
+        self._ack_ready = 0
+        self._ack_lock = asyncio.Lock()
+        # metrics
+        self.received = 0
+        self.handled = 0
+        self.acked = 0
+        self.skipped = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self._handled_at: deque[float] = deque(maxlen=4096)
+        self._handle_ms: deque[float] = deque(maxlen=1024)
+        self._lag_ms: deque[float] = deque(maxlen=1024)
+
+    # --- lifecycle ---
+    async def start(self) -> None:
+        await self.channel.set_qos(prefetch_count=self.prefetch)
+        self._queue = await self.channel.declare_queue(self.queue_name, durable=True)
+        await self.channel.declare_queue(self.dead_letter_queue, durable=True)
+        self._consumer_tag = await self._queue.consume(self._on_message)
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info(f"Consumer: {self.queue_name} (prefetch {self.prefetch}, handlers {sorted(self.handlers)})")
+
+    async def stop(self, timeout_s: float = 30.0) -> None:
+        """Stop the deliveries, give the running handlers `timeout_s`, ack what they finished."""
+        self._stopping = True
+        if self._consumer_tag is not None:
+            await self._queue.cancel(self._consumer_tag)
+            self._consumer_tag = None
+        if self._tasks:
+            _done, pending = await asyncio.wait(set(self._tasks), timeout=timeout_s)
+            for task in pending:
+                task.cancel()  # left unacked: redelivered
+            if pending:
+                await asyncio.wait(pending)
+                logger.warning(f"Consumer: {len(pending)} handlers cancelled at shutdown")
+        await self._flush()
+        if self._flusher is not None:
+            self._flusher.cancel()
+
+    # --- deliveries ---
+    async def _on_message(self, message) -> None:
+        if self._stopping:
+            await message.reject(requeue=True)
+            return
+        self.received += 1
+        delivery = _Delivery(message)
+        self._unacked.append(delivery)
+        task = asyncio.create_task(self._process(delivery))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, delivery: _Delivery) -> None:
+        message = delivery.message
+        async with self._slots:
+            t0 = self._clock()
+            try:
+                await self._handle(message)
+            except Exception as e:
+                # the dead-letter queue could not take it: back to the queue
+                logger.error(f"Consumer: message {message.message_id} requeued: {e}")
+                await self._requeue(delivery)
+            self._handle_ms.append((self._clock() - t0) * 1000)
+        published_at = (message.headers or {}).get("x-published-at")
+        if isinstance(published_at, (int, float)):
+            self._lag_ms.append(max(0.0, time.time() - published_at) * 1000)
+        self.handled += 1
+        self._handled_at.append(self._clock())
+        # a cancelled handler never gets here: its message stays unacked
+        delivery.done = True
+        await self._advance()
+
+    async def _handle(self, message) -> None:
+        try:
+            event = orjson.loads(message.body)
+            event_type = event.get("type") if isinstance(event, dict) else None
+        except orjson.JSONDecodeError as e:
+            await self._dead_letter(message, f"undecodable: {e}")
+            return
+        handler = self.handlers.get(event_type)
+        if handler is None:
+            self.skipped += 1
+            logger.warning(f"Consumer: no handler for {event_type!r}, message {message.message_id} skipped")
+            return
+        attempt = 1
+        while True:
+            try:
+                await handler(event)
+                return
+            except Poison as e:
+                await self._dead_letter(message, f"poison: {e}")
+                return
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    await self._dead_letter(message, f"{type(e).__name__}: {e} (after {attempt} attempts)")
+                    return
+                self.retries += 1
+                delay = self.backoff_base_s * 2 ** (attempt - 1)
+                attempt += 1
+                logger.warning(f"Consumer: {event_type} handler failed ({e}), retry in {delay:.2f}s")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    async def _dead_letter(self, message, reason: str) -> None:
+        logger.error(f"Consumer: message {message.message_id} dead-lettered: {reason}")
+        await self.channel.default_exchange.publish(
+            aio_pika.Message(
+                body=message.body,
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                message_id=message.message_id,
+                headers={**(message.headers or {}), "x-error": reason, "x-original-queue": self.queue_name},
+            ),
+            routing_key=self.dead_letter_queue,
+        )
+        self.dead_lettered += 1
+
+    async def _requeue(self, delivery: _Delivery) -> None:
+        try:
+            await delivery.message.reject(requeue=True)
+            delivery.requeued = True
+        except Exception as e:
+            logger.error(f"Consumer: reject failed: {e}")
+
+    # --- cumulative acks ---
+    async def _advance(self) -> None:
+        while self._unacked and self._unacked[0].done:
+            delivery = self._unacked.popleft()
+            if not delivery.requeued:
+                self._ack_upto = delivery.message
+                self._ack_ready += 1
+        if self._ack_ready >= self.ack_batch:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        async with self._ack_lock:
+            if self._ack_upto is None:
+                return
+            message, count = self._ack_upto, self._ack_ready
+            self._ack_upto, self._ack_ready = None, 0
+            try:
+                await message.ack(multiple=True)
+            except Exception as e:
+                # channel lost: the broker redelivers these messages
+                logger.error(f"Consumer: ack of {count} messages failed: {e}")
+                return
+            self.acked += count
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.ack_interval_s)
+            await self._flush()
+
+    # --- metrics ---
+    def stats(self, window_s: float = 10.0) -> dict:
+        since = self._clock() - window_s
+        recent = sum(1 for t in self._handled_at if t >= since)
+        return {
+            "received": self.received,
+            "handled": self.handled,
+            "acked": self.acked,
+            "skipped": self.skipped,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "in_flight": len(self._tasks),
+            "unacked": len(self._unacked) + self._ack_ready,
+            "throughput_per_s": round(recent / window_s, 1),
+            "handle_ms_p50": _percentile(self._handle_ms, 0.5),
+            "handle_ms_p99": _percentile(self._handle_ms, 0.99),
+            "lag_ms_p50": _percentile(self._lag_ms, 0.5),
+            "lag_ms_p99": _percentile(self._lag_ms, 0.99),
+        }
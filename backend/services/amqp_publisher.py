@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import os
+import random
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import aio_pika
+import orjson
+from sanic.log import logger
+
+from utils.serialization import dumps
+
+# Overflow policies of a full queue
+BLOCK = "block"   # publish() waits for room (backpressure on the request)
+SPILL = "spill"   # publish() appends the message to the spill file and returns
+
+
+class PublisherOverloaded(Exception):
+    """The queue is full and stayed full for `put_timeout_s` (BLOCK policy)."""
+
+
+class _Pending:
+    __slots__ = ("routing_key", "body", "message_id", "enqueued_at")
+
+    def __init__(self, routing_key: str, body: bytes, message_id: str, enqueued_at: float):
+        self.routing_key = routing_key
+        self.body = body
+        self.message_id = message_id
+        self.enqueued_at = enqueued_at
+
+
+class AmqpPublisher:
+    """Per-worker background publisher (app.ctx.publisher).
+
+    Request handlers only enqueue (`publish`); `run()` drains the bounded queue
+    in batches over a dedicated channel opened with publisher confirms, and only
+    drops a message once the broker confirmed it. A failed batch is retried with
+    exponential backoff (the channel is reopened). When the queue is full, the
+    SPILL policy appends messages to `spill_path` (replayed at start, once the
+    broker confirms again, and every `replay_every_s` while idle), the BLOCK
+    policy makes `publish` wait.
+    """
+
+    def __init__(
+        self,
+        channel_factory: Callable[[], Awaitable],
+        *,
+        max_queue: int = 10_000,
+        batch_size: int = 100,
+        linger_s: float = 0.005,
+        overflow: str = SPILL,
+        spill_path: Optional[str] = None,
+        put_timeout_s: float = 5.0,
+        backoff_base_s: float = 0.1,
+        backoff_max_s: float = 30.0,
+        replay_every_s: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        on_confirm: Optional[Callable[[float, int], None]] = None,
+    ):
+        if overflow not in (BLOCK, SPILL):
+            raise ValueError(f"overflow must be {BLOCK!r} or {SPILL!r}")
+        if overflow == SPILL and not spill_path:
+            raise ValueError("the spill policy needs a spill_path")
+        self._channel_factory = channel_factory
+        self._channel = None
+        self._queue: asyncio.Queue[_Pending] = asyncio.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.linger_s = linger_s
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.put_timeout_s = put_timeout_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.replay_every_s = replay_every_s
+        self._clock = clock
+        # on_confirm(seconds, messages) after each confirmed batch (see AppMetrics.amqp_confirmed)
+        self._on_confirm = on_confirm
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: list[_Pending] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # metrics
+        self.published = 0
+        self.spilled = 0
+        self.retries = 0
+        self.last_lag_ms: Optional[float] = None  # enqueue -> confirm of the last batch
+        self._confirm_ms: deque[float] = deque(maxlen=1024)
+
+    # --- producers ---
+    async def publish(self, routing_key: str, payload) -> None:
+        """Queue `payload` (JSON-encoded unless bytes) for `routing_key`; never talks to the broker."""
+        body = payload if isinstance(payload, bytes) else dumps(payload)
+        item = _Pending(routing_key, body, uuid.uuid4().hex, self._clock())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.overflow == SPILL:
+                self._spill([item])
+                return
+            try:
+                await asyncio.wait_for(self._queue.put(item), self.put_timeout_s)
+            except asyncio.TimeoutError:
+                raise PublisherOverloaded(f"publish queue full for {self.put_timeout_s}s")
+        self._idle.clear()
+
+    async def send_now(self, messages: list[tuple[str, bytes, str]]) -> None:
+        """Publish (routing_key, body, message_id) messages and wait for their confirms,
+        bypassing the queue; raises when one is not confirmed (used by the outbox relay)."""
+        if not messages:
+            return
+        now = self._clock()
+        try:
+            await self._send([_Pending(key, body, message_id, now) for key, body, message_id in messages])
+        except Exception:
+            self._channel = None  # reopened by the next send
+            raise
+
+    # --- spill file (one JSON object per line) ---
+    def _spill(self, items) -> None:
+        with open(self.spill_path, "ab") as f:
+            for item in items:
+                f.write(orjson.dumps({
+                    "routing_key": item.routing_key,
+                    "body": base64.b64encode(item.body).decode(),
+                    "message_id": item.message_id,
+                }) + b"\n")
+        self.spilled += len(items)
+        logger.warning(f"Publisher: {len(items)} messages spilled to {self.spill_path}")
+
+    def _take_spilled(self) -> list[_Pending]:
+        if not self.spill_path:
+            return []
+        replay = f"{self.spill_path}.{os.getpid()}.replay"
+        try:
+            os.replace(self.spill_path, replay)  # new spills go to a fresh file meanwhile
+        except FileNotFoundError:  # nothing spilled, or another worker took it
+            return []
+        with open(replay, "rb") as f:
+            records = [orjson.loads(line) for line in f if line.strip()]
+        os.remove(replay)
+        now = self._clock()
+        return [
+            _Pending(r["routing_key"], base64.b64decode(r["body"]), r["message_id"], now) for r in records
+        ]
+
+    # --- consumer loop ---
+    async def _next_batch(self, timeout: Optional[float] = None) -> list[_Pending]:
+        """Up to `batch_size` queued messages; [] when none came within `timeout`."""
+        try:
+            async with asyncio.timeout(timeout):
+                batch = [await self._queue.get()]
+        except TimeoutError:
+            return []
+        deadline = self._clock() + self.linger_s
+        while len(batch) < self.batch_size:
+            if self._queue.empty():
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _send(self, batch: list[_Pending]) -> None:
+        """Publish `batch` and wait for every broker confirm (raises if one is nacked / lost)."""
+        if self._channel is None or self._channel.is_closed:
+            self._channel = await self._channel_factory()
+        exchange = self._channel.default_exchange
+        t0 = self._clock()
+        await asyncio.gather(*(
+            exchange.publish(
+                aio_pika.Message(
+                    body=item.body,
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                    message_id=item.message_id,
+                    headers={"x-published-at": time.time()},  # consumer lag (services/amqp_consumer.py)
+                ),
+                routing_key=item.routing_key,
+            )
+            for item in batch
+        ))
+        now = self._clock()
+        self._confirm_ms.append((now - t0) * 1000)
+        if self._on_confirm is not None:
+            self._on_confirm(now - t0, len(batch))
+        self.last_lag_ms = (now - batch[0].enqueued_at) * 1000
+        self.published += len(batch)
+
+    async def _send_with_retry(self, batch: list[_Pending]) -> bool:
+        """True once confirmed; False when stop() gave up on it (stop() spills it)."""
+        attempt = 0
+        while not self._stopping:
+            try:
+                await self._send(batch)
+                return True
+            except Exception as e:
+                self._channel = None
+                self.retries += 1
+                delay = min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt)
+                attempt += 1
+                logger.error(f"Publisher: batch of {len(batch)} not confirmed ({e}), retry in {delay:.2f}s")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        return False
+
+    async def _replay_spilled(self) -> bool:
+        """Send what was spilled (by this process or a previous one); False when stop() gave up."""
+        spilled = self._take_spilled()
+        for i in range(0, len(spilled), self.batch_size):
+            self._in_flight = spilled[i:]
+            if not await self._send_with_retry(spilled[i:i + self.batch_size]):
+                return False
+        self._in_flight = []
+        return True
+
+    async def run(self) -> None:
+        self._task = asyncio.current_task()
+        # left by a previous process: do not wait for the first publish
+        if not await self._replay_spilled():
+            return
+        while not self._stopping:
+            # an idle tick still replays the spill file (e.g. written by another worker)
+            self._in_flight = await self._next_batch(self.replay_every_s)
+            if self._in_flight and not await self._send_with_retry(self._in_flight):
+                return
+            # the broker confirms again: replay what overflowed meanwhile
+            if not await self._replay_spilled():
+                return
+            if self._queue.empty():
+                self._idle.set()
+
+    def _drain(self) -> list[_Pending]:
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def stop(self, timeout_s: float = 5.0) -> None:
+        """Give the queue `timeout_s` to drain, then spill (or drop, without a spill file)
+        what is left, including a batch still waiting for its confirms."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            pass
+        self._stopping = True
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        left = self._in_flight + self._drain()
+        self._in_flight = []
+        if not left:
+            return
+        if self.spill_path:
+            self._spill(left)
+        else:
+            logger.error(f"Publisher: {len(left)} messages dropped at shutdown")
+
+    # --- metrics ---
+    def stats(self) -> dict:
+        confirms = sorted(self._confirm_ms)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "published": self.published,
+            "spilled": self.spilled,
+            "retries": self.retries,
+            "confirm_ms_p50": round(confirms[len(confirms) // 2], 3) if confirms else None,
+            "confirm_ms_p99": round(confirms[min(len(confirms) - 1, int(len(confirms) * 0.99))], 3) if confirms else None,
+            "last_lag_ms": round(self.last_lag_ms, 3) if self.last_lag_ms is not None else None,
+        }
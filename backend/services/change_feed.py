@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import secrets
+import time
+from collections import deque
+from typing import Optional
+
+
+class Subscription:
+    """One consumer of a ChangeFeed, with its own bounded queue."""
+
+    def __init__(self, feed: "ChangeFeed", max_queue: int):
+        self._feed = feed
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = False  # set when the consumer fell behind: it must resync
+        self.closed = False
+
+    def _offer(self, event: dict) -> None:
+        if self.closed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: never block the writers nor buffer without bound
+            self.dropped = True
+            self._close()
+
+    def _close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._feed._subscribers.discard(self)
+            # wake up get(); the queue may be full, so make room for the sentinel
+            if self._queue.full():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event; None once the subscription is closed; TimeoutError after `timeout` seconds."""
+        if self.closed and self._queue.empty():
+            return None
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def close(self) -> None:
+        self._close()
+
+
+class ChangeFeed:
+    """Versioned in-process stream of spot / reservation deltas.
+
+    `publish` is called by the outbox tail (services/feed_tail.py), so the feed
+    carries the writes of every worker and host; every subscriber receives each
+    event in its own bounded queue. The last `history` events are kept so a
+    client can resume from the version it last saw. One feed per worker
+    (app.ctx.change_feed): its versions only mean something together with its
+    `epoch`.
+    """
+
+    def __init__(self, history: int = 1024, max_queue: int = 256):
+        self.epoch = secrets.token_hex(4)  # tells this feed's versions from another worker's (or a restart's)
+        self.version = 0
+        self.max_queue = max_queue
+        self._history: deque[dict] = deque(maxlen=history)
+        self._subscribers: set[Subscription] = set()
+
+    def publish(self, kind: str, data: dict) -> dict:
+        self.version += 1
+        event = {"version": self.version, "type": kind, "at": time.time(), "data": data}
+        self._history.append(event)
+        for sub in list(self._subscribers):
+            sub._offer(event)
+        return event
+
+    def subscribe(self, since: Optional[int] = None) -> tuple[Subscription, bool]:
+        """Subscribe, replaying the events after `since` when still retained.
+
+        Returns (subscription, resync): resync is True when `since` is older than
+        the retained history (or unknown), or when the missed events do not fit
+        the subscriber queue, i.e. the client must reload its state.
+        """
+        sub = Subscription(self, self.max_queue)
+        resync = False
+        if since is not None:
+            oldest = self._history[0]["version"] if self._history else self.version + 1
+            missed = [event for event in self._history if event["version"] > since]
+            if since > self.version or since < oldest - 1 or len(missed) > self.max_queue:
+                resync = True
+            else:
+                for event in missed:
+                    sub._offer(event)
+        self._subscribers.add(sub)
+        return sub, resync
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def close(self) -> None:
+        for sub in list(self._subscribers):
+            sub.close()
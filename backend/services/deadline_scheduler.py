@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+from datetime import datetime, time, timedelta
+from typing import Awaitable, Callable, Iterable, Optional
+
+from sanic.log import logger
+
+# Check-in cutoff of every day (see ReservationService.release_expired_checkins)
+CHECKIN_CUTOFF = time(11, 0)
+
+
+def release_deadline(start_date: datetime, end_date: datetime, cutoff: time = CHECKIN_CUTOFF) -> Optional[datetime]:
+    """First cutoff strictly inside (start_date, end_date): when the spot is released
+    if nobody checked in. None when the reservation never spans a cutoff."""
+    deadline = datetime.combine(start_date.date(), cutoff)
+    if deadline <= start_date:
+        deadline += timedelta(days=1)
+    return deadline if deadline < end_date else None
+
+
+class DeadlineScheduler:
+    """Min-heap of (deadline, reservation id), fired as they come due.
+
+    `run(handler)` sleeps until the earliest deadline (or until an earlier one
+    is scheduled), then calls `handler(cutoff, ids)` once per distinct deadline
+    with every reservation due at it. Cancelled / rescheduled entries stay in the
+    heap and are skipped when popped. Only the leader runs it (app.ctx.deadlines,
+    see run_background.deadline_loop), reloaded from the DB between runs.
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = datetime.now):
+        self._clock = clock
+        self._heap: list[tuple[datetime, int]] = []
+        self._due_at: dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._stopped = False
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._due_at)
+
+    def schedule(self, rid: int, when: datetime) -> None:
+        if self._due_at.get(rid) == when:
+            return
+        self._due_at[rid] = when
+        heapq.heappush(self._heap, (when, rid))
+        self._wakeup.set()  # run() recomputes what it sleeps on
+
+    def schedule_reservation(self, rid: int, start_date: datetime, end_date: datetime) -> None:
+        when = release_deadline(start_date, end_date)
+        if when is None:
+            self.cancel(rid)
+        else:
+            self.schedule(rid, when)
+
+    def load(self, reservations: Iterable) -> int:
+        """(id, start_date, end_date) rows; returns how many got a deadline."""
+        n = 0
+        for rid, start, end in reservations:
+            when = release_deadline(start, end)
+            if when is not None:
+                self.schedule(rid, when)
+                n += 1
+        return n
+
+    def cancel(self, rid: int) -> None:
+        self._due_at.pop(rid, None)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._due_at.clear()
+        self._wakeup.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def next_deadline(self) -> Optional[datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> list[tuple[datetime, list[int]]]:
+        """Remove and return the entries due at `now`, grouped by deadline."""
+        groups: list[tuple[datetime, list[int]]] = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return groups
+            when, rid = heapq.heappop(self._heap)
+            del self._due_at[rid]
+            if groups and groups[-1][0] == when:
+                groups[-1][1].append(rid)
+            else:
+                groups.append((when, [rid]))
+
+    def _drop_stale(self) -> None:
+        while self._heap and self._due_at.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def run(
+        self, handler: Callable[[datetime, list[int]], Awaitable[None]], until: Optional[datetime] = None
+    ) -> None:
+        """Fire the deadlines as they come due, until stop() or, when given, `until`."""
+        while not self._stopped and (until is None or self._clock() < until):
+            for when, ids in self.pop_due(self._clock()):
+                self.fired += len(ids)
+                try:
+                    await handler(when, ids)
+                except Exception as e:
+                    logger.error(f"Deadline handler failed for {len(ids)} reservations at {when}: {e}")
+
+            self._wakeup.clear()
+            nxt = self.next_deadline()
+            if until is not None and (nxt is None or until < nxt):
+                nxt = until
+            timeout = None if nxt is None else max(0.0, (nxt - self._clock()).total_seconds())
+            try:
+                # no query, no wake-up until the next deadline or a new earlier one
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable
+
+import orjson
+from sanic.log import logger
+
+from repositories.outbox_repository import OutboxRepository
+from services.change_feed import ChangeFeed
+
+# Outbox event type -> change feed event (SSE `event:` name)
+FEED_KINDS = {
+    "ReservationCreated": "reservation.created",
+    "ReservationCheckedIn": "reservation.checked_in",
+    "ReservationCancelled": "reservation.deleted",
+    "ReservationReleased": "reservation.released",
+    "ReservationSeriesCreated": "reservation_series.created",
+    "ReservationSeriesCancelled": "reservation_series.deleted",
+    "SpotUpdated": "spot.updated",
+    "SpotDeleted": "spot.deleted",
+}
+
+
+class OutboxFeedTail:
+    """Feeds a worker's ChangeFeed from the outbox table (app.ctx.feed_tail).
+
+    Every write commits its events to the outbox, so tailing the table by id
+    shows each worker the writes of every worker and host, the leader's
+    releases included. Ids follow the inserts, not the commits: an id skipped
+    by a read may belong to a transaction still running, so it is read again
+    for `gap_grace_s` (then given up: rolled back, or committed too late).
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        feed: ChangeFeed,
+        *,
+        interval_s: float = 0.5,
+        batch_size: int = 500,
+        gap_grace_s: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._session_factory = session_factory
+        self.feed = feed
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self.gap_grace_s = gap_grace_s
+        self._clock = clock
+        self.last_id = None  # starts at the end of the table: a new feed has no history
+        self._gaps: dict[int, float] = {}  # skipped id -> when it was first skipped
+        self._stopped = asyncio.Event()
+
+    async def step(self) -> int:
+        """Publish the events committed since the last step; returns how many."""
+        async with self._session_factory() as session:
+            outbox = OutboxRepository(session)
+            if self.last_id is None:
+                self.last_id = await outbox.last_id()
+                return 0
+            now = self._clock()
+            self._gaps = {i: t for i, t in self._gaps.items() if now - t < self.gap_grace_s}
+            rows = await outbox.after(self.last_id, self.batch_size, also=self._gaps)
+
+        for row in rows:
+            if self._gaps.pop(row["id"], None) is None:
+                if row["id"] - self.last_id - 1 <= self.batch_size:
+                    for skipped in range(self.last_id + 1, row["id"]):
+                        self._gaps[skipped] = now
+                self.last_id = row["id"]
+            kind = FEED_KINDS.get(row["event_type"])
+            if kind is not None:
+                data = orjson.loads(row["payload"])
+                data.pop("type", None)
+                self.feed.publish(kind, data)
+        return len(rows)
+
+    async def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                while await self.step() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Change feed tail: {e}")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sanic.log import logger
+
+from repositories.lease_repository import LeaseRepository
+
+
+def default_holder_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElector:
+    """Keeps (or competes for) a DB lease so that one process owns the background jobs.
+
+    Every worker of every host runs one; the holder renews the lease each
+    `renew_s`, the others retry at the same pace and take over once it has
+    expired (`ttl_s` after the last renewal of a dead leader). Leadership is
+    dropped locally as soon as a renewal fails, before the lease can expire.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        name: str = "background-jobs",
+        *,
+        holder: Optional[str] = None,
+        ttl_s: float = 30.0,
+        renew_s: float = 10.0,
+        clock: Callable[[], datetime] = datetime.utcnow,
+        on_elected: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        if renew_s >= ttl_s:
+            raise ValueError("renew_s must be shorter than ttl_s")
+        self._session_factory = session_factory
+        self.name = name
+        self.holder = holder or default_holder_id()
+        self.ttl_s = ttl_s
+        self.renew_s = renew_s
+        self._clock = clock
+        # called each time this process becomes the leader (e.g. to load the jobs' state)
+        self._on_elected = on_elected
+        self.is_leader = False
+        self._stopped = asyncio.Event()
+
+    async def step(self) -> bool:
+        """One acquire/renew attempt; returns the resulting leadership."""
+        try:
+            async with self._session_factory() as session:
+                leader = await LeaseRepository(session).try_acquire(
+                    self.name, self.holder, self.ttl_s, self._clock()
+                )
+        except Exception as e:
+            logger.error(f"Lease {self.name}: renewal failed: {e}")
+            leader = False
+        elected = leader and not self.is_leader
+        if leader != self.is_leader:
+            logger.info(f"Lease {self.name}: {self.holder} {'acquired' if leader else 'lost'} leadership")
+        self.is_leader = leader
+        if elected and self._on_elected is not None:
+            try:
+                await self._on_elected()
+            except Exception as e:
+                logger.error(f"Lease {self.name}: on_elected failed: {e}")
+        return leader
+
+    async def run(self) -> None:
+        while not self._stopped.is_set():
+            await self.step()
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.renew_s)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self) -> None:
+        """Stop competing and hand the lease over right away."""
+        self._stopped.set()
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                async with self._session_factory() as session:
+                    await LeaseRepository(session).release(self.name, self.holder)
+            except Exception as e:
+                logger.error(f"Lease {self.name}: release failed: {e}")
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sanic.log import logger
+
+from repositories.outbox_repository import OutboxRepository
+
+# send(messages): publish [(routing_key, body, message_id), ...], return once all are confirmed
+Send = Callable[[list], Awaitable[None]]
+
+
+class OutboxRelay:
+    """Drains the outbox table to AMQP (app.ctx.outbox_relay).
+
+    Each step reads the oldest unsent events, publishes them as one batch with
+    publisher confirms and marks them sent in one transaction. Delivery is
+    at least once: a crash between the confirms and that commit sends the batch
+    again, with the same message ids (`outbox-<id>`) for consumers to de-duplicate.
+    Only the leader relays. Events are not guaranteed to leave in commit order:
+    ids are assigned at insert, so a transaction that commits late can be relayed
+    after events with higher ids; consumers must not rely on the order. Sent
+    events are kept `retention_s`: `prune` runs from the leader's prune task
+    (run_background.py).
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        send: Send,
+        *,
+        routing_key: str,
+        batch_size: int = 500,
+        interval_s: float = 1.0,
+        retention_s: float = 7 * 24 * 3600,
+        is_active: Callable[[], bool] = lambda: True,
+        clock: Callable[[], datetime] = datetime.now,
+    ):
+        self._session_factory = session_factory
+        self._send = send
+        self.routing_key = routing_key
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self.retention_s = retention_s
+        self._is_active = is_active
+        self._clock = clock
+        self._stopped = asyncio.Event()
+        # metrics
+        self.relayed = 0
+        self.failures = 0
+        self.pruned = 0
+
+    async def step(self) -> int:
+        """Relay one batch; returns the number of events sent."""
+        async with self._session_factory() as session:
+            outbox = OutboxRepository(session)
+            batch = await outbox.next_batch(self.batch_size)
+            if not batch:
+                return 0
+            # the read transaction is not held while waiting for the broker
+            await session.commit()
+            await self._send([
+                (self.routing_key, e["payload"].encode(), f"outbox-{e['id']}") for e in batch
+            ])
+            await outbox.mark_sent([e["id"] for e in batch], self._clock())
+        self.relayed += len(batch)
+        return len(batch)
+
+    async def prune(self) -> int:
+        async with self._session_factory() as session:
+            pruned = await OutboxRepository(session).prune(
+                self._clock() - timedelta(seconds=self.retention_s)
+            )
+        self.pruned += pruned
+        return pruned
+
+    async def drain(self) -> int:
+        """Relay full batches back to back until the backlog is shorter than one batch."""
+        sent = 0
+        while True:
+            n = await self.step()
+            sent += n
+            if n < self.batch_size:
+                return sent
+
+    async def run(self) -> None:
+        while not self._stopped.is_set():
+            if self._is_active():
+                try:
+                    await self.drain()
+                except Exception as e:
+                    # left unsent: retried at the next tick
+                    self.failures += 1
+                    logger.error(f"Outbox relay: {e}")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def stats(self) -> dict:
+        async with self._session_factory() as session:
+            pending = await OutboxRepository(session).pending()
+        return {"pending": pending, "relayed": self.relayed, "failures": self.failures, "pruned": self.pruned}
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import csv
+import io
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator
+
+from utils.serialization import dumps
+
+# Column order of the CSV export (and key order of the NDJSON records)
+EXPORT_COLUMNS = (
+    "id", "spot_id", "spot_electrical", "user_id", "user_email",
+    "start_date", "end_date", "checked_in", "released_at", "created_at",
+)
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _value(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return v
+
+
+async def ndjson_chunks(rows: AsyncIterator[dict], *, rows_per_chunk: int = 500) -> AsyncIterator[bytes]:
+    """One JSON object per line, grouped `rows_per_chunk` lines per chunk."""
+    lines = []
+    async for row in rows:
+        lines.append(dumps({c: row.get(c) for c in EXPORT_COLUMNS}))
+        if len(lines) >= rows_per_chunk:
+            yield b"\n".join(lines) + b"\n"
+            lines.clear()
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def csv_chunks(rows: AsyncIterator[dict], *, rows_per_chunk: int = 500) -> AsyncIterator[bytes]:
+    """Header line, then one CSV line per row (RFC 4180 quoting)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    async for row in rows:
+        writer.writerow([_value(row.get(c)) for c in EXPORT_COLUMNS])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode()
+
+
+def export_chunks(rows: AsyncIterator[dict], fmt: str) -> AsyncIterator[bytes]:
+    if fmt == "csv":
+        return csv_chunks(rows)
+    if fmt == "ndjson":
+        return ndjson_chunks(rows)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], *, level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a chunk stream into a single gzip member, on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16 + 15: gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,17 +1,24 @@
-import json
-from datetime import datetime, timedelta
-from typing import List, Optional
-import aio_pika
+import time
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from repositories.reservation_repository import ReservationRepository
 from repositories.spot_repository import SpotRepository
 from repositories.user_repository import UserRepository
 from model.reservation import Reservation
+from model.reservation_series import ReservationSeries, parse_rrule
+from services.deadline_scheduler import CHECKIN_CUTOFF
+from model.allocation import AllocationRequest, ScoringStrategy
+from services.spot_allocator import PreferenceScoring
 from sanic.exceptions import InvalidUsage, Forbidden
 from sanic.log import logger
 
 
+# Longest span of a recurring series (first occurrence to UNTIL)
+SERIES_MAX_DAYS = 365
+
+
 def _count_working_days(start: datetime, end: datetime) -> int:
     """Count working days (Mon–Fri) between start and end, inclusive."""
     count = 0
@@ -24,25 +31,39 @@ def _count_working_days(start: datetime, end: datetime) -> int:
     return count
 
 
+def _parse_bulk_item(raw) -> tuple:
+    """(user_email, spot_id, start_date, end_date) of one bulk item; InvalidUsage when malformed."""
+    if not isinstance(raw, dict):
+        raise InvalidUsage("Each item must be an object")
+    email, spot_id = raw.get("user_email"), raw.get("spot_id")
+    if not isinstance(email, str) or not isinstance(spot_id, str) or not raw.get("start_date") or not raw.get("end_date"):
+        raise InvalidUsage("user_email, spot_id, start_date and end_date are required")
+    try:
+        start_date, end_date = (
+            v if isinstance(v, datetime) else datetime.fromisoformat(v)
+            for v in (raw["start_date"], raw["end_date"])
+        )
+    except (TypeError, ValueError):
+        raise InvalidUsage("Invalid ISO date format")
+    return email.strip().lower(), spot_id.strip().upper(), start_date, end_date
+
+
 class ReservationService:
     def __init__(self, session: AsyncSession,
                  reservation_repo: ReservationRepository,
                  spot_repo: SpotRepository,
                  user_repo: UserRepository,
-                 amqp_channel=None, hello_queue=None):
+                 scoring: Optional[ScoringStrategy] = None):
         self.session = session
         self.reservation_repo = reservation_repo
         self.spot_repo = spot_repo
         self.user_repo = user_repo
-        self.amqp_channel = amqp_channel
-        self.hello_queue = hello_queue
+        # Ranking of the free spots for auto_reserve (see app.ctx.allocator_scoring)
+        self.scoring = scoring or PreferenceScoring()
 
-    async def create_reservation(self, spot_id: str, user_email: str, start_date: datetime, end_date: datetime) -> Reservation:
-        # User checks
-        user = await self.user_repo.get_by_email(user_email)
-        if not user:
-            raise InvalidUsage("User not found")
-        
+    @staticmethod
+    def _check_period(user: dict, start_date: datetime, end_date: datetime) -> None:
+        """Date and quota rules of a booking made for `user`."""
         # Date checks
         if start_date >= end_date:
             raise InvalidUsage("Start date must be before end date")
@@ -58,42 +79,219 @@ class ReservationService:
             if working_days > 5:
                 raise Forbidden("Employees can reserve up to 5 working days (Mon–Fri) maximum")
 
+    async def create_reservation(self, spot_id: str, user_email: str, start_date: datetime, end_date: datetime) -> Reservation:
+        # User checks
+        user = await self.user_repo.get_by_email(user_email)
+        if not user:
+            raise InvalidUsage("User not found")
+
+        self._check_period(user, start_date, end_date)
+
         # Spot checks
         spot = await self.spot_repo.get(spot_id)
         if not spot:
             raise InvalidUsage("Spot not found")
 
-        # Overlap checks
+        # Overlap checks (in memory when the interval index is warm)
         has_overlap = await self.reservation_repo.has_overlap(spot_id, start_date, end_date)
         if has_overlap:
             raise InvalidUsage(f"Spot {spot_id} is already reserved for these dates")
 
-        # Create
-        reservation = await self.reservation_repo.create(spot_id, user["id"], start_date, end_date)
+        # Create (conditional insert: None if the DB saw a concurrent overlap)
+        reservation = await self.reservation_repo.create(
+            spot_id, user["id"], start_date, end_date, user_email=user["email"]
+        )
+        if reservation is None:
+            raise InvalidUsage(f"Spot {spot_id} is already reserved for these dates")
+
+        return reservation
+
+    async def auto_reserve(
+        self, user_email: str, start_date: datetime, end_date: datetime,
+        *, electrical: bool = False, preferred_row: Optional[str] = None,
+    ) -> Reservation:
+        """Book any suitable free spot for the period, picked and booked server-side in one
+        statement (the user's associated spot and `preferred_row` are favoured)."""
+        user = await self.user_repo.get_by_email(user_email)
+        if not user:
+            raise InvalidUsage("User not found")
+
+        self._check_period(user, start_date, end_date)
+        if preferred_row is not None and (len(preferred_row) != 1 or preferred_row not in "ABCDEF"):
+            raise InvalidUsage("preferred_row must be one of A..F")
 
-        # Send MQ notification
-        if self.amqp_channel and self.hello_queue:
+        request = AllocationRequest(
+            start_date=start_date, end_date=end_date, electrical=electrical,
+            preferred_row=preferred_row, associated_spot=user.get("spot_associe"),
+        )
+        reservation = await self.reservation_repo.create_any(
+            user["id"], request, self.scoring, user_email=user["email"]
+        )
+        if reservation is None:
+            raise InvalidUsage("No free spot matches these dates")
+
+        return reservation
+
+    async def create_reservations_bulk(self, items: List[dict], *, atomic: bool) -> List[dict]:
+        """
+        Book many {"user_email", "spot_id", "start_date", "end_date"} items at once
+        (ISO strings or datetimes), with the rules of `create_reservation`.
+
+        Users and spots are loaded with one query each, conflicts with the DB are
+        found with one set-based query and conflicts inside the batch in memory,
+        then every valid item is inserted in a single transaction.
+        Returns one outcome per item, in order: status "created" (with the
+        reservation), "rejected" (invalid item), "conflict", or "skipped" (valid,
+        but not written because the atomic batch failed).
+        """
+        outcomes: List[dict] = [{"index": i} for i in range(len(items))]
+        parsed: dict[int, tuple] = {}
+        for i, raw in enumerate(items):
             try:
-                msg = {
-                    "type": "ReservationCreated",
-                    "user_email": user["email"],
-                    "spot_id": spot_id,
-                    "start_date": start_date.isoformat(),
-                    "end_date": end_date.isoformat()
-                }
-                await self.amqp_channel.default_exchange.publish(
-                    aio_pika.Message(
-                        body=json.dumps(msg).encode("utf-8"),
-                        content_type="application/json",
-                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-                    ),
-                    routing_key=self.hello_queue,
+                parsed[i] = _parse_bulk_item(raw)
+            except InvalidUsage as e:
+                outcomes[i].update(status="rejected", error=str(e))
+
+        users = await self.user_repo.get_many_by_email({p[0] for p in parsed.values()})
+        spots = await self.spot_repo.get_many({p[1] for p in parsed.values()})
+
+        candidates: List[int] = []
+        for i, (email, spot_id, start_date, end_date) in parsed.items():
+            try:
+                if email not in users:
+                    raise InvalidUsage("User not found")
+                self._check_period(users[email], start_date, end_date)
+                if spot_id not in spots:
+                    raise InvalidUsage("Spot not found")
+            except (InvalidUsage, Forbidden) as e:
+                outcomes[i].update(status="rejected", error=str(e))
+                continue
+            candidates.append(i)
+
+        # Conflicts with the DB (one query) ...
+        periods = [parsed[i][1:] for i in candidates]
+        in_db = {candidates[k] for k in await self.reservation_repo.conflicts(periods)}
+        # ... and between items of the batch (first one wins)
+        accepted: dict[str, list[tuple[datetime, datetime]]] = {}
+        to_insert: List[int] = []
+        for i in candidates:
+            _email, spot_id, start_date, end_date = parsed[i]
+            taken = accepted.setdefault(spot_id, [])
+            if i in in_db or any(s < end_date and e > start_date for s, e in taken):
+                outcomes[i].update(status="conflict", error=f"Spot {spot_id} is already reserved for these dates")
+                continue
+            taken.append((start_date, end_date))
+            to_insert.append(i)
+
+        failed = len(to_insert) < len(items)
+        if atomic and failed:
+            for i in to_insert:
+                outcomes[i].update(status="skipped")
+            return outcomes
+
+        created = await self.reservation_repo.create_many(
+            [(parsed[i][1], users[parsed[i][0]]["id"], parsed[i][2], parsed[i][3]) for i in to_insert],
+            atomic=atomic,
+            emails={user["id"]: email for email, user in users.items()},
+        )
+        for i, reservation in zip(to_insert, created):
+            if reservation is None:
+                # booked concurrently since the conflict query (atomic: whole batch rolled back)
+                outcomes[i].update(
+                    status="skipped" if atomic else "conflict",
+                    error=f"Spot {parsed[i][1]} was reserved concurrently",
                 )
-            except Exception as e:
-                logger.error(f"Failed to publish MQ notification: {e}")
+                continue
+            outcomes[i].update(status="created", reservation=reservation)
+        return outcomes
+
+    async def create_series(
+        self, spot_id: str, user_email: str, start_date: datetime, end_date: datetime, rrule: str
+    ) -> ReservationSeries:
+        """
+        Recurring reservation: start_date / end_date is the first occurrence (same day),
+        repeated as `rrule` says ("FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20300630").
+        Every occurrence is a single day, within the quota of any user.
+        """
+        user = await self.user_repo.get_by_email(user_email)
+        if not user:
+            raise InvalidUsage("User not found")
+
+        if start_date >= end_date or start_date.date() != end_date.date():
+            raise InvalidUsage("An occurrence must start and end on the same day")
+        try:
+            weekdays, last_day = parse_rrule(rrule)
+            series = ReservationSeries(
+                id=None, spot_id=spot_id, user_id=user["id"], weekdays=weekdays,
+                start_time=start_date.time(), end_time=end_date.time(),
+                first_day=start_date.date(), last_day=last_day,
+            )
+        except ValueError as e:
+            raise InvalidUsage(str(e))
+        if (series.last_day - series.first_day).days > SERIES_MAX_DAYS:
+            raise Forbidden(f"A series can span {SERIES_MAX_DAYS} days maximum")
+
+        spot = await self.spot_repo.get(spot_id)
+        if not spot:
+            raise InvalidUsage("Spot not found")
+
+        created = await self.reservation_repo.create_series(series)
+        if created is None:
+            raise InvalidUsage(f"Spot {spot_id} is already reserved on some of these dates")
+        return created
+
+    async def cancel_series(self, series_id: int, user_email: str) -> bool:
+        user = await self.user_repo.get_by_email(user_email)
+        if not user:
+            raise InvalidUsage("User not found")
+
+        series = await self.reservation_repo.get_series(series_id)
+        if not series:
+            raise InvalidUsage("Series not found")
 
+        roles = user.get("roles", [])
+        if series.user_id != user["id"] and "MANAGER" not in roles and "SECRETAIRE" not in roles:
+            raise Forbidden("You can only cancel your own series")
+
+        await self.reservation_repo.delete_series(series_id)
+        return True
+
+    async def check_in_occurrence(self, series_id: int, day: date, user_email: str) -> Reservation:
+        """Check in the occurrence of `day` of a series (it becomes a reservation of its own)."""
+        user = await self.user_repo.get_by_email(user_email)
+        if not user:
+            raise InvalidUsage("User not found")
+
+        series = await self.reservation_repo.get_series(series_id)
+        if not series or not series.first_day <= day <= series.last_day or not series.weekdays >> day.weekday() & 1:
+            raise InvalidUsage("Reservation not found")
+        if series.user_id != user["id"] and "SECRETAIRE" not in user.get("roles", []):
+            raise Forbidden("You can only check-in your own reservation")
+
+        reservation = await self.reservation_repo.check_in_occurrence(series, day)
+        if reservation is None:
+            raise InvalidUsage("This occurrence was already checked in or released")
         return reservation
 
+    async def qr_check_in(self, spot_id: str, user_email: str, now: datetime) -> tuple[Reservation, bool]:
+        """Check in the user's reservation of `spot_id` for today (QR code scan).
+        Returns (reservation, already_checked_in)."""
+        user = await self.user_repo.get_by_email(user_email)
+        reservation = user and await self.reservation_repo.find_on_spot(user["id"], spot_id, now.date())
+        if not reservation:
+            raise Forbidden("No active reservation found for this spot today")
+        if reservation.checked_in:
+            return reservation, True
+        if reservation.id is None:
+            # occurrence of a series, not stored yet
+            series = await self.reservation_repo.get_series(reservation.series_id)
+            checked_in = series and await self.reservation_repo.check_in_occurrence(series, reservation.start_date.date())
+            if checked_in is None:
+                raise InvalidUsage("This occurrence was already checked in or released")
+            return checked_in, False
+        # found among the user's own reservations: no ownership check left
+        return await self.reservation_repo.check_in(reservation.id), False
+
     async def check_in(self, reservation_id: int, user_email: str) -> Optional[Reservation]:
         user = await self.user_repo.get_by_email(user_email)
         if not user:
@@ -129,16 +327,20 @@ class ReservationService:
         await self.reservation_repo.delete(reservation_id)
         return True
 
-    async def release_expired_checkins(self):
-        # Everything starting today that is not checked-in by 11 AM will have its end_date set to Now
+    async def release_expired_checkins(self) -> dict:
+        """Release today's reservations not checked in by 11 AM; returns {"released", "duration_ms"}."""
         now = datetime.now()
-        # If today is after 11AM
-        if now.hour >= 11:
-            # We want to cancel any reservation that started today (or earlier) and is not checked in
-            cutoff = now.replace(hour=11, minute=0, second=0, microsecond=0)
-            released_count = await self.reservation_repo.release_unchecked(cutoff)
-            logger.info(f"Released {released_count} unchecked reservations")
-        return 0
+        # Reservations still running at 11:00 without check-in end at 11:00
+        cutoff = datetime.combine(now.date(), CHECKIN_CUTOFF)
+        # Nothing to release before 11AM
+        if now < cutoff:
+            return {"released": 0, "duration_ms": 0.0}
+        t0 = time.perf_counter()
+        released_count = await self.reservation_repo.release_unchecked(cutoff)
+        released_count += await self.reservation_repo.release_series_occurrences(cutoff)
+        duration_ms = round((time.perf_counter() - t0) * 1000, 1)
+        logger.info(f"Released {released_count} unchecked reservations in {duration_ms} ms")
+        return {"released": released_count, "duration_ms": duration_ms}
 
     async def get_my_reservations(self, user_email: str) -> List[Reservation]:
         user = await self.user_repo.get_by_email(user_email)
@@ -148,6 +350,16 @@ class ReservationService:
 
     async def list_all(self) -> List[Reservation]:
         return await self.reservation_repo.list_all()
+
+    async def list_page(self, *, limit: int, after_id: Optional[int] = None, **filters) -> List[Reservation]:
+        """Filters: start_date / end_date (overlap), user_id, spot_id."""
+        return await self.reservation_repo.list_page(limit=limit, after_id=after_id, **filters)
+
+    def iter_all(self, **filters) -> AsyncIterator[Reservation]:
+        return self.reservation_repo.iter_all(**filters)
+
+    def export_rows(self, *, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> AsyncIterator[dict]:
+        return self.reservation_repo.iter_export(start_date=start_date, end_date=end_date)
     
     async def list_active(self, start_date: datetime, end_date: datetime) -> List[Reservation]:
         return await self.reservation_repo.list_by_date_range(start_date, end_date)
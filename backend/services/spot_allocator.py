@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import List
+
+from sqlalchemy import Table, case, literal
+
+from model.allocation import AllocationRequest, ScoringStrategy
+
+
+class FirstFitScoring:
+    """Lowest spot id first."""
+
+    name = "first_fit"
+
+    def order_by(self, spots: Table, request: AllocationRequest) -> List:
+        return [spots.c.id]
+
+
+class PreferenceScoring:
+    """The user's associated spot first, then their preferred row, and the charging
+    spots last for those who do not need one (kept for electric cars)."""
+
+    name = "preference"
+
+    def order_by(self, spots: Table, request: AllocationRequest) -> List:
+        score = literal(0)
+        if request.associated_spot:
+            score = score + case((spots.c.id == request.associated_spot, 0), else_=1000)
+        if request.preferred_row:
+            score = score + case((spots.c.id.startswith(request.preferred_row), 0), else_=100)
+        if not request.electrical:
+            score = score + case((spots.c.electrical.is_(True), 10), else_=0)
+        return [score, spots.c.id]
+
+
+SCORING_STRATEGIES = {s.name: s for s in (PreferenceScoring, FirstFitScoring)}
+
+
+def make_scoring(name: str) -> ScoringStrategy:
+    try:
+        return SCORING_STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown scoring strategy: {name} (expected one of {', '.join(SCORING_STRATEGIES)})")
@@ -1,9 +1,31 @@
 from __future__ import annotations
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 from typing import Optional
 
 from repositories.spot_repository import SpotRepository
 
+_DAY = timedelta(days=1)
+
+
+def _day_mask(window_start: datetime, n_days: int, start: datetime, end: datetime) -> int:
+    """Bitset of the days (bit i = window day i) touched by the half-open range [start, end)."""
+    lo = max(0, (start - window_start) // _DAY)
+    hi = min(n_days, -((window_start - end) // _DAY))  # ceil, exclusive
+    if hi <= lo:
+        return 0
+    return ((1 << (hi - lo)) - 1) << lo
+
+
+def _weekday_masks(day_from: date, n_days: int) -> list[int]:
+    """Bitset of the window days falling on each weekday (index 0 = Monday)."""
+    masks = [0] * 7
+    for i in range(min(7, n_days)):
+        week = 0
+        for k in range(i, n_days, 7):
+            week |= 1 << k
+        masks[(day_from.weekday() + i) % 7] = week
+    return masks
+
 
 class SpotService:
     def __init__(self, spot_repo: SpotRepository):
@@ -18,6 +40,12 @@ class SpotService:
     async def list_spots(self):
         return await self.spot_repo.list()
 
+    async def list_spots_page(self, *, limit: int, after_id: Optional[str] = None, electrical: Optional[bool] = None):
+        return await self.spot_repo.list_page(limit=limit, after_id=after_id, electrical=electrical)
+
+    def iter_spots(self, *, electrical: Optional[bool] = None):
+        return self.spot_repo.iter_all(electrical=electrical)
+
     async def update_spot(
         self,
         spot_id: str,
@@ -40,3 +68,59 @@ class SpotService:
 
     async def list_available(self, *, electrical_required: bool = False):
         return await self.spot_repo.list_available(electrical_required=electrical_required)
+
+    async def availability_matrix(self, day_from: date, day_to: date, *, electrical_required: bool = False) -> dict:
+        """Spot x day occupancy for [day_from, day_to] (inclusive), one "occupied" string per spot."""
+        window_start = datetime.combine(day_from, time.min)
+        n_days = (day_to - day_from).days + 1
+        rows = await self.spot_repo.list_with_reservations(
+            window_start, window_start + n_days * _DAY, electrical_required=electrical_required
+        )
+
+        masks: dict[str, int] = {}
+        electrical: dict[str, bool] = {}
+        materialized: dict[int, int] = {}  # series id -> days having a row of their own
+        for r in rows:
+            spot_id = r["id"]
+            electrical[spot_id] = r["electrical"]
+            mask = masks.get(spot_id, 0)
+            if r["start_date"] is not None:
+                mask |= _day_mask(window_start, n_days, r["start_date"], r["end_date"])
+                if r["series_id"] is not None:
+                    day = (r["start_date"] - window_start) // _DAY
+                    if 0 <= day < n_days:
+                        materialized[r["series_id"]] = materialized.get(r["series_id"], 0) | 1 << day
+            masks[spot_id] = mask
+
+        # Series occurrences: their weekdays within [first_day, last_day], except the
+        # days whose occurrence has a row (already counted above, or released)
+        weekdays = _weekday_masks(day_from, n_days)
+        for s in await self.spot_repo.list_series_between(day_from, day_to, electrical_required=electrical_required):
+            if s["spot_id"] not in masks:
+                continue
+            pattern = 0
+            for w in range(7):
+                if s["weekdays"] >> w & 1:
+                    pattern |= weekdays[w]
+            span = _day_mask(
+                window_start, n_days,
+                datetime.combine(s["first_day"], time.min), datetime.combine(s["last_day"], time.min) + _DAY,
+            )
+            masks[s["spot_id"]] |= pattern & span & ~materialized.get(s["id"], 0)
+
+        return {
+            "from": day_from.isoformat(),
+            "to": day_to.isoformat(),
+            "days": [(day_from + i * _DAY).isoformat() for i in range(n_days)],
+            "spots": [
+                {
+                    "id": spot_id,
+                    "electrical": electrical[spot_id],
+                    # day i -> character i ("1" = occupied). The bitset itself is not sent:
+                    # beyond 53 days it no longer fits a JavaScript number
+                    "occupied": format(mask, f"0{n_days}b")[::-1],
+                    "free": mask == 0,
+                }
+                for spot_id, mask in masks.items()
+            ],
+        }
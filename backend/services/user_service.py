@@ -18,6 +18,12 @@ class UserService:
     async def list_users(self):
         return await self.user_repo.list()
 
+    async def list_users_page(self, *, limit: int, after_id: Optional[int] = None, spot_associe: Optional[str] = None):
+        return await self.user_repo.list_page(limit=limit, after_id=after_id, spot_associe=spot_associe)
+
+    def iter_users(self, *, spot_associe: Optional[str] = None):
+        return self.user_repo.iter_all(spot_associe=spot_associe)
+
     async def update_user(self, user_id: int, *, nom=None, prenom=None, email=None, spot_associe=None):
         return await self.user_repo.update_user(user_id, nom=nom, prenom=prenom, email=email, spot_associe=spot_associe)
 
@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+from typing import Optional
+
+import pytest
+
+from utils.query_stats import QueryStats, collect
+
+
+class QueryBudget:
+    """SQL statement budgets, checked on a block of code or on one HTTP request.
+
+        with query_budget(3, repeats=0):      # at most 3 statements, no statement text twice
+            await repo.something()
+
+        req, res = await client.get("/reservations/me", headers=...)
+        query_budget.check(req, 4, repeats=0)  # the statements of that request only
+
+    Statements are counted on the engines of db.make_engine (create_app), and on
+    any other engine passed to utils.query_stats.track_queries.
+    """
+
+    @contextmanager
+    def __call__(self, max_queries: int, *, repeats: Optional[int] = None):
+        with collect() as stats:
+            yield stats
+        self.check(stats, max_queries, repeats=repeats)
+
+    @staticmethod
+    def check(stats, max_queries: int, *, repeats: Optional[int] = None) -> QueryStats:
+        if not isinstance(stats, QueryStats):
+            stats = stats.ctx.queries  # a request that went through the metrics middleware
+        detail = "\n".join(stats.report())
+        assert stats.count <= max_queries, f"{stats.count} SQL statements, budget {max_queries}:\n{detail}"
+        if repeats is not None:
+            assert stats.repeated <= repeats, f"{stats.repeated} repeated SQL statements, budget {repeats}:\n{detail}"
+        return stats
+
+
+@pytest.fixture
+def query_budget():
+    return QueryBudget()
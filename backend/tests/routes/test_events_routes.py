@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from tests.routes._app_factory import make_test_app
+
+from routes.events_controller import bp_events
+from services.change_feed import ChangeFeed
+
+
+HEADERS = {"X-User-Id": "1", "X-User-Roles": "EMPLOYEE", "X-User-Email": "test@company.com"}
+
+
+@pytest.fixture
+def app():
+    app = make_test_app()
+    app.blueprint(bp_events)
+    app.ctx.change_feed = ChangeFeed(history=3)
+    return app
+
+
+def _events(body: str):
+    blocks = [b for b in body.split("\n\n") if b.startswith("id:")]
+    return [dict(line.split(": ", 1) for line in b.splitlines()) for b in blocks]
+
+
+@pytest.mark.asyncio
+async def test_stream_requires_auth(app):
+    async with app.asgi_client as client:
+        _req, res = await client.get("/events/stream")
+        assert res.status == 401
+
+
+@pytest.mark.asyncio
+async def test_stream_replays_since_and_follows_live_events(app):
+    feed = app.ctx.change_feed
+    feed.publish("spot.updated", {"id": "A01"})
+    feed.publish("spot.updated", {"id": "A02"})
+
+    async def live():
+        await asyncio.sleep(0.1)
+        feed.publish("reservation.created", {"id": 7})
+        feed.close()
+
+    async with app.asgi_client as client:
+        task = asyncio.create_task(live())
+        _req, res = await client.get("/events/stream?since=1", headers=HEADERS)
+        await task
+
+    assert res.status == 200
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = _events(res.text)
+    assert [(e["id"], e["event"]) for e in events] == [
+        (f"{feed.epoch}-2", "spot.updated"), (f"{feed.epoch}-3", "reservation.created"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stream_asks_for_resync_when_history_is_gone(app):
+    feed = app.ctx.change_feed
+    for i in range(5):
+        feed.publish("spot.updated", {"id": i})
+
+    async def stop():
+        await asyncio.sleep(0.1)
+        feed.close()
+
+    async with app.asgi_client as client:
+        task = asyncio.create_task(stop())
+        _req, res = await client.get("/events/stream", headers={**HEADERS, "Last-Event-ID": "1"})
+        await task
+
+    events = _events(res.text)
+    assert [e["event"] for e in events] == ["resync"]
+
+
+@pytest.mark.asyncio
+async def test_stream_asks_for_resync_when_the_id_comes_from_another_feed(app):
+    feed = app.ctx.change_feed
+    feed.publish("spot.updated", {"id": "A01"})
+    feed.publish("spot.updated", {"id": "A02"})
+
+    async def stop():
+        await asyncio.sleep(0.1)
+        feed.close()
+
+    async with app.asgi_client as client:
+        task = asyncio.create_task(stop())
+        # version 1 exists here too, but it was another worker's version 1
+        _req, res = await client.get("/events/stream", headers={**HEADERS, "Last-Event-ID": "0badf00d-1"})
+        await task
+
+    events = _events(res.text)
+    assert [(e["event"], e["data"]) for e in events] == [("resync", '{"reason":"epoch"}')]
+
+
+@pytest.mark.asyncio
+async def test_stream_rejects_bad_since(app):
+    async with app.asgi_client as client:
+        _req, res = await client.get("/events/stream?since=abc", headers=HEADERS)
+        assert res.status == 400
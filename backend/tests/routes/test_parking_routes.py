@@ -6,7 +6,9 @@ import routes.parking_controller as parking_ctrl
 
 
 class DummyParkingRepository:
-    def __init__(self, _session):
+    view_age = None
+
+    def __init__(self, _session, **_kwargs):
         pass
 
 
@@ -59,6 +61,20 @@ async def test_parking_view_ok_for_manager(app):
         assert "occupation_rate" in res.json
 
 
+@pytest.mark.asyncio
+async def test_parking_view_reports_snapshot_age(app, monkeypatch):
+    headers = {"X-User-Id": "2", "X-User-Roles": "MANAGER", "X-User-Email": "manager@company.com"}
+    async with app.asgi_client as client:
+        # counted in the DB (e.g. on the replica): no snapshot, no age
+        _req, res = await client.get("/parking/view", headers=headers)
+        assert res.status == 200 and "X-Snapshot-Age" not in res.headers
+
+        monkeypatch.setattr(DummyParkingRepository, "view_age", 1.5)
+        _req, res = await client.get("/parking/view", headers=headers)
+        assert res.status == 200
+        assert res.headers["X-Snapshot-Age"] == "1.500"
+
+
 @pytest.mark.asyncio
 async def test_parking_config_requires_secretary(app):
     headers = {"X-User-Id": "2", "X-User-Roles": "MANAGER", "X-User-Email": "manager@company.com"}
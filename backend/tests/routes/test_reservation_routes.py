@@ -40,7 +40,7 @@ class DummySpot:
         self.free = True
 
 class DummyUserRepository:
-    def __init__(self, _session): pass
+    def __init__(self, _session, **_kwargs): pass
     async def get_by_email(self, email):
         if email == "emp@test.com":
             return DummyUser(1, "emp@test.com", {"EMPLOYEE"})
@@ -51,21 +51,21 @@ class DummyUserRepository:
         return None
 
 class DummySpotRepository:
-    def __init__(self, _session): pass
+    def __init__(self, _session, **_kwargs): pass
     async def get(self, sid):
         if sid == "A01":
             return DummySpot("A01")
         return None
 
 class DummyReservationRepository:
-    def __init__(self, _session): pass
+    def __init__(self, _session, **_kwargs): pass
     async def has_overlap(self, spot_id, start, end):
         # Pour simplifier, A01 est bloqué du 1 au 10 janvier par défaut si on teste l'overlap
         if spot_id == "A01" and start.year == 2010:
             return True
         return False
         
-    async def create(self, spot_id, user_id, start, end):
+    async def create(self, spot_id, user_id, start, end, *, user_email=None):
         return Reservation(
             id=1, spot_id=spot_id, user_id=user_id, start_date=start, end_date=end, checked_in=False
         )
@@ -73,6 +73,10 @@ class DummyReservationRepository:
     async def release_unchecked(self, cutoff):
         return 1
 
+    async def iter_export(self, *, start_date=None, end_date=None):
+        DummyReservationRepository.last_export_args = {"start_date": start_date, "end_date": end_date}
+        yield {"id": 1, "spot_id": "A01", "user_email": "emp@test.com", "start_date": datetime(2030, 1, 1, 8)}
+
 # --- Patched Application ---
 @pytest.fixture
 def app(monkeypatch):
@@ -157,3 +161,24 @@ async def test_overlap_prevention(app):
         })
         assert res.status == 400
         assert "already reserved" in res.json.get("error", "")
+
+
+@pytest.mark.asyncio
+async def test_export_csv_as_attachment(app):
+    headers = {"X-User-Id": "2", "X-User-Roles": "MANAGER", "X-User-Email": "man@test.com"}
+    async with app.asgi_client as client:
+        _, res = await client.get("/reservations/export?format=csv&from=2030-01-01", headers=headers)
+        assert res.status == 200
+        assert res.headers["content-type"].startswith("text/csv")
+        assert res.headers["content-disposition"].endswith('.csv"')
+        header, row = res.text.splitlines()
+        assert header.startswith("id,spot_id,")
+        assert row.startswith("1,A01,,,emp@test.com,2030-01-01T08:00:00")
+        assert DummyReservationRepository.last_export_args["start_date"] == datetime(2030, 1, 1)
+
+        _, res = await client.get("/reservations/export?format=xml", headers=headers)
+        assert res.status == 400
+
+        headers["X-User-Roles"] = "EMPLOYEE"
+        _, res = await client.get("/reservations/export", headers=headers)
+        assert res.status == 403
@@ -4,10 +4,11 @@ from datetime import datetime
 from tests.routes._app_factory import make_test_app
 
 import routes.spots_controller as spots_ctrl
+from routes.pagination import decode_cursor, encode_cursor
 
 
 class DummySpotRepository:
-    def __init__(self, _session):
+    def __init__(self, _session, **_kwargs):
         pass
 
 
@@ -16,6 +17,7 @@ class DummySpotService:
     list_return = [{"id": "A01"}, {"id": "B01"}]
     available_return = [{"id": "A01"}]
     last_available_args = None
+    last_page_args = None
 
     def __init__(self, _repo):
         pass
@@ -24,9 +26,27 @@ class DummySpotService:
         DummySpotService.last_available_args = {"electrical_required": electrical_required}
         return self.available_return
 
+    async def availability_matrix(self, day_from, day_to, *, electrical_required: bool = False):
+        DummySpotService.last_available_args = {
+            "from": day_from, "to": day_to, "electrical_required": electrical_required
+        }
+        return {"from": day_from.isoformat(), "to": day_to.isoformat(), "spots": [{"id": "A01", "occupied": "01"}]}
+
     async def list_spots(self):
         return self.list_return
 
+    async def list_spots_page(self, *, limit, after_id=None, electrical=None):
+        DummySpotService.last_page_args = {"limit": limit, "after_id": after_id, "electrical": electrical}
+        rows = [s for s in self.list_return if after_id is None or s["id"] > after_id]
+        return rows[: limit + 1]
+
+    async def _iter(self):
+        for s in self.list_return:
+            yield s
+
+    def iter_spots(self, *, electrical=None):
+        return self._iter()
+
     async def get_spot(self, spot_id: str):
         if spot_id == "ZZ99":
             return None
@@ -102,3 +122,70 @@ async def test_spots_create_ok_for_secretary(app):
         _req, res = await client.post("/spots", headers=headers, json={"id": "a01", "electrical": True, "is_free": True})
         assert res.status in (200, 201)
         assert res.json["id"] == "A01"
+
+
+@pytest.mark.asyncio
+async def test_spots_availability_ok(app):
+    headers = {"X-User-Id": "1", "X-User-Roles": "EMPLOYEE", "X-User-Email": "test@company.com"}
+    async with app.asgi_client as client:
+        _req, res = await client.get(
+            "/spots/availability?from=2030-01-07&to=2030-01-08&electrical_required=true", headers=headers
+        )
+        assert res.status == 200
+        assert res.json["spots"] == [{"id": "A01", "occupied": "01"}]
+        assert DummySpotService.last_available_args["electrical_required"] is True
+
+
+@pytest.mark.asyncio
+async def test_spots_availability_validates_window(app):
+    headers = {"X-User-Id": "1", "X-User-Roles": "EMPLOYEE", "X-User-Email": "test@company.com"}
+    async with app.asgi_client as client:
+        _req, res = await client.get("/spots/availability?from=2030-01-07", headers=headers)
+        assert res.status == 400
+        _req, res = await client.get("/spots/availability?from=2030-01-08&to=2030-01-07", headers=headers)
+        assert res.status == 400
+        _req, res = await client.get("/spots/availability?from=2030-01-01&to=2030-12-31", headers=headers)
+        assert res.status == 400
+
+
+@pytest.mark.asyncio
+async def test_spots_list_keyset_pages(app):
+    headers = {"X-User-Id": "99", "X-User-Roles": "SECRETAIRE", "X-User-Email": "secretaire@company.com"}
+    async with app.asgi_client as client:
+        _req, res = await client.get("/spots/?limit=1&electrical=true", headers=headers)
+        assert res.status == 200
+        assert res.json["items"] == [{"id": "A01"}]
+        assert DummySpotService.last_page_args["electrical"] is True
+
+        _req, res = await client.get(f"/spots/?limit=1&cursor={res.json['next_cursor']}", headers=headers)
+        assert res.json == {"items": [{"id": "B01"}], "next_cursor": None}
+        assert DummySpotService.last_page_args["after_id"] == "A01"
+
+        _req, res = await client.get("/spots/?cursor=%%%", headers=headers)
+        assert res.status == 400
+        # well-formed, but not a spot id
+        for key in (7, ["A01"]):
+            _req, res = await client.get(f"/spots/?cursor={encode_cursor(key)}", headers=headers)
+            assert res.status == 400
+        _req, res = await client.get("/spots/?limit=0", headers=headers)
+        assert res.status == 400
+
+
+def test_integer_cursors_reject_other_keys():
+    from sanic.exceptions import InvalidUsage
+
+    assert decode_cursor(encode_cursor(42)) == 42
+    for key in ("42", True, [1, 2], {"id": 1}, None):
+        with pytest.raises(InvalidUsage):
+            decode_cursor(encode_cursor(key))
+
+
+@pytest.mark.asyncio
+async def test_spots_list_stream_keeps_the_plain_list_body(app):
+    headers = {"X-User-Id": "99", "X-User-Roles": "SECRETAIRE", "X-User-Email": "secretaire@company.com"}
+    async with app.asgi_client as client:
+        _req, res = await client.get("/spots/?stream=1", headers=headers)
+        assert res.status == 200
+        assert res.json == [{"id": "A01"}, {"id": "B01"}]
+        _req, res = await client.get("/spots/", headers=headers)
+        assert res.json == [{"id": "A01"}, {"id": "B01"}]
@@ -8,7 +8,7 @@ import routes.users_controller as users_ctrl
 # -------------------- DUMMIES --------------------
 
 class DummyUserRepository:
-    def __init__(self, _session):
+    def __init__(self, _session, **_kwargs):
         pass
 
     async def get_roles(self, user_id: int):
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import aio_pika
+import pytest
+
+from services.amqp_consumer import AmqpConsumer, Poison
+
+
+class InMemoryBroker:
+    """Queues, prefetch and (cumulative) acks of one AMQP channel, in process."""
+
+    def __init__(self):
+        self.queues: dict[str, deque] = {}
+        self.channels = []
+
+    def put(self, queue: str, body: bytes, message_id: str = None, headers=None) -> None:
+        self.queues.setdefault(queue, deque()).append(
+            aio_pika.Message(body=body, message_id=message_id, headers=headers or {})
+        )
+        for channel in self.channels:
+            channel.pump()
+
+    def channel(self) -> "MemoryChannel":
+        channel = MemoryChannel(self)
+        self.channels.append(channel)
+        return channel
+
+
+class MemoryExchange:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def publish(self, message, routing_key):
+        self.broker.put(routing_key, message.body, message.message_id, message.headers)
+
+
+class MemoryQueue:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+
+    async def consume(self, callback):
+        tag = f"ctag-{len(self.channel.consumers) + 1}"
+        self.channel.consumers[tag] = (self.name, callback)
+        self.channel.pump()
+        return tag
+
+    async def cancel(self, tag):
+        self.channel.consumers.pop(tag, None)
+
+
+class MemoryMessage:
+    def __init__(self, channel, tag, queue, message):
+        self.channel = channel
+        self.delivery_tag = tag
+        self.queue = queue
+        self.body = message.body
+        self.message_id = message.message_id
+        self.headers = message.headers
+        self.content_type = "application/json"
+        self._message = message
+
+    async def ack(self, multiple=False):
+        self.channel.settle(self.delivery_tag, multiple)
+
+    async def reject(self, requeue=False):
+        self.channel.settle(self.delivery_tag, False, requeue=requeue)
+
+
+class MemoryChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.default_exchange = MemoryExchange(broker)
+        self.prefetch = 0
+        self.consumers = {}
+        self.unacked: dict[int, MemoryMessage] = {}
+        self.next_tag = 0
+        self.ack_calls = 0
+        self.max_unacked = 0
+
+    async def set_qos(self, prefetch_count):
+        self.prefetch = prefetch_count
+
+    async def declare_queue(self, name, durable=False):
+        self.broker.queues.setdefault(name, deque())
+        return MemoryQueue(self, name)
+
+    def pump(self) -> None:
+        for name, callback in list(self.consumers.values()):
+            queue = self.broker.queues.get(name)
+            while queue and (not self.prefetch or len(self.unacked) < self.prefetch):
+                self.next_tag += 1
+                message = MemoryMessage(self, self.next_tag, name, queue.popleft())
+                self.unacked[message.delivery_tag] = message
+                self.max_unacked = max(self.max_unacked, len(self.unacked))
+                asyncio.get_running_loop().create_task(callback(message))  # as aio_pika does
+
+    def settle(self, tag, multiple, requeue=None) -> None:
+        if tag not in self.unacked:
+            raise RuntimeError(f"PRECONDITION_FAILED - unknown delivery tag {tag}")
+        tags = [t for t in self.unacked if t <= tag] if multiple else [tag]
+        for t in tags:
+            message = self.unacked.pop(t)
+            if requeue:
+                self.broker.queues[message.queue].appendleft(message._message)
+        if requeue is None:
+            self.ack_calls += 1
+        self.pump()
+
+    def close(self) -> None:
+        # unacked messages go back to their queue
+        self.consumers.clear()
+        for tag in sorted(self.unacked, reverse=True):
+            message = self.unacked.pop(tag)
+            self.broker.queues[message.queue].appendleft(message._message)
+
+
+def _event(event_type, n, published_at=None):
+    headers = {"x-published-at": published_at} if published_at else None
+    return json.dumps({"type": event_type, "n": n}).encode(), f"m{n}", headers
+
+
+async def _until(predicate, timeout=2.0):
+    async def wait():
+        while not predicate():
+            await asyncio.sleep(0.001)
+    await asyncio.wait_for(wait(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_dispatches_by_type_within_prefetch_and_concurrency():
+    broker = InMemoryBroker()
+    channel = broker.channel()
+    seen, running = {"HelloCreated": [], "ReservationCreated": []}, {"now": 0, "max": 0}
+
+    def handler(event_type):
+        async def handle(event):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.001)
+            seen[event_type].append(event["n"])
+            running["now"] -= 1
+        return handle
+
+    consumer = AmqpConsumer(channel, "q", {t: handler(t) for t in seen}, prefetch=20, concurrency=4, ack_batch=10)
+    for n in range(200):
+        broker.put("q", *_event("HelloCreated" if n % 2 else "ReservationCreated", n, time.time()))
+    await consumer.start()
+    await _until(lambda: consumer.acked == 200)
+
+    assert sorted(seen["HelloCreated"]) == list(range(1, 200, 2))
+    assert sorted(seen["ReservationCreated"]) == list(range(0, 200, 2))
+    assert channel.max_unacked <= 20 and running["max"] <= 4
+    assert channel.ack_calls <= 200 // 10 + 5  # cumulative acks, not one per message
+    stats = consumer.stats()
+    assert stats["handled"] == 200 and stats["throughput_per_s"] > 0 and stats["lag_ms_p50"] is not None
+    await consumer.stop()
+
+
+@pytest.mark.asyncio
+async def test_poison_messages_go_to_the_dead_letter_queue():
+    broker = InMemoryBroker()
+    calls = {"flaky": 0}
+
+    async def flaky(event):
+        calls["flaky"] += 1
+        raise ConnectionError("downstream unavailable")
+
+    async def reject(event):
+        raise Poison("bad spot id")
+
+    async def ok(event):
+        pass
+
+    consumer = AmqpConsumer(
+        broker.channel(), "q", {"Flaky": flaky, "Bad": reject, "Ok": ok},
+        ack_batch=1, max_attempts=3, backoff_base_s=0.001,
+    )
+    broker.put("q", b"{not json", "m0")
+    broker.put("q", *_event("Flaky", 1))
+    broker.put("q", *_event("Bad", 2))
+    broker.put("q", *_event("Unknown", 3))
+    broker.put("q", *_event("Ok", 4))
+    await consumer.start()
+    await _until(lambda: consumer.acked == 5)
+
+    dlq = broker.queues["q.dlq"]
+    assert sorted(m.message_id for m in dlq) == ["m0", "m1", "m2"]
+    assert all(m.headers["x-original-queue"] == "q" and m.headers["x-error"] for m in dlq)
+    assert calls["flaky"] == 3 and consumer.retries == 2
+    assert consumer.dead_lettered == 3 and consumer.skipped == 1
+    assert not broker.queues["q"]
+    await consumer.stop()
+
+
+@pytest.mark.asyncio
+async def test_acks_never_pass_a_message_still_running():
+    broker = InMemoryBroker()
+    channel = broker.channel()
+    release = asyncio.Event()
+
+    async def handle(event):
+        if event["n"] == 0:
+            await release.wait()
+
+    consumer = AmqpConsumer(channel, "q", {"E": handle}, ack_batch=1, ack_interval_s=0.001)
+    for n in range(5):
+        broker.put("q", *_event("E", n))
+    await consumer.start()
+    await _until(lambda: consumer.handled == 4)
+    await asyncio.sleep(0.01)
+    assert consumer.acked == 0 and len(channel.unacked) == 5
+
+    release.set()
+    await _until(lambda: consumer.acked == 5)
+    assert not channel.unacked
+    await consumer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_drains_running_handlers_and_leaves_the_rest_for_redelivery():
+    broker = InMemoryBroker()
+    channel = broker.channel()
+    done = []
+
+    async def handle(event):
+        await asyncio.sleep(0.05 if event["n"] < 2 else 10)
+        done.append(event["n"])
+
+    consumer = AmqpConsumer(channel, "q", {"E": handle}, prefetch=3, concurrency=3, ack_batch=3)
+    for n in range(5):
+        broker.put("q", *_event("E", n))
+    await consumer.start()
+    await _until(lambda: consumer.received == 3)
+    await consumer.stop(timeout_s=0.2)
+
+    # the two quick handlers finished and were acked; the stuck one was cancelled, unacked
+    assert sorted(done) == [0, 1] and consumer.acked == 2
+    assert [m.message_id for m in channel.unacked.values()] == ["m2"]
+    channel.close()
+    assert [m.message_id for m in broker.queues["q"]] == ["m2", "m3", "m4"]
+
+
+def test_ack_batch_cannot_exceed_prefetch():
+    with pytest.raises(ValueError):
+        AmqpConsumer(InMemoryBroker().channel(), "q", {}, prefetch=10, ack_batch=20)
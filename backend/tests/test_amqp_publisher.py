@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pytest
+
+from services.amqp_publisher import BLOCK, SPILL, AmqpPublisher, PublisherOverloaded
+
+
+class FakeExchange:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def publish(self, message, routing_key):
+        if self.broker.failures > 0:
+            self.broker.failures -= 1
+            raise ConnectionError("broker down")
+        await asyncio.sleep(0)  # the confirm
+        self.broker.delivered.append((routing_key, json.loads(message.body), message.message_id))
+
+
+class FakeChannel:
+    def __init__(self, broker):
+        self.default_exchange = FakeExchange(broker)
+        self.is_closed = False
+
+
+class FakeBroker:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.delivered = []
+        self.channels = 0
+
+    async def channel(self):
+        self.channels += 1
+        return FakeChannel(self)
+
+
+async def _until(predicate, timeout=2.0):
+    async def wait():
+        while not predicate():
+            await asyncio.sleep(0.001)
+    await asyncio.wait_for(wait(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_publishes_in_batches_over_one_channel(tmp_path):
+    broker = FakeBroker()
+    publisher = AmqpPublisher(broker.channel, batch_size=100, spill_path=str(tmp_path / "spill"))
+    task = asyncio.create_task(publisher.run())
+    for i in range(250):
+        await publisher.publish("hello.queue", {"n": i})
+    await _until(lambda: len(broker.delivered) == 250)
+
+    assert [body["n"] for _key, body, _id in broker.delivered] == list(range(250))
+    assert broker.channels == 1
+    stats = publisher.stats()
+    assert stats["published"] == 250 and stats["queue_depth"] == 0 and stats["confirm_ms_p50"] is not None
+    await publisher.stop()
+    await asyncio.sleep(0)
+    assert task.cancelled() or task.done()
+
+
+@pytest.mark.asyncio
+async def test_unconfirmed_batches_are_retried_with_backoff(tmp_path):
+    broker = FakeBroker(failures=3)
+    publisher = AmqpPublisher(broker.channel, backoff_base_s=0.001, spill_path=str(tmp_path / "spill"))
+    task = asyncio.create_task(publisher.run())
+    await publisher.publish("q", {"n": 1})
+    await _until(lambda: broker.delivered)
+
+    assert publisher.retries == 3 and broker.channels == 4  # the channel is reopened each time
+    await publisher.stop()
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_overflow_spills_to_disk_and_is_replayed(tmp_path):
+    spill = tmp_path / "spill.ndjson"
+    broker = FakeBroker()
+    publisher = AmqpPublisher(broker.channel, max_queue=2, overflow=SPILL, spill_path=str(spill))
+    for i in range(5):
+        await publisher.publish("q", {"n": i})  # never blocks the caller
+    assert publisher.stats()["spilled"] == 3 and len(spill.read_text().splitlines()) == 3
+
+    task = asyncio.create_task(publisher.run())
+    await _until(lambda: len(broker.delivered) == 5)
+    assert sorted(body["n"] for _key, body, _id in broker.delivered) == list(range(5))
+    assert not spill.exists()
+    await publisher.stop()
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_block_policy_applies_backpressure():
+    publisher = AmqpPublisher(FakeBroker().channel, max_queue=1, overflow=BLOCK, put_timeout_s=0.01)
+    await publisher.publish("q", {"n": 1})
+    with pytest.raises(PublisherOverloaded):
+        await publisher.publish("q", {"n": 2})
+
+
+@pytest.mark.asyncio
+async def test_stop_spills_what_the_broker_did_not_confirm(tmp_path):
+    spill = tmp_path / "spill.ndjson"
+    broker = FakeBroker(failures=10**6)
+    publisher = AmqpPublisher(broker.channel, backoff_base_s=0.01, spill_path=str(spill))
+    task = asyncio.create_task(publisher.run())
+    for i in range(3):
+        await publisher.publish("q", {"n": i})
+    await publisher.stop(timeout_s=0.05)
+    await asyncio.sleep(0)
+
+    assert task.cancelled() or task.done()
+    assert len(spill.read_text().splitlines()) == 3
+
+    # the next process replays them at start, before anything is published
+    broker.failures = 0
+    restarted = AmqpPublisher(broker.channel, spill_path=str(spill))
+    task = asyncio.create_task(restarted.run())
+    await _until(lambda: len(broker.delivered) == 3)
+    await restarted.publish("q", {"n": 3})
+    await _until(lambda: len(broker.delivered) == 4)
+    await restarted.stop()
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_idle_publisher_replays_spills_written_meanwhile(tmp_path):
+    spill = tmp_path / "spill.ndjson"
+    broker = FakeBroker()
+    publisher = AmqpPublisher(broker.channel, spill_path=str(spill), replay_every_s=0.01)
+    task = asyncio.create_task(publisher.run())
+    await asyncio.sleep(0.02)
+
+    # e.g. spilled by another worker sharing the file, while nothing is published here
+    other = AmqpPublisher(broker.channel, max_queue=1, spill_path=str(spill))
+    for i in range(3):
+        await other.publish("q", {"n": i})
+    await _until(lambda: len(broker.delivered) == 2)
+    assert sorted(body["n"] for _key, body, _id in broker.delivered) == [1, 2]
+    await publisher.stop()
+    task.cancel()
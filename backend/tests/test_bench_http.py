@@ -0,0 +1,28 @@
+import pytest
+
+from benchmarks.bench_http import compare, run
+
+
+@pytest.mark.asyncio
+async def test_http_benchmark_smoke():
+    result = await run(users=12, history=50, bookings=20, polls=3, concurrency=5)
+    scenarios = result["scenarios"]
+    assert set(scenarios) == {"checkin_rush", "booking_burst", "dashboard", "morning"}
+    assert all(s["errors"] == 0 and s["throughput_rps"] > 0 for s in scenarios.values())
+
+    rush = scenarios["checkin_rush"]["endpoints"]
+    assert rush["POST /reservations/qr-checkin/<spot_id>"]["status"] == {"200": 12}
+    assert rush["GET /reservations/me"]["count"] == 12
+    dashboard = scenarios["dashboard"]["endpoints"]
+    assert all(dashboard[label]["status"] == {"200": 3}
+               for label in ("GET /parking/view", "GET /spots/availability", "GET /reservations (page)"))
+    stats = scenarios["morning"]["endpoints"]["GET /parking/view"]
+    assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+
+
+def test_compare_flags_p95_regressions():
+    def result(p95):
+        return {"scenarios": {"dashboard": {"endpoints": {"GET /parking/view": {"p95_ms": p95}}}}}
+
+    assert compare(result(11.0), result(10.0), tolerance=0.2) == []
+    assert len(compare(result(13.0), result(10.0), tolerance=0.2)) == 1
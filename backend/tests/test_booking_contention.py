@@ -0,0 +1,104 @@
+import asyncio
+import os
+import random
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import repositories.reservation_repository as reservation_repository
+from benchmarks.bench_contention import run
+from db import metadata, reservation_series_table, reservations_table, spot_day_locks_table, spots_table
+from model.reservation_series import ReservationSeries
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_locks import lock_spot_days, spot_days
+
+
+def test_spot_days_covers_every_touched_day():
+    assert spot_days("A01", datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18)) == [("A01", date(2030, 1, 7))]
+    # ending at midnight does not touch the next day
+    assert spot_days("A01", datetime(2030, 1, 7, 22), datetime(2030, 1, 9)) == [
+        ("A01", date(2030, 1, 7)), ("A01", date(2030, 1, 8)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_lock_rows_are_created_once(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'locks.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    async with async_sessionmaker(engine)() as session:
+        keys = spot_days("A01", datetime(2030, 1, 7, 8), datetime(2030, 1, 9, 8))
+        await lock_spot_days(session, keys)
+        await session.commit()
+        await lock_spot_days(session, keys + spot_days("B01", datetime(2030, 1, 8), datetime(2030, 1, 8, 9)))
+        await session.commit()
+        rows = (await session.execute(select(spot_day_locks_table))).all()
+    assert sorted((r.spot_id, r.day.day) for r in rows) == [("A01", 7), ("A01", 8), ("A01", 9), ("B01", 8)]
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("row_locks", [False, True], ids=["sqlite", "sqlite-with-row-locks"])
+async def test_concurrent_bookings_never_overlap_on_sqlite(monkeypatch, row_locks):
+    if row_locks:
+        # run the spot/day lock protocol of the row-locking servers (FOR UPDATE is a no-op here)
+        monkeypatch.setattr(reservation_repository, "uses_row_locks", lambda _session: True)
+    result = await run(bookings=500, concurrency=200, spots=3, days=5)
+    assert result["overlaps"] == 0
+    assert result["errors"] == 0
+    assert result["booked"] > 0 and result["booked"] + result["conflicts"] == 500
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("row_locks", [False, True], ids=["sqlite", "sqlite-with-row-locks"])
+async def test_concurrent_series_and_bookings_never_overlap(tmp_path, monkeypatch, row_locks):
+    if row_locks:
+        monkeypatch.setattr(reservation_repository, "uses_row_locks", lambda _session: True)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'mixed.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.execute(insert(spots_table), [{"id": s, "is_free": True, "electrical": False} for s in ("A01", "A02")])
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    rng = random.Random(7)
+    monday = date(2030, 1, 7)
+
+    async def series(spot_id):
+        start = rng.choice((8, 10, 13))
+        async with Session() as session:
+            await ReservationRepository(session).create_series(ReservationSeries(
+                id=None, spot_id=spot_id, user_id=1, weekdays=1 << rng.randrange(5),
+                start_time=time(start), end_time=time(start + 3),
+                first_day=monday + timedelta(days=rng.randrange(14)), last_day=monday + timedelta(days=27),
+            ))
+
+    async def booking(spot_id):
+        start = datetime.combine(monday + timedelta(days=rng.randrange(28)), time(rng.choice((7, 9, 12, 15))))
+        async with Session() as session:
+            await ReservationRepository(session).create(spot_id, 2, start, start + timedelta(hours=rng.choice((2, 5, 24))))
+
+    jobs = [series(rng.choice(("A01", "A02"))) for _ in range(40)] + [booking(rng.choice(("A01", "A02"))) for _ in range(120)]
+    rng.shuffle(jobs)
+    await asyncio.gather(*jobs)
+
+    async with Session() as session:
+        rows = (await session.execute(select(reservations_table))).mappings().all()
+        stored = [ReservationRepository._row_to_series(r)
+                  for r in (await session.execute(select(reservation_series_table))).mappings().all()]
+    await engine.dispose()
+    assert stored and rows
+    for i, x in enumerate(stored):
+        assert not any(x.spot_id == r["spot_id"] and x.overlaps(r["start_date"], r["end_date"]) for r in rows)
+        assert not any(x.spot_id == y.spot_id and any(x.overlaps(a, b) for a, b in y.occurrences()) for y in stored[i + 1:])
+    for i, a in enumerate(rows):
+        assert not any(a["spot_id"] == b["spot_id"] and a["start_date"] < b["end_date"] and b["start_date"] < a["end_date"]
+                       for b in rows[i + 1:])
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.getenv("MYSQL_TEST_URL"), reason="MYSQL_TEST_URL not set")
+async def test_concurrent_bookings_never_overlap_on_mysql():
+    result = await run(os.getenv("MYSQL_TEST_URL"), bookings=2000, concurrency=200, spots=3, days=5)
+    assert result["overlaps"] == 0
+    assert result["booked"] > 0
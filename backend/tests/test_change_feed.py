@@ -0,0 +1,179 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata, outbox_table
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_repository import SpotRepository
+from services.change_feed import ChangeFeed
+from services.feed_tail import OutboxFeedTail
+
+
+@pytest.mark.asyncio
+async def test_publish_fans_out_in_order():
+    feed = ChangeFeed()
+    a, _ = feed.subscribe()
+    b, _ = feed.subscribe()
+
+    feed.publish("spot.updated", {"id": "A01"})
+    feed.publish("spot.deleted", {"id": "A01"})
+
+    for sub in (a, b):
+        first, second = await sub.get(timeout=1), await sub.get(timeout=1)
+        assert (first["version"], first["type"]) == (1, "spot.updated")
+        assert (second["version"], second["type"]) == (2, "spot.deleted")
+    assert feed.subscriber_count == 2
+
+
+@pytest.mark.asyncio
+async def test_resume_since_replays_missed_events():
+    feed = ChangeFeed(history=10)
+    for i in range(5):
+        feed.publish("spot.updated", {"id": f"A0{i}"})
+
+    sub, resync = feed.subscribe(since=3)
+    assert resync is False
+    assert [(await sub.get(timeout=1))["version"] for _ in range(2)] == [4, 5]
+
+    # up to date: nothing to replay
+    sub, resync = feed.subscribe(since=5)
+    assert resync is False
+    with pytest.raises(asyncio.TimeoutError):
+        await sub.get(timeout=0.01)
+
+
+def test_resync_when_history_is_gone_or_version_unknown():
+    feed = ChangeFeed(history=2)
+    for i in range(5):
+        feed.publish("spot.updated", {"id": i})
+
+    assert feed.subscribe(since=3)[1] is False  # 4, 5 still retained
+    assert feed.subscribe(since=1)[1] is True
+    assert feed.subscribe(since=99)[1] is True  # e.g. another worker / a restart
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_dropped_without_blocking_writers():
+    feed = ChangeFeed(max_queue=3)
+    slow, _ = feed.subscribe()
+    fast, _ = feed.subscribe()
+
+    for i in range(3):
+        feed.publish("spot.updated", {"id": i})
+        await fast.get(timeout=1)
+    feed.publish("spot.updated", {"id": 3})
+
+    assert slow.dropped and slow.closed
+    assert feed.subscriber_count == 1
+    assert await fast.get(timeout=1) is not None
+
+    # the slow one drains what it kept, then sees the end of the stream
+    events = []
+    while (event := await slow.get(timeout=1)) is not None:
+        events.append(event)
+    assert len(events) <= 3
+
+
+@pytest.mark.asyncio
+async def test_close_ends_subscriptions():
+    feed = ChangeFeed()
+    sub, _ = feed.subscribe()
+    feed.close()
+    assert await sub.get(timeout=1) is None
+    assert sub.dropped is False
+    assert feed.subscriber_count == 0
+
+
+@pytest.mark.asyncio
+async def test_replay_larger_than_the_queue_resyncs_a_live_subscription():
+    feed = ChangeFeed(history=10, max_queue=2)
+    for i in range(5):
+        feed.publish("spot.updated", {"id": i})
+
+    sub, resync = feed.subscribe(since=1)
+    assert resync is True and not sub.closed
+    assert feed.subscriber_count == 1
+    feed.publish("spot.updated", {"id": 5})
+    assert (await sub.get(timeout=1))["version"] == 6
+
+
+@pytest_asyncio.fixture
+async def Session(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'feed.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+def _drain(sub) -> list:
+    events = []
+    while sub._queue.qsize():
+        events.append(sub._queue.get_nowait())
+    return events
+
+
+@pytest.mark.asyncio
+async def test_tail_carries_the_writes_of_other_workers(Session):
+    # worker 2 tails the outbox: it sees what worker 1 commits, and nothing refused
+    feed = ChangeFeed()
+    sub, _ = feed.subscribe()
+    tail = OutboxFeedTail(Session, feed)
+    async with Session() as session:
+        await SpotRepository(session).create("A01", electrical=True)
+    await tail.step()  # starts at the end of the table
+    assert _drain(sub) == []
+
+    async with Session() as session:
+        repo = ReservationRepository(session)
+        r1 = await repo.create("A01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))
+        assert await repo.create("A01", 2, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18)) is None
+        await repo.check_in(r1.id)
+        await repo.delete(r1.id)
+        await repo.delete(r1.id)  # already gone: nothing published
+        await SpotRepository(session).update_spot("A01", is_free=False)
+        await SpotRepository(session).delete("A01")
+
+    assert await tail.step() == 5
+    events = _drain(sub)
+    assert [e["type"] for e in events] == [
+        "reservation.created", "reservation.checked_in", "reservation.deleted", "spot.updated", "spot.deleted",
+    ]
+    assert events[0]["data"]["id"] == r1.id and "type" not in events[0]["data"]
+    assert events[3]["data"]["is_free"] is False
+
+
+@pytest.mark.asyncio
+async def test_tail_rereads_ids_committed_late(Session):
+    now = [0.0]
+    feed = ChangeFeed()
+    sub, _ = feed.subscribe()
+    tail = OutboxFeedTail(Session, feed, gap_grace_s=10, clock=lambda: now[0])
+    await tail.step()
+
+    async def add(*ids):
+        async with Session() as session:
+            await session.execute(insert(outbox_table), [
+                {"id": i, "event_type": "SpotDeleted", "payload": f'{{"id": "{i}"}}'} for i in ids
+            ])
+            await session.commit()
+
+    # id 2 belongs to a transaction still running when 1 and 3 are read
+    await add(1, 3)
+    await tail.step()
+    await add(2)
+    now[0] = 5
+    await tail.step()
+    # id 4 is never committed (rolled back): given up after the grace period
+    await add(5)
+    await tail.step()
+    now[0] = 20
+    await add(4)
+    await tail.step()
+
+    assert [e["data"]["id"] for e in _drain(sub)] == ["1", "3", "2", "5"]
+    assert tail.last_id == 5
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import StaticPool
+
+from db import make_engine
+from utils.db_pool import MonitoredPool, PoolSettings, ping_idle_connections, pool_stats
+from utils.metrics import AppMetrics
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "1")
+    settings = PoolSettings.from_env()
+    assert (settings.size, settings.max_overflow, settings.pre_ping) == (3, 10, True)
+
+
+def test_in_memory_sqlite_keeps_its_single_connection():
+    engine = make_engine("sqlite+aiosqlite:///:memory:", PoolSettings())
+    assert isinstance(engine.pool, StaticPool) and pool_stats(engine) is None
+
+
+@pytest.mark.asyncio
+async def test_exhausted_pool_waits_then_times_out(tmp_path):
+    engine = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", PoolSettings(size=1, max_overflow=0, timeout_s=0.2))
+    assert isinstance(engine.pool, MonitoredPool) and engine.pool.size() == 1
+    metrics = AppMetrics()
+    metrics.track_pool(engine)
+    stats = pool_stats(engine)
+
+    held = await engine.connect()
+    with pytest.raises(PoolTimeout):
+        await engine.connect()
+    assert stats.exhausted == 1 and stats.timeouts == 1 and stats.max_wait_s >= 0.2
+
+    async def release_soon():
+        await asyncio.sleep(0.05)
+        await held.close()
+
+    task = asyncio.create_task(release_soon())
+    async with engine.connect():
+        pass
+    await task
+    assert stats.exhausted == 2 and stats.timeouts == 1 and stats.checkouts == 3
+
+    text = metrics.render()
+    assert 'db_pool_wait_seconds_count{pool="primary"} 3' in text
+    assert 'db_pool_exhausted_total{pool="primary"} 2' in text and 'db_pool_timeouts_total{pool="primary"} 1' in text
+
+    # dispose() replaces the pool: same stats
+    await engine.dispose()
+    assert pool_stats(engine) is stats
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_liveness_check_finds_dead_idle_connections(tmp_path):
+    engine = make_engine(f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}", PoolSettings(size=2, max_overflow=0))
+    async with engine.connect() as a, engine.connect():
+        driver = (await a.get_raw_connection()).driver_connection
+    assert await ping_idle_connections(engine) == 0
+    stats = pool_stats(engine)
+    # pings are not application checkouts: the wait stats only hold the two above
+    assert (stats.pings, stats.checkouts) == (2, 2)
+
+    await driver.close()  # e.g. closed by the server while idle
+    assert await ping_idle_connections(engine) == 1
+    assert pool_stats(engine).dead == 1
+    # the pool was invalidated: every connection is reopened at its next checkout
+    async with engine.connect() as conn:
+        assert (await conn.exec_driver_sql("SELECT 1")).scalar() == 1
+    assert await ping_idle_connections(engine) == 0
+    assert stats.checkouts == 3
+    await engine.dispose()
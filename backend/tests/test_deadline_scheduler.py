@@ -0,0 +1,127 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import run_background
+from db import metadata
+from repositories.reservation_repository import ReservationRepository
+from services.deadline_scheduler import DeadlineScheduler, release_deadline
+
+
+def _dt(day, hour, minute=0):
+    return datetime(2030, 1, day, hour, minute)
+
+
+def test_release_deadline_is_the_first_cutoff_inside_the_reservation():
+    assert release_deadline(_dt(7, 8), _dt(7, 18)) == _dt(7, 11)
+    # starts after the cutoff: next day's, if still running
+    assert release_deadline(_dt(7, 14), _dt(9, 18)) == _dt(8, 11)
+    assert release_deadline(_dt(7, 14), _dt(7, 18)) is None
+    # ends at or before the cutoff: never released
+    assert release_deadline(_dt(7, 8), _dt(7, 11)) is None
+    assert release_deadline(_dt(7, 11), _dt(7, 18)) is None
+
+
+def test_pop_due_groups_by_deadline_and_skips_cancelled():
+    sched = DeadlineScheduler()
+    sched.schedule(1, _dt(8, 11))
+    sched.schedule(2, _dt(7, 11))
+    sched.schedule(3, _dt(7, 11))
+    sched.schedule(4, _dt(7, 11))
+    sched.cancel(3)
+    sched.schedule(4, _dt(9, 11))  # rescheduled: the old entry is stale
+
+    assert sched.next_deadline() == _dt(7, 11)
+    assert sched.pop_due(_dt(7, 10)) == []
+    assert sched.pop_due(_dt(8, 12)) == [(_dt(7, 11), [2]), (_dt(8, 11), [1])]
+    assert len(sched) == 1 and sched.next_deadline() == _dt(9, 11)
+
+
+@pytest.mark.asyncio
+async def test_run_fires_on_time_and_wakes_up_for_earlier_deadlines():
+    sched = DeadlineScheduler()
+    fired = []
+
+    async def handler(when, ids):
+        fired.append((ids, time.perf_counter()))
+
+    task = asyncio.create_task(sched.run(handler))
+    await asyncio.sleep(0.01)  # idle: sleeping without deadline
+
+    t0 = time.perf_counter()
+    sched.schedule(1, datetime.now() + timedelta(seconds=30))
+    sched.schedule(2, datetime.now() + timedelta(milliseconds=50))
+    await asyncio.sleep(0.2)
+    sched.stop()
+    await asyncio.wait_for(task, 1)
+
+    assert [ids for ids, _t in fired] == [[2]]
+    assert fired[0][1] - t0 < 1.0
+    assert len(sched) == 1
+
+
+@pytest_asyncio.fixture
+async def session(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test_deadlines.db'}", future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        yield s
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pending_releases_rebuild_the_deadlines(session):
+    repo = ReservationRepository(session)
+
+    r1 = await repo.create("A01", 1, _dt(7, 8), _dt(7, 18))
+    r2 = await repo.create("B01", 1, _dt(7, 8), _dt(7, 18))
+    r3 = await repo.create("C01", 1, _dt(7, 8), _dt(7, 18))
+    await repo.check_in(r2.id)
+    await repo.delete(r3.id)
+
+    sched = DeadlineScheduler()
+    assert sched.load(await repo.pending_releases(_dt(7, 9))) == 1
+    assert sched.pop_due(_dt(7, 12)) == [(_dt(7, 11), [r1.id])]
+
+    assert await repo.release_unchecked(_dt(7, 11), ids=[r1.id, r2.id]) == 1
+    assert await repo.release_unchecked(_dt(7, 11), ids=[r1.id]) == 0
+    assert await repo.pending_releases(_dt(7, 12)) == []
+
+
+@pytest.mark.asyncio
+async def test_deadline_loop_runs_on_the_leader_only(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'loop.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    fired = []
+
+    async def handler(cutoff, ids):
+        fired.append(ids)
+
+    leader = SimpleNamespace(is_leader=False)
+    app = SimpleNamespace(ctx=SimpleNamespace(Session=Session, deadlines=DeadlineScheduler(), leader=leader))
+    monkeypatch.setattr(run_background, "release_due", lambda _app, cutoff, ids: handler(cutoff, ids))
+    task = asyncio.create_task(run_background.deadline_loop(app, reload_s=0.05))
+
+    # booked by any worker, its deadline already passed: only the leader fires it
+    now = datetime.now()
+    async with Session() as session:
+        booked = await ReservationRepository(session).create("A01", 1, now - timedelta(days=1), now + timedelta(days=1))
+    await asyncio.sleep(0.15)
+    assert fired == []
+
+    leader.is_leader = True
+    await asyncio.sleep(0.15)
+    app.ctx.deadlines.stop()
+    await asyncio.wait_for(task, 1)
+
+    # picked up by a reload, fired each time it was found pending (release_due is stubbed)
+    assert fired and all(ids == [booked.id] for ids in fired)
+    await engine.dispose()
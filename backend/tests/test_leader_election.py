@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata
+from repositories.lease_repository import LeaseRepository
+from services.leader import LeaderElector
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2030, 1, 7, 8)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest_asyncio.fixture
+async def Session(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test_leases.db'}", future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_lease_has_a_single_live_holder(Session):
+    now = datetime(2030, 1, 7, 8)
+    async with Session() as s:
+        repo = LeaseRepository(s)
+        assert await repo.try_acquire("jobs", "a", 30, now) is True
+        assert await repo.try_acquire("jobs", "b", 30, now) is False
+        # renewal keeps the first acquisition time
+        assert await repo.try_acquire("jobs", "a", 30, now + timedelta(seconds=10)) is True
+        lease = await repo.get("jobs")
+        assert (lease["holder"], lease["acquired_at"]) == ("a", now)
+        assert lease["expires_at"] == now + timedelta(seconds=40)
+
+        # expired -> taken over
+        later = now + timedelta(seconds=41)
+        assert await repo.try_acquire("jobs", "b", 30, later) is True
+        assert (await repo.get("jobs"))["acquired_at"] == later
+        assert await repo.try_acquire("jobs", "a", 30, later) is False
+
+        assert await repo.release("jobs", "a") is False
+        assert await repo.release("jobs", "b") is True
+        assert await repo.try_acquire("jobs", "a", 30, later) is True
+
+
+@pytest.mark.asyncio
+async def test_exactly_one_elector_leads_and_fails_over(Session):
+    clock = FakeClock()
+    electors = [LeaderElector(Session, holder=f"w{i}", ttl_s=30, renew_s=10, clock=clock) for i in range(3)]
+
+    for e in electors:
+        await e.step()
+    assert [e.is_leader for e in electors] == [True, False, False]
+
+    # the leader dies (no more renewals): the others take over once the lease expired
+    clock.advance(20)
+    assert not any([await e.step() for e in electors[1:]])
+    clock.advance(11)
+    for e in electors[1:]:
+        await e.step()
+    assert [e.is_leader for e in electors[1:]] == [True, False]
+
+    # graceful stop hands over immediately
+    await electors[1].stop()
+    assert await electors[2].step() is True
+
+
+@pytest.mark.asyncio
+async def test_failed_renewal_drops_leadership(Session):
+    elector = LeaderElector(Session, holder="w0", ttl_s=30, renew_s=10)
+    assert await elector.step() is True
+
+    def broken_factory():
+        raise RuntimeError("database unreachable")
+
+    elector._session_factory = broken_factory
+    assert await elector.step() is False
+    assert elector.is_leader is False
+
+
+def test_renew_must_be_shorter_than_ttl():
+    with pytest.raises(ValueError):
+        LeaderElector(None, ttl_s=10, renew_s=10)
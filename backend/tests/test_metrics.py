@@ -0,0 +1,85 @@
+import os
+import re
+
+import pytest
+
+from app import create_app
+from utils.metrics import AppMetrics, Registry
+
+
+def _sample(text: str, name: str, labels: str = "") -> float:
+    match = re.search(rf"^{re.escape(name + labels)} (\S+)$", text, re.M)
+    assert match, f"{name}{labels} not in metrics"
+    return float(match.group(1))
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    h = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v, "/a")
+    c = registry.counter("hits_total", "Hits", ("route",))
+    c.inc('/b"x', amount=2)
+    text = registry.render()
+
+    assert "# TYPE latency_seconds histogram" in text
+    assert _sample(text, "latency_seconds_bucket", '{route="/a",le="0.1"}') == 2
+    assert _sample(text, "latency_seconds_bucket", '{route="/a",le="1"}') == 3
+    assert _sample(text, "latency_seconds_bucket", '{route="/a",le="+Inf"}') == 4
+    assert _sample(text, "latency_seconds_count", '{route="/a"}') == 4
+    assert _sample(text, "latency_seconds_sum", '{route="/a"}') == pytest.approx(3.65)
+    assert _sample(text, "hits_total", '{route="/b\\"x"}') == 2
+
+
+def test_scrape_time_gauges_skip_missing_readings():
+    registry = Registry()
+    registry.gauge("present", "Present", fn=lambda: 3)
+    registry.gauge("absent", "Absent", fn=lambda: None)
+    text = registry.render()
+    assert _sample(text, "present") == 3
+    assert not re.search(r"^absent ", text, re.M)
+
+
+@pytest.mark.asyncio
+async def test_timed_job_records_duration_and_failures():
+    metrics = AppMetrics()
+    async with metrics.timed("resync"):
+        pass
+    with pytest.raises(RuntimeError):
+        async with metrics.timed("resync"):
+            raise RuntimeError("boom")
+    assert metrics.job_duration.count("resync") == 2 and metrics.job_failures.value("resync") == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_routes_queries_and_pool(tmp_path):
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp_path / 'metrics.db'}"
+    os.environ["SANIC_TEST_MODE"] = "1"
+    app = create_app()
+
+    async with app.asgi_client as client:
+        for _ in range(2):
+            _req, res = await client.post("/hello", json={"message": "hi"})
+            assert res.status == 200
+        _req, res = await client.get("/nowhere")
+        assert res.status == 404
+        _req, pool = await client.get("/health/pool")
+        _req, res = await client.get("/metrics")
+
+    assert res.status == 200 and res.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = res.text
+    assert _sample(text, "http_requests_total", '{method="POST",route="/hello",status="200"}') == 2
+    assert _sample(text, "http_requests_total", '{method="GET",route="unmatched",status="404"}') == 1
+    assert _sample(text, "http_request_duration_seconds_count", '{method="POST",route="/hello"}') == 2
+    # one INSERT ... RETURNING per call
+    assert _sample(text, "db_queries_total", '{route="/hello"}') == 2
+    assert _sample(text, "db_query_seconds_total", '{route="/hello"}') > 0
+    assert _sample(text, "http_request_db_queries_bucket", '{route="/hello",le="1"}') == 2
+    # startup (init_db, seeding, index warm-up) is charged to the background label
+    assert _sample(text, "db_queries_total", '{route="background"}') > 0
+    assert _sample(text, "http_requests_in_flight") == 1  # the scrape itself
+    primary = '{pool="primary"}'
+    assert _sample(text, "db_pool_checked_out", primary) == 0
+    assert _sample(text, "db_pool_wait_seconds_count", primary) > 0
+    assert _sample(text, "db_pool_exhausted_total", primary) == 0
+    assert pool.json["size"] == 10 and pool.json["checkouts"] > 0 and pool.json["timeouts"] == 0
@@ -0,0 +1,156 @@
+import json
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata, outbox_table
+from repositories.outbox_repository import OutboxRepository
+from repositories.reservation_repository import ReservationRepository
+from services.outbox_relay import OutboxRelay
+
+
+@pytest_asyncio.fixture
+async def Session(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'outbox.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _events(Session):
+    async with Session() as s:
+        rows = (await s.execute(select(outbox_table).order_by(outbox_table.c.id))).mappings().all()
+    return [json.loads(r["payload"]) for r in rows]
+
+
+class FakeBroker:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def send(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker down")
+        self.batches.append(messages)
+
+
+@pytest.mark.asyncio
+async def test_mutations_write_their_events_in_the_same_transaction(Session):
+    async with Session() as s:
+        repo = ReservationRepository(s)
+        r = await repo.create("A01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18), user_email="a@b.com")
+        await repo.create_many([("B01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18)),
+                                ("C01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))],
+                               atomic=True, emails={1: "a@b.com"})
+        await repo.check_in(r.id)
+        await repo.delete(r.id)
+
+    events = await _events(Session)
+    assert [e["type"] for e in events] == [
+        "ReservationCreated", "ReservationCreated", "ReservationCreated", "ReservationCheckedIn", "ReservationCancelled",
+    ]
+    assert events[0]["id"] == r.id and events[0]["spot_id"] == "A01"
+    # ReservationCreated carries the email of the user, as before the outbox
+    assert [e["user_email"] for e in events[:3]] == ["a@b.com"] * 3
+
+
+@pytest.mark.asyncio
+async def test_no_event_without_the_change(Session):
+    async with Session() as s:
+        repo = ReservationRepository(s)
+        await repo.create("A01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))
+        # conflicting booking: nothing inserted, nothing emitted
+        assert await repo.create("A01", 2, datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 10)) is None
+        # an event of a rolled back transaction is dropped with it
+        await OutboxRepository(s).add([("Anything", {})])
+        await s.rollback()
+
+    assert [e["type"] for e in await _events(Session)] == ["ReservationCreated"]
+
+
+@pytest.mark.asyncio
+async def test_released_reservations_are_reported(Session):
+    async with Session() as s:
+        repo = ReservationRepository(s)
+        kept = await repo.create("A01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))
+        released = await repo.create("B01", 2, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))
+        await repo.check_in(kept.id)
+        assert await repo.release_unchecked(datetime(2030, 1, 7, 11)) == 1
+
+    last = (await _events(Session))[-1]
+    assert last["type"] == "ReservationReleased" and last["id"] == released.id
+
+
+@pytest.mark.asyncio
+async def test_relay_sends_ordered_batches_and_marks_them_sent(Session):
+    async with Session() as s:
+        await OutboxRepository(s).add([("E", {"n": i}) for i in range(7)])
+        await s.commit()
+
+    broker = FakeBroker()
+    relay = OutboxRelay(Session, broker.send, routing_key="q", batch_size=3)
+    assert await relay.drain() == 7
+    assert [len(b) for b in broker.batches] == [3, 3, 1]
+    sent = [m for b in broker.batches for m in b]
+    assert [json.loads(body)["n"] for _key, body, _id in sent] == list(range(7))
+    assert {key for key, _body, _id in sent} == {"q"} and len({mid for *_x, mid in sent}) == 7
+    assert (await relay.stats())["pending"] == 0
+    assert await relay.step() == 0  # nothing sent twice
+
+
+@pytest.mark.asyncio
+async def test_unconfirmed_batch_stays_pending(Session):
+    async with Session() as s:
+        await OutboxRepository(s).add([("E", {"n": 1})])
+        await s.commit()
+
+    broker = FakeBroker(failures=1)
+    relay = OutboxRelay(Session, broker.send, routing_key="q")
+    with pytest.raises(ConnectionError):
+        await relay.step()
+    assert (await relay.stats())["pending"] == 1
+    assert await relay.step() == 1 and broker.batches[0][0][2] == "outbox-1"
+
+
+@pytest.mark.asyncio
+async def test_prune_deletes_sent_events_only(Session):
+    async with Session() as s:
+        await OutboxRepository(s).add([("E", {"n": i}) for i in range(5)])
+        await s.commit()
+        await OutboxRepository(s).mark_sent([1, 2, 3], datetime(2030, 1, 1))
+
+    relay = OutboxRelay(Session, FakeBroker().send, routing_key="q", retention_s=3600,
+                        clock=lambda: datetime(2030, 1, 2))
+    assert await relay.prune() == 3
+    assert [e["n"] for e in await _events(Session)] == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_bulk_events_cost_one_statement(Session):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    engine = Session.kw["bind"]
+    async with Session() as s:
+        event.listen(engine.sync_engine, "before_cursor_execute", listener)
+        await OutboxRepository(s).add([("E", {"n": i}) for i in range(100)])
+        await s.commit()
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_prune_without_relay_drops_old_unsent_events(Session):
+    async with Session() as s:
+        await OutboxRepository(s).add([("E", {"n": i}) for i in range(3)])
+        await s.commit()
+        await OutboxRepository(s).mark_sent([1], datetime(2030, 1, 1))
+
+        # MQ disabled: nothing relays the outbox, old unsent events must not pile up
+        assert await OutboxRepository(s).prune(datetime(2030, 1, 2), unsent_before=datetime(2000, 1, 1)) == 1
+        assert await OutboxRepository(s).prune(datetime(2030, 1, 2), unsent_before=datetime(2100, 1, 1)) == 2
+    assert await _events(Session) == []
@@ -1,9 +1,12 @@
 import pytest
+from datetime import datetime, timedelta
 import pytest_asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from db import metadata
+from repositories.occupancy_snapshot import OccupancySnapshot
 from repositories.parking_repository import ParkingRepository
+from repositories.reservation_repository import ReservationRepository
 from repositories.spot_repository import SpotRepository
 
 
@@ -78,3 +81,60 @@ class TestParkingRepository:
         # electric_spots = 2 (A01, A02) => ratio 2/10
         assert view["electric_spots"] == 2
         assert abs(view["electric_ratio"] - 0.2) < 1e-9
+
+    @pytest.mark.asyncio
+    async def test_snapshot_view_matches_db_view(self, session):
+        snapshot = OccupancySnapshot()
+        parking_repo = ParkingRepository(session, snapshot=snapshot)
+        spot_repo = SpotRepository(session, snapshot=snapshot)
+        res_repo = ReservationRepository(session, snapshot=snapshot)
+        db_repo = ParkingRepository(session)
+        db_view = db_repo.get_parking_view
+
+        await spot_repo.create("A01", electrical=True, is_free=True)
+        await parking_repo.reload_snapshot()
+
+        # writes after the seed are applied to the snapshot
+        await parking_repo.update_config(slots_max=10)
+        await spot_repo.create("A02", electrical=True, is_free=False)
+        await spot_repo.create("B01", electrical=False, is_free=True)
+        await spot_repo.update_spot("B01", is_free=False)
+        await spot_repo.delete("A02")
+
+        now = datetime.now()
+        r1 = await res_repo.create("A01", 1, now - timedelta(hours=1), now + timedelta(hours=4))
+        await res_repo.create("B01", 1, now - timedelta(hours=2), now + timedelta(hours=4))
+        r3 = await res_repo.create("C01", 1, now - timedelta(hours=3), now + timedelta(hours=4))
+        await res_repo.check_in(r1.id)
+        await res_repo.delete(r3.id)
+
+        view = await parking_repo.get_parking_view()
+        assert view == await db_view()
+        assert view["no_shows"] == 1 and view["occupied"] == 1 and view["slots_max"] == 10
+        # the source of the view, for X-Snapshot-Age
+        assert parking_repo.view_age is not None and db_repo.view_age is None
+
+    @pytest.mark.asyncio
+    async def test_stale_snapshot_is_reloaded(self, session):
+        clock = [0.0]
+        snapshot = OccupancySnapshot(max_age_s=5, clock=lambda: clock[0])
+        parking_repo = ParkingRepository(session, snapshot=snapshot)
+        await parking_repo.reload_snapshot()
+
+        # written by "another worker": invisible until the snapshot is too old
+        await SpotRepository(session).create("A01", electrical=True, is_free=False)
+        assert (await parking_repo.get_parking_view())["occupied"] == 0
+
+        clock[0] = 6.0
+        assert (await parking_repo.get_parking_view())["occupied"] == 1
+        assert snapshot.age() == 0.0
+
+    @pytest.mark.asyncio
+    async def test_replica_view_is_counted_not_from_the_snapshot(self, session):
+        snapshot = OccupancySnapshot(max_age_s=5, clock=lambda: 100.0)
+        parking_repo = ParkingRepository(session, snapshot=snapshot)
+        session.info["replica"] = True  # as a session of Session(read_only=True)
+
+        # stale (never loaded) snapshot on a replica session: counted, not reseeded
+        await parking_repo.get_parking_view()
+        assert parking_repo.view_age is None
@@ -0,0 +1,108 @@
+"""
+SQL statement budgets of the main endpoints.
+
+Each request is served by create_app on a temporary SQLite file; the
+statements it sends are counted by the metrics middleware (see
+utils/query_stats.py) and checked with the `query_budget` fixture
+(tests/conftest.py). A failing budget prints every statement with its count.
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import create_app
+from utils.query_stats import collect, track_queries
+
+HEADERS = {"X-User-Id": "1", "X-User-Roles": "SECRETAIRE", "X-User-Email": "sec@company.com"}
+TODAY = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def app(tmp_path):
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tmp_path / 'budgets.db'}"
+    os.environ["SANIC_TEST_MODE"] = "1"
+    return create_app()
+
+
+def _period(days=0):
+    start = TODAY + timedelta(days=days)
+    return {"start_date": start.isoformat(), "end_date": (start + timedelta(hours=9)).isoformat()}
+
+
+@pytest.mark.asyncio
+async def test_endpoint_query_budgets(app, query_budget):
+    async with app.asgi_client as client:
+        _req, res = await client.post("/users/", headers=HEADERS, json={
+            "email": "sec@company.com", "nom": "S", "prenom": "P", "roles": ["SECRETAIRE", "EMPLOYEE"],
+        })
+        assert res.status == 201
+
+        # user + roles, spot, series conflicts, conditional insert, outbox event
+        req, res = await client.post("/reservations/", headers=HEADERS, json={"spot_id": "A01", **_period()})
+        assert res.status == 201
+        query_budget.check(req, 6, repeats=0)
+        assert res.headers["Server-Timing"].startswith('db;dur=') and '"6 queries, 0 repeated"' in res.headers["Server-Timing"]
+
+        await client.post("/reservations/", headers=HEADERS, json={"spot_id": "A02", **_period(1)})
+
+        req, res = await client.get("/reservations/me", headers=HEADERS)
+        assert res.status == 200 and len(res.json) == 2
+        query_budget.check(req, 4, repeats=0)
+
+        # today's reservation of the spot only, not every reservation of the user
+        req, res = await client.post("/reservations/qr-checkin/a01", headers=HEADERS)
+        assert res.status == 200 and res.json["checked_in"] is True
+        query_budget.check(req, 5, repeats=0)
+        req, res = await client.post("/reservations/qr-checkin/A01", headers=HEADERS)
+        assert res.json["message"] == "Already checked in"
+        query_budget.check(req, 3)
+
+        # the deleted roles prove the user exists
+        req, res = await client.put("/users/1/roles", headers=HEADERS, json={"roles": ["SECRETAIRE", "MANAGER"]})
+        assert res.status == 200
+        query_budget.check(req, 2)
+        req, res = await client.put("/users/99/roles", headers=HEADERS, json={"roles": ["SECRETAIRE"]})
+        assert res.status == 404
+        query_budget.check(req, 2)
+
+
+@pytest.mark.asyncio
+async def test_repeated_statements_are_counted(tmp_path, query_budget):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'repeats.db'}")
+    track_queries(engine)
+    async with engine.connect() as conn:
+        with collect() as outer:
+            with query_budget(3, repeats=2) as inner:
+                for i in range(3):  # an N+1
+                    await conn.execute(text("SELECT :i"), {"i": i})
+            await conn.execute(text("SELECT 1"))
+
+        with pytest.raises(AssertionError, match="3 repeated SQL statements, budget 0"):
+            with query_budget(10, repeats=0):
+                for i in range(4):
+                    await conn.execute(text("SELECT :i"), {"i": i})
+    await engine.dispose()
+
+    assert inner.count == 3 and inner.repeated == 2 and inner.most_repeated() == ("SELECT ?", 3)
+    # the enclosing scope sees the statements of the nested one
+    assert outer.count == 4 and outer.seconds >= inner.seconds
+
+
+@pytest.mark.asyncio
+async def test_failed_statements_are_counted_without_leaking(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'errors.db'}")
+    track_queries(engine)
+    async with engine.connect() as conn:
+        with collect() as stats:
+            for _ in range(3):
+                with pytest.raises(exc.OperationalError):
+                    await conn.execute(text("SELECT * FROM missing"))
+            await conn.execute(text("SELECT 1"))
+        started = await conn.run_sync(lambda c: c.connection.info["query_started"])
+    await engine.dispose()
+
+    assert started == []
+    assert stats.count == 4 and stats.statements["SELECT * FROM missing"] == 3
@@ -0,0 +1,241 @@
+"""
+Query plans of the hot reservation queries.
+
+Every statement a repository method sends is captured and re-run through
+EXPLAIN; the test fails as soon as one of them reads `reservations` with a
+full table scan. SQLite always runs; a MySQL-compatible server is used when
+MYSQL_TEST_URL points to a disposable database (its tables are recreated).
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, insert, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata, init_db, reservations_table, spots_table, users_table
+from model.allocation import AllocationRequest
+from repositories.occupancy_snapshot import OccupancySnapshot
+from repositories.parking_repository import ParkingRepository
+from repositories.reservation_index import SpotIntervalIndex
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_repository import SpotRepository
+from services.spot_allocator import PreferenceScoring
+
+NOW = datetime.now().replace(microsecond=0)
+SPOTS = [f"{row}{i:02d}" for row in "ABCDEF" for i in range(1, 11)]
+
+DIALECTS = [
+    pytest.param(None, id="sqlite"),
+    pytest.param(
+        os.getenv("MYSQL_TEST_URL"),
+        id="mysql",
+        marks=pytest.mark.skipif(not os.getenv("MYSQL_TEST_URL"), reason="MYSQL_TEST_URL not set"),
+    ),
+]
+
+
+@pytest_asyncio.fixture(params=DIALECTS)
+async def engine(request, tmp_path):
+    url = request.param or f"sqlite+aiosqlite:///{tmp_path / 'test_query_plans.db'}"
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.drop_all)
+    await init_db(engine)
+
+    # Enough history for the planner to prefer the indexes, then fresh statistics
+    rng = random.Random(7)
+    rows = []
+    for _ in range(3000):
+        start = NOW + timedelta(days=rng.randint(-700, 30))
+        rows.append({
+            "spot_id": rng.choice(SPOTS), "user_id": rng.randint(1, 200),
+            "start_date": start, "end_date": start + timedelta(hours=9),
+            "checked_in": rng.random() < 0.8,
+        })
+    async with engine.begin() as conn:
+        await conn.execute(insert(spots_table), [{"id": s, "is_free": True, "electrical": False} for s in SPOTS])
+        await conn.execute(insert(users_table), [
+            {"id": i, "email": f"u{i}@company.com", "nom": "N", "prenom": "P"} for i in range(1, 201)
+        ])
+        await conn.execute(insert(reservations_table), rows)
+        if engine.dialect.name == "sqlite":
+            await conn.execute(text("ANALYZE"))
+        else:
+            await conn.execute(text("ANALYZE TABLE reservations"))
+
+    yield engine
+
+    if engine.dialect.name != "sqlite":
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+    await engine.dispose()
+
+
+async def _captured(engine, call):
+    """Run `call(session)` and return the (statement, parameters) it sent to the DB."""
+    seen = []
+
+    def _capture(_conn, _cursor, statement, parameters, _context, executemany):
+        if not executemany and "reservations" in statement and not statement.startswith("EXPLAIN"):
+            seen.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+    try:
+        async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+            await call(session)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+    return seen
+
+
+async def _full_scans(engine, statement, parameters) -> list[str]:
+    async with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            plan = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)).all()
+            details = [row[-1] for row in plan]
+            # "SEARCH reservations USING INDEX ..." is fine, "SCAN reservations" reads every row
+            return [d for d in details if d.split(" ")[:2] == ["SCAN", "reservations"]]
+
+        plan = (await conn.exec_driver_sql("EXPLAIN " + statement, parameters)).mappings().all()
+        return [str(dict(r)) for r in plan if r["table"] == "reservations" and r["type"] == "ALL"]
+
+
+today = NOW.replace(hour=0, minute=0, second=0)
+
+HOT_QUERIES = {
+    "has_overlap": lambda s: ReservationRepository(s).has_overlap("A01", NOW, NOW + timedelta(hours=4)),
+    "create": lambda s: ReservationRepository(s).create("B02", 1, NOW + timedelta(days=90), NOW + timedelta(days=91)),
+    "create_any": lambda s: ReservationRepository(s).create_any(
+        1, AllocationRequest(NOW + timedelta(days=90), NOW + timedelta(days=91), preferred_row="C"), PreferenceScoring()
+    ),
+    "get_by_user": lambda s: ReservationRepository(s).get_by_user(42),
+    "find_on_spot": lambda s: ReservationRepository(s).find_on_spot(42, "A01", today.date()),
+    "release_unchecked": lambda s: ReservationRepository(s).release_unchecked(today.replace(hour=11)),
+    "release_due": lambda s: ReservationRepository(s).release_unchecked(today.replace(hour=11), ids=[1, 2, 3]),
+    "pending_releases": lambda s: ReservationRepository(s).pending_releases(NOW),
+    "list_by_date_range": lambda s: ReservationRepository(s).list_by_date_range(today, today + timedelta(days=7)),
+    "warm_index": lambda s: ReservationRepository(s, index=SpotIntervalIndex()).warm_index(),
+    "parking_view": lambda s: ParkingRepository(s).get_parking_view(),
+    "parking_snapshot": lambda s: ParkingRepository(s, snapshot=OccupancySnapshot()).reload_snapshot(),
+    "availability": lambda s: SpotRepository(s).list_with_reservations(today, today + timedelta(days=30)),
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_query_uses_an_index(engine, name):
+    statements = await _captured(engine, HOT_QUERIES[name])
+    assert statements, f"{name} sent no query on reservations"
+
+    for statement, parameters in statements:
+        scans = await _full_scans(engine, statement, parameters)
+        assert not scans, f"{name} does a full scan of reservations:\n{statement}\n{scans}"
+
+
+@pytest.mark.asyncio
+async def test_init_db_adds_missing_indexes_to_existing_tables(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'legacy.db'}")
+    # Deployment created before the indexes were declared
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        for index in reservations_table.indexes:
+            await conn.execute(text(f"DROP INDEX {index.name}"))
+
+    await init_db(engine)
+    await init_db(engine)  # idempotent
+
+    async with engine.connect() as conn:
+        names = await conn.run_sync(
+            lambda c: {ix["name"] for ix in inspect(c).get_indexes("reservations")}
+        )
+    assert {ix.name for ix in reservations_table.indexes} <= names
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_init_db_only_tolerates_an_index_created_concurrently(tmp_path, monkeypatch):
+    from sqlalchemy import Index
+    from sqlalchemy.exc import OperationalError
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'legacy_race.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.execute(text("DROP INDEX ix_reservations_unreleased"))
+    create = Index.create
+
+    def created_by_another_worker(index, bind, **kw):
+        create(index, bind, **kw)
+        raise OperationalError("CREATE INDEX", {}, Exception("index already exists"))
+
+    monkeypatch.setattr(Index, "create", created_by_another_worker)
+    await init_db(engine)
+
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_reservations_unreleased"))
+
+    def fails(index, bind, **kw):
+        raise OperationalError("CREATE INDEX", {}, Exception("lock wait timeout"))
+
+    monkeypatch.setattr(Index, "create", fails)
+    with pytest.raises(OperationalError):
+        await init_db(engine)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_init_db_only_tolerates_a_column_added_concurrently(tmp_path, monkeypatch):
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.exc import OperationalError
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'legacy_column_race.db'}")
+    exec_driver_sql = Connection.exec_driver_sql
+
+    for racing, error in ((True, "duplicate column name"), (False, "disk full")):
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+            await conn.run_sync(metadata.create_all)
+            await conn.execute(text("DROP INDEX ix_reservations_unreleased"))
+            await conn.execute(text("ALTER TABLE reservations DROP COLUMN released_at"))
+
+        def failing_alter(conn, statement, *args, **kw):
+            if not statement.startswith("ALTER TABLE"):
+                return exec_driver_sql(conn, statement, *args, **kw)
+            if racing:  # "another worker" added it first
+                exec_driver_sql(conn, statement, *args, **kw)
+            raise OperationalError(statement, {}, Exception(error))
+
+        monkeypatch.setattr(Connection, "exec_driver_sql", failing_alter)
+        if racing:
+            await init_db(engine)
+        else:
+            with pytest.raises(OperationalError, match=error):
+                await init_db(engine)
+        monkeypatch.undo()
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_init_db_adds_missing_columns_to_existing_tables(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'legacy_columns.db'}")
+    # Deployment created before reservations.released_at existed
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.execute(text("DROP INDEX ix_reservations_unreleased"))
+        await conn.execute(text("ALTER TABLE reservations DROP COLUMN released_at"))
+
+    await init_db(engine)
+    await init_db(engine)  # idempotent
+
+    async with engine.connect() as conn:
+        columns = await conn.run_sync(
+            lambda c: {col["name"]: col for col in inspect(c).get_columns("reservations")}
+        )
+        names = await conn.run_sync(
+            lambda c: {ix["name"] for ix in inspect(c).get_indexes("reservations")}
+        )
+    assert columns["released_at"]["nullable"] is True
+    assert "ix_reservations_unreleased" in names
+    await engine.dispose()
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import create_app
+from db import init_db, make_session_factory, spots_table, users_table
+from utils.read_replica import ReadYourWrites, on_replica
+
+SECRETARY = {"X-User-Id": "1", "X-User-Roles": "SECRETAIRE", "X-User-Email": "sec@company.com"}
+OTHER = {"X-User-Id": "2", "X-User-Roles": "SECRETAIRE", "X-User-Email": "other@company.com"}
+
+
+def test_writers_stay_sticky_for_a_while():
+    now = [100.0]
+    sticky = ReadYourWrites(5.0, max_users=2, clock=lambda: now[0])
+    sticky.wrote(1)
+    assert sticky.is_sticky(1) and not sticky.is_sticky(2) and not sticky.is_sticky(None)
+    sticky.wrote(2)
+    sticky.wrote(3)  # forgets the oldest writer
+    assert not sticky.is_sticky(1) and sticky.is_sticky(3)
+    now[0] += 5
+    assert not sticky.is_sticky(3)
+
+
+@pytest.mark.asyncio
+async def test_read_only_sessions_use_the_replica(tmp_path):
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        await init_db(engine)
+    async with primary.begin() as conn:
+        await conn.execute(insert(spots_table).values(id="A01", is_free=True, electrical=False))
+
+    Session = make_session_factory(primary, replica)
+    async with Session() as session:
+        assert not on_replica(session) and len((await session.execute(select(spots_table))).all()) == 1
+    async with Session(read_only=True) as session:
+        assert on_replica(session) and (await session.execute(select(spots_table))).all() == []
+    # without a replica, read-only sessions stay on the primary
+    async with make_session_factory(primary)(read_only=True) as session:
+        assert not on_replica(session)
+    await primary.dispose()
+    await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_list_endpoints_read_from_the_replica_except_after_a_write(tmp_path, monkeypatch):
+    # the replica has the schema and one user; the primary gets the writes of the test
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    await init_db(replica)
+    async with replica.begin() as conn:
+        await conn.execute(insert(users_table).values(id=50, email="old@company.com", nom="Old", prenom="Row"))
+    await replica.dispose()
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setenv("DATABASE_REPLICA_URL", f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    os.environ["SANIC_TEST_MODE"] = "1"
+    app = create_app()
+
+    async with app.asgi_client as client:
+        _req, res = await client.post("/users/", headers=SECRETARY, json={
+            "email": "new@company.com", "nom": "New", "prenom": "User", "roles": ["EMPLOYEE"],
+        })
+        assert res.status == 201 and "rw_until" in res.cookies
+
+        # the writer reads its write from the primary
+        _req, res = await client.get("/users/", headers=SECRETARY)
+        assert [u["email"] for u in res.json] == ["new@company.com"]
+        # another user, without the cookie, reads the (lagging) replica
+        _req, res = await client.get("/users/", headers=OTHER)
+        assert [u["email"] for u in res.json] == ["old@company.com"]
+        # ... unless the cookie of a write made on another worker is sent
+        _req, res = await client.get("/users/", headers={**OTHER, "Cookie": f"rw_until={10 ** 10}"})
+        assert [u["email"] for u in res.json] == ["new@company.com"]
+
+        # routes that are not read-only use the primary
+        _req, res = await client.get("/users/me", headers={**OTHER, "X-User-Id": "1"})
+        assert res.json["email"] == "new@company.com"
+
+        _req, pool = await client.get("/health/pool")
+        _req, metrics = await client.get("/metrics")
+        _req, res = await client.get("/health/replica")
+    assert res.json == {"replica": True, "replica_sessions": 1, "sticky_sessions": 2}
+    # the replica pool is monitored next to the primary one
+    assert pool.json["checkouts"] > 0 and pool.json["replica"]["checkouts"] > 0
+    assert 'db_pool_wait_seconds_count{pool="replica"}' in metrics.text
+    assert 'db_pool_checked_out{pool="primary"}' in metrics.text
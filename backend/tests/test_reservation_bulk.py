@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_repository import SpotRepository
+from repositories.user_repository import UserRepository
+from services.reservation_service import ReservationService
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test_bulk.db'}", future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        await UserRepository(s).create(email="emp@b.com", nom="E", prenom="E", roles=["EMPLOYEE"])
+        await UserRepository(s).create(email="man@b.com", nom="M", prenom="M", roles=["MANAGER"])
+        for sid in ("A01", "B01", "C01"):
+            await SpotRepository(s).create(sid, electrical=False)
+        await ReservationRepository(s).create("A01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))
+    yield engine
+    await engine.dispose()
+
+
+def _service(session):
+    return ReservationService(
+        session, ReservationRepository(session), SpotRepository(session), UserRepository(session)
+    )
+
+
+def _item(email, spot, start, end):
+    return {"user_email": email, "spot_id": spot, "start_date": start, "end_date": end}
+
+
+ITEMS = [
+    _item("emp@b.com", "b01", "2030-01-07T08:00:00", "2030-01-07T18:00:00"),   # ok
+    _item("man@b.com", "A01", "2030-01-07T12:00:00", "2030-01-07T14:00:00"),   # conflict with the DB
+    _item("man@b.com", "B01", "2030-01-07T17:00:00", "2030-01-08T10:00:00"),   # conflict with item 0
+    _item("man@b.com", "C01", "2030-01-07T08:00:00", "2030-01-20T18:00:00"),   # ok (manager quota)
+    _item("emp@b.com", "C01", "2030-01-21T08:00:00", "2030-02-05T18:00:00"),   # employee quota
+    _item("nobody@b.com", "C01", "2030-03-01T08:00:00", "2030-03-01T18:00:00"),
+    _item("emp@b.com", "Z99", "2030-03-01T08:00:00", "2030-03-01T18:00:00"),
+    {"user_email": "emp@b.com", "spot_id": "C01", "start_date": "tomorrow", "end_date": "x"},
+]
+
+
+@pytest.mark.asyncio
+async def test_best_effort_reports_each_outcome(engine):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        outcomes = await _service(s).create_reservations_bulk(ITEMS, atomic=False)
+    event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+    assert [o["status"] for o in outcomes] == [
+        "created", "conflict", "conflict", "created", "rejected", "rejected", "rejected", "rejected",
+    ]
+    assert outcomes[0]["reservation"].spot_id == "B01"
+    assert "5 working days" in outcomes[4]["error"]
+    assert outcomes[5]["error"] == "User not found" and outcomes[6]["error"] == "Spot not found"
+    # users + spots + conflicts (reservations, series), then one conditional insert per created item
+    # and one outbox insert for all their events
+    assert len(statements) == 4 + 2 + 1
+
+    async with async_sessionmaker(engine)() as s:
+        assert len(await ReservationRepository(s).list_all()) == 3
+
+
+@pytest.mark.asyncio
+async def test_atomic_writes_nothing_when_an_item_fails(engine):
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        outcomes = await _service(s).create_reservations_bulk(ITEMS[:2], atomic=True)
+        assert [o["status"] for o in outcomes] == ["skipped", "conflict"]
+        assert len(await ReservationRepository(s).list_all()) == 1
+
+        outcomes = await _service(s).create_reservations_bulk([ITEMS[0], ITEMS[3]], atomic=True)
+        assert [o["status"] for o in outcomes] == ["created", "created"]
+
+
+@pytest.mark.asyncio
+async def test_atomic_rolls_back_on_a_concurrent_booking(engine):
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        repo = ReservationRepository(s)
+        created = await repo.create_many(
+            [("C01", 1, datetime(2030, 1, 9, 8), datetime(2030, 1, 9, 18)),
+             ("A01", 1, datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 10))],  # taken
+            atomic=True,
+        )
+        assert created == [None, None]
+        assert len(await repo.list_all()) == 1
@@ -0,0 +1,78 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import export_reservations
+from db import metadata
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_repository import SpotRepository
+from repositories.user_repository import UserRepository
+from services.reservation_export import EXPORT_COLUMNS, export_chunks, gzip_chunks
+
+
+@pytest_asyncio.fixture
+async def db_url(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'test_export.db'}"
+    engine = create_async_engine(url, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as s:
+        user = await UserRepository(s).create(email="a@b.com", nom="N", prenom="P", roles=["EMPLOYEE"])
+        await SpotRepository(s).create("A01", electrical=True)
+        await SpotRepository(s).create("B01", electrical=False)
+        repo = ReservationRepository(s)
+        await repo.create("A01", user["id"], datetime(2023, 5, 1, 8), datetime(2023, 5, 1, 18))
+        await repo.create("B01", user["id"], datetime(2024, 5, 1, 8), datetime(2024, 5, 2, 18))
+        await repo.create("A01", user["id"], datetime(2025, 5, 1, 8), datetime(2025, 5, 1, 18))
+    await engine.dispose()
+    return url
+
+
+async def _collect(chunks) -> bytes:
+    return b"".join([c async for c in chunks])
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export_joins_user_and_spot(db_url):
+    engine = create_async_engine(db_url)
+    async with async_sessionmaker(engine)() as s:
+        body = await _collect(export_chunks(ReservationRepository(s).iter_export(batch_size=2), "ndjson"))
+    await engine.dispose()
+
+    records = [json.loads(line) for line in body.decode().splitlines()]
+    assert [r["spot_id"] for r in records] == ["A01", "B01", "A01"]
+    assert list(records[0]) == list(EXPORT_COLUMNS)
+    assert records[0]["user_email"] == "a@b.com"
+    assert records[0]["spot_electrical"] is True and records[1]["spot_electrical"] is False
+    assert records[1]["start_date"] == "2024-05-01T08:00:00"
+
+
+@pytest.mark.asyncio
+async def test_csv_gzip_export_filtered_by_date_range(db_url):
+    engine = create_async_engine(db_url)
+    async with async_sessionmaker(engine)() as s:
+        rows = ReservationRepository(s).iter_export(start_date=datetime(2024, 1, 1), end_date=datetime(2025, 1, 1))
+        body = await _collect(gzip_chunks(export_chunks(rows, "csv")))
+    await engine.dispose()
+
+    lines = list(csv.reader(io.StringIO(gzip.decompress(body).decode())))
+    assert lines[0] == list(EXPORT_COLUMNS)
+    assert [line[1] for line in lines[1:]] == ["B01"]
+
+
+@pytest.mark.asyncio
+async def test_cli_export_writes_all_rows(db_url, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", db_url)
+    out = io.BytesIO()
+    written = await export_reservations.export(out, fmt="ndjson", compress=True, batch_size=1)
+
+    assert written == len(out.getvalue())
+    assert len(gzip.decompress(out.getvalue()).splitlines()) == 3
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from repositories.reservation_index import SpotIntervalIndex
+
+
+def _dt(day, hour=0):
+    return datetime(2030, 1, day, hour)
+
+
+def _warm(rows, horizon=datetime(2030, 1, 1)):
+    idx = SpotIntervalIndex()
+    idx.warm(rows, horizon=horizon)
+    return idx
+
+
+def _row(rid, spot_id, start, end, checked_in=False):
+    return {"id": rid, "spot_id": spot_id, "start_date": start, "end_date": end, "checked_in": checked_in}
+
+
+def test_overlaps_is_half_open():
+    idx = _warm([_row(1, "A01", _dt(2), _dt(4))])
+
+    assert idx.overlaps("A01", _dt(3), _dt(5))
+    assert idx.overlaps("A01", _dt(1), _dt(2, 1))
+    # adjacent ranges do not overlap
+    assert not idx.overlaps("A01", _dt(4), _dt(6))
+    assert not idx.overlaps("A01", _dt(1), _dt(2))
+    # other spot untouched
+    assert not idx.overlaps("B01", _dt(3), _dt(5))
+
+
+def test_long_interval_hidden_behind_later_starts():
+    # the prefix max must see the long first interval even if later ones end early
+    idx = _warm([
+        _row(1, "A01", _dt(2), _dt(20)),
+        _row(2, "A01", _dt(5), _dt(6)),
+        _row(3, "A01", _dt(7), _dt(8)),
+    ])
+    assert idx.overlaps("A01", _dt(15), _dt(16))
+    idx.remove(1)
+    assert not idx.overlaps("A01", _dt(15), _dt(16))
+    assert idx.overlaps("A01", _dt(7, 12), _dt(9))
+
+
+def test_add_remove_and_horizon():
+    idx = _warm([])
+    idx.add(1, "A01", _dt(3), _dt(4))
+    assert len(idx) == 1 and idx.overlaps("A01", _dt(3), _dt(3, 12))
+
+    idx.remove(1)
+    assert len(idx) == 0 and not idx.overlaps("A01", _dt(3), _dt(3, 12))
+
+    # ended before the horizon -> not indexed, and queries before it are not covered
+    idx.add(2, "A01", datetime(2029, 12, 1), datetime(2029, 12, 2))
+    assert len(idx) == 0
+    assert not idx.covers(datetime(2029, 12, 1))
+    assert idx.covers(_dt(1))
+
+
+def test_release_unchecked_mirrors_repository_update():
+    idx = _warm([
+        _row(1, "A01", _dt(2, 8), _dt(6)),
+        _row(2, "B01", _dt(2, 8), _dt(6), checked_in=True),
+    ])
+    idx.mark_checked_in(1)
+    idx.add(3, "C01", _dt(2, 9), _dt(6))
+
+    idx.release_unchecked(_dt(2, 11))
+
+    assert idx.overlaps("A01", _dt(4), _dt(5))   # checked in -> kept
+    assert idx.overlaps("B01", _dt(4), _dt(5))
+    assert not idx.overlaps("C01", _dt(4), _dt(5))  # released at 11:00
+    assert idx.overlaps("C01", _dt(2, 10), _dt(2, 12))
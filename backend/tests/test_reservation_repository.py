@@ -0,0 +1,137 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata
+from repositories.reservation_index import SpotIntervalIndex
+from repositories.reservation_repository import ReservationRepository
+
+
+@pytest_asyncio.fixture
+async def session(tmp_path):
+    db_file = tmp_path / "test_reservation_repo.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_file}", future=True)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with Session() as s:
+        yield s
+
+    await engine.dispose()
+
+
+D1 = datetime(2030, 1, 7)
+D2 = datetime(2030, 1, 9)
+D3 = datetime(2030, 1, 11)
+
+
+class TestReservationRepository:
+    @pytest.mark.asyncio
+    async def test_create_is_conditional(self, session):
+        repo = ReservationRepository(session)
+
+        r1 = await repo.create("A01", 1, D1, D2)
+        assert r1.id is not None and r1.spot_id == "A01" and r1.checked_in is False
+
+        # overlapping -> refused by the insert itself
+        assert await repo.create("A01", 2, D1, D3) is None
+        assert await repo.has_overlap("A01", D1, D3) is True
+
+        # adjacent / other spot -> ok
+        assert (await repo.create("A01", 2, D2, D3)) is not None
+        assert (await repo.create("B01", 2, D1, D3)) is not None
+        assert len(await repo.list_all()) == 3
+
+    @pytest.mark.asyncio
+    async def test_index_is_warmed_and_written_through(self, session):
+        await ReservationRepository(session).create("A01", 1, D1, D2)
+
+        index = SpotIntervalIndex()
+        repo = ReservationRepository(session, index=index)
+        assert await repo.warm_index(horizon=datetime(2030, 1, 1)) == 1
+        assert await repo.has_overlap("A01", D1, D3) is True
+
+        r2 = await repo.create("B01", 1, D1, D2)
+        assert index.overlaps("B01", D1, D2)
+
+        await repo.delete(r2.id)
+        assert not index.overlaps("B01", D1, D2)
+
+    @pytest.mark.asyncio
+    async def test_stale_index_is_resynced_on_conflict(self, session):
+        index = SpotIntervalIndex()
+        repo = ReservationRepository(session, index=index)
+        await repo.warm_index(horizon=datetime(2030, 1, 1))
+
+        # written by "another worker": the index does not know it
+        await ReservationRepository(session).create("A01", 1, D1, D2)
+        assert await repo.has_overlap("A01", D1, D2) is False
+
+        assert await repo.create("A01", 2, D1, D2) is None
+        assert await repo.has_overlap("A01", D1, D2) is True
+
+    @pytest.mark.asyncio
+    async def test_stale_index_hit_is_confirmed_before_reporting_busy(self, session):
+        r1 = await ReservationRepository(session).create("A01", 1, D1, D2)
+        index = SpotIntervalIndex()
+        repo = ReservationRepository(session, index=index)
+        await repo.warm_index(horizon=datetime(2030, 1, 1))
+
+        # cancelled by "another worker": the index still holds it
+        await ReservationRepository(session).delete(r1.id)
+        assert index.overlaps("A01", D1, D2)
+        assert await repo.has_overlap("A01", D1, D2) is False
+        assert not index.overlaps("A01", D1, D2)
+
+    @pytest.mark.asyncio
+    async def test_keyset_pages_and_stream_agree(self, session):
+        repo = ReservationRepository(session)
+        for i in range(5):
+            await repo.create(f"A0{i}", 1 + i % 2, D1, D2)
+        await repo.create("B01", 1, datetime(2030, 2, 1), datetime(2030, 2, 2))
+
+        seen, after = [], None
+        while True:
+            page = await repo.list_page(limit=2, after_id=after)
+            seen += [r.id for r in page[:2]]
+            if len(page) <= 2:
+                break
+            after = page[1].id
+        assert seen == sorted(r.id for r in await repo.list_all())
+        assert [r.id async for r in repo.iter_all(batch_size=2)] == seen
+
+        # filters: user, spot, overlapping date range
+        assert {r.user_id for r in await repo.list_page(limit=10, user_id=2)} == {2}
+        assert [r.spot_id for r in await repo.list_page(limit=10, spot_id="B01")] == ["B01"]
+        february = [r async for r in repo.iter_all(start_date=datetime(2030, 2, 1), end_date=datetime(2030, 3, 1))]
+        assert [r.spot_id for r in february] == ["B01"]
+
+    @pytest.mark.asyncio
+    async def test_release_unchecked_is_incremental_and_batched(self, session):
+        from sqlalchemy import select
+        from db import reservations_table
+
+        cutoff = datetime(2030, 1, 7, 11)
+        repo = ReservationRepository(session)
+        old = await repo.create("A01", 1, datetime(2029, 12, 1, 8), datetime(2029, 12, 1, 18))
+        running = [await repo.create(f"B0{i}", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18)) for i in range(5)]
+        checked = await repo.create("C01", 1, datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 18))
+        await repo.check_in(checked.id)
+        later = await repo.create("D01", 1, datetime(2030, 1, 7, 14), datetime(2030, 1, 7, 18))
+
+        assert await repo.release_unchecked(cutoff, batch_size=2) == 5
+        # second pass: nothing left to touch
+        assert await repo.release_unchecked(cutoff, batch_size=2) == 0
+
+        rows = {
+            r["id"]: r for r in (await session.execute(select(reservations_table))).mappings().all()
+        }
+        for r in running:
+            assert rows[r.id]["end_date"] == cutoff and rows[r.id]["released_at"] is not None
+        for untouched in (old, checked, later):
+            assert rows[untouched.id]["released_at"] is None
+        assert rows[old.id]["end_date"] == datetime(2029, 12, 1, 18)
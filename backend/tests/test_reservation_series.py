@@ -0,0 +1,178 @@
+import asyncio
+import random
+from dataclasses import replace
+from datetime import date, datetime, time, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata
+from model.reservation_series import ReservationSeries, parse_rrule
+from repositories.reservation_repository import ReservationRepository
+
+TU, TH = 1 << 1, 1 << 3
+MONDAY = date(2030, 1, 7)
+
+
+def _series(weekdays=TU | TH, start=time(8), end=time(18), first=MONDAY, last=date(2030, 3, 29), spot_id="A01"):
+    return ReservationSeries(id=None, spot_id=spot_id, user_id=1, weekdays=weekdays,
+                             start_time=start, end_time=end, first_day=first, last_day=last)
+
+
+def _dt(day, hour=0, minute=0):
+    return datetime(2030, 1, day, hour, minute)
+
+
+def test_parse_rrule_round_trips():
+    assert parse_rrule("FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20300329") == (TU | TH, date(2030, 3, 29))
+    assert parse_rrule("freq=weekly;until=20300329T235959Z;byday=th,tu")[0] == TU | TH
+    assert _series().rrule == "FREQ=WEEKLY;BYDAY=TU,TH;UNTIL=20300329"
+    for bad in ("FREQ=DAILY;BYDAY=TU;UNTIL=20300329", "FREQ=WEEKLY;BYDAY=TU", "FREQ=WEEKLY;BYDAY=XX;UNTIL=20300329",
+                "FREQ=WEEKLY;BYDAY=TU;UNTIL=20300329;COUNT=3"):
+        with pytest.raises(ValueError):
+            parse_rrule(bad)
+
+
+def test_occurrences_are_expanded_on_demand():
+    s = _series(last=date(2030, 1, 20))
+    assert [o[0] for o in s.occurrences()] == [_dt(8, 8), _dt(10, 8), _dt(15, 8), _dt(17, 8)]
+    # window cut in the middle of an occurrence keeps it
+    assert list(s.occurrences(_dt(10, 17), _dt(15, 9))) == [(_dt(10, 8), _dt(10, 18)), (_dt(15, 8), _dt(15, 18))]
+    assert list(s.occurrences(_dt(10, 18), _dt(15, 8))) == []
+
+
+def test_analytic_overlap_matches_enumeration():
+    rng = random.Random(3)
+    for _ in range(2000):
+        s = _series(
+            weekdays=rng.randint(1, 127), start=time(rng.randint(0, 11)), end=time(rng.randint(12, 23)),
+            first=MONDAY + timedelta(days=rng.randint(0, 10)), last=MONDAY + timedelta(days=rng.randint(10, 40)),
+        )
+        start = datetime.combine(MONDAY, time()) + timedelta(hours=rng.randint(-48, 24 * 45))
+        end = start + timedelta(hours=rng.randint(1, 24 * 12))
+        expected = any(a < end and b > start for a, b in s.occurrences())
+        assert s.overlaps(start, end) is expected
+
+
+
+@pytest_asyncio.fixture
+async def session(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test_series.db'}", future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        yield s
+    await engine.dispose()
+
+
+class TestSeriesRepository:
+    @pytest.mark.asyncio
+    async def test_create_series_checks_reservations_and_series(self, session):
+        repo = ReservationRepository(session)
+        # Monday booking: not on a series day
+        assert await repo.create("A01", 2, _dt(14, 8), _dt(14, 18)) is not None
+        series = await repo.create_series(_series())
+        assert series.id is not None and series.rrule.startswith("FREQ=WEEKLY;BYDAY=TU,TH")
+
+        # same days, later time slot: no conflict; overlapping weekday + time: conflict
+        assert await repo.create_series(_series(start=time(18), end=time(20))) is not None
+        assert await repo.create_series(_series(weekdays=1 << 3 | 1 << 4, start=time(12), end=time(13))) is None
+        # a one-off reservation on a Thursday of the span blocks a new series
+        await repo.create("B01", 2, _dt(17, 9), _dt(17, 10))
+        assert await repo.create_series(_series(spot_id="B01")) is None
+        assert await repo.create_series(_series(spot_id="B01", first=date(2030, 1, 18))) is not None
+
+        assert await repo.has_overlap("A01", _dt(22, 12), _dt(22, 13)) is True   # a Tuesday
+        # the conditional insert itself refuses the slot, not only the pre-check
+        assert await repo.create("A01", 2, _dt(22, 12), _dt(22, 13)) is None
+        assert await repo.create("A01", 2, _dt(21, 12), _dt(22, 8, 30)) is None  # into the Tuesday morning
+        assert await repo.create("A01", 2, _dt(22, 20), _dt(23, 9)) is not None  # after both end
+        assert await repo.has_overlap("A01", _dt(23, 12), _dt(23, 13)) is False  # a Wednesday
+        assert await repo.conflicts([("A01", _dt(23, 12), _dt(24, 9))]) == {0}
+
+    @pytest.mark.asyncio
+    async def test_reads_expand_occurrences_lazily(self, session):
+        repo = ReservationRepository(session)
+        series = await repo.create_series(_series())
+        await repo.create("C01", 1, _dt(9, 8), _dt(9, 18))
+
+        week = await repo.list_by_date_range(_dt(7), _dt(14))
+        assert [(r.id is None, r.series_id, r.start_date) for r in week] == [
+            (False, None, _dt(9, 8)), (True, series.id, _dt(8, 8)), (True, series.id, _dt(10, 8)),
+        ]
+        mine = await repo.get_by_user(1)
+        assert len(mine) == 1 + 24  # 12 weeks of Tuesdays and Thursdays
+
+    @pytest.mark.asyncio
+    async def test_checked_in_and_released_occurrences_replace_the_computed_one(self, session):
+        repo = ReservationRepository(session)
+        series = await repo.create_series(_series())
+
+        checked = await repo.check_in_occurrence(series, date(2030, 1, 8))
+        assert checked.id is not None and checked.checked_in and checked.series_id == series.id
+        assert await repo.check_in_occurrence(series, date(2030, 1, 8)) is None
+
+        # Thursday at 11:00, nobody came: the spot is free for the afternoon
+        assert await repo.release_series_occurrences(_dt(10, 11)) == 1
+        assert await repo.release_series_occurrences(_dt(10, 11)) == 0
+        assert await repo.has_overlap("A01", _dt(10, 12), _dt(10, 14)) is False
+        assert await repo.has_overlap("A01", _dt(10, 9), _dt(10, 10)) is True
+
+        week = await repo.list_by_date_range(_dt(7), _dt(14))
+        assert sorted((r.start_date, r.end_date, r.checked_in) for r in week) == [
+            (_dt(8, 8), _dt(8, 18), True), (_dt(10, 8), _dt(10, 11), False),
+        ]
+
+        # the released afternoon can be booked, the morning still belongs to the occurrence row
+        assert await repo.create("A01", 2, _dt(10, 9), _dt(10, 10)) is None
+        assert await repo.create("A01", 2, _dt(10, 12), _dt(10, 14)) is not None
+
+        await repo.delete_series(series.id)
+        assert await repo.get_series(series.id) is None
+        assert len(await repo.get_by_user(1)) == 2  # materialized ones stay, as plain reservations
+
+    @pytest.mark.asyncio
+    async def test_concurrent_conflicting_series_store_one(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'race.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def attempt(k):
+            # each one shares Thursday 12:00-13:00 with every other, over a full year
+            async with Session() as session:
+                return await ReservationRepository(session).create_series(
+                    _series(weekdays=TH | 1 << (k % 7), start=time(12 - k % 3), end=time(13 + k % 2),
+                            last=date(2030, 12, 31))
+                )
+
+        results = await asyncio.gather(*(attempt(k) for k in range(8)))
+        assert sum(r is not None for r in results) == 1
+        await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_sql_series_conflicts_match_enumeration(self, session):
+        # the conditional INSERT decides by span and weekday mask in SQL: same answer
+        # as walking the occurrences, across day and time-of-day boundaries
+        repo = ReservationRepository(session)
+        rng = random.Random(5)
+        for k in range(150):
+            series = _series(
+                spot_id=f"R{k}", weekdays=rng.randint(1, 127), start=time(rng.randint(0, 11)),
+                end=time(rng.randint(12, 23)), first=MONDAY + timedelta(days=rng.randint(0, 10)),
+                last=MONDAY + timedelta(days=rng.randint(10, 30)),
+            )
+            start = datetime.combine(MONDAY, time()) + timedelta(hours=rng.randint(-48, 24 * 35))
+            end = start + timedelta(hours=rng.randint(1, 24 * 5))
+            await repo.create(series.spot_id, 2, start, end)
+            expected = any(a < end and b > start for a, b in series.occurrences())
+            assert (await repo.create_series(series) is None) is expected
+
+            other = _series(
+                spot_id=f"S{k}", weekdays=rng.randint(1, 127), start=time(rng.randint(0, 22)), end=time(23),
+                first=MONDAY + timedelta(days=rng.randint(0, 20)), last=MONDAY + timedelta(days=rng.randint(20, 40)),
+            )
+            assert await repo.create_series(other) is not None
+            expected = any(series.overlaps(a, b) for a, b in other.occurrences())
+            assert (await repo.create_series(replace(series, spot_id=other.spot_id)) is None) is expected
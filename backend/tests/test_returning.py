@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata
+from repositories.parking_repository import ParkingRepository
+from repositories.reservation_repository import ReservationRepository
+from repositories.spot_repository import SpotRepository
+from repositories.user_repository import UserRepository
+
+
+@pytest_asyncio.fixture(params=["returning", "emulated"])
+async def session(request, tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test_returning.db'}")
+    if request.param == "emulated":
+        # behave like MySQL: no RETURNING support
+        engine.dialect.insert_returning = False
+        engine.dialect.update_returning = False
+
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+    statements = []
+    event.listen(
+        engine.sync_engine, "before_cursor_execute",
+        lambda _c, _cur, statement, *_a: statements.append(statement),
+    )
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        s.info["statements"] = statements
+        s.info["mode"] = request.param
+        yield s
+
+    await engine.dispose()
+
+
+def _count(session, before: int) -> int:
+    return len(session.info["statements"]) - before
+
+
+@pytest.mark.asyncio
+async def test_writes_return_the_persisted_row(session):
+    returning = session.info["mode"] == "returning"
+    spots, users, reservations = SpotRepository(session), UserRepository(session), ReservationRepository(session)
+
+    n = len(session.info["statements"])
+    spot = await spots.create("A01", electrical=True)
+    assert spot["id"] == "A01" and spot["is_free"] is True and spot["updated_at"] is not None
+    # + its outbox event
+    assert _count(session, n) == (2 if returning else 3)
+
+    n = len(session.info["statements"])
+    spot = await spots.update_spot("A01", is_free=False)
+    assert spot["is_free"] is False
+    assert _count(session, n) == (2 if returning else 3)
+    assert await spots.update_spot("ZZZ", is_free=False) is None
+
+    n = len(session.info["statements"])
+    user = await users.create(email="r@b.com", nom="R", prenom="B", roles=["employee", "MANAGER"])
+    assert user["id"] is not None and user["created_at"] is not None
+    assert user["roles"] == ["EMPLOYEE", "MANAGER"]
+    # user insert + roles insert, no re-read
+    assert _count(session, n) == (2 if returning else 3)
+
+    n = len(session.info["statements"])
+    r = await reservations.create("A01", user["id"], datetime(2030, 1, 7), datetime(2030, 1, 8))
+    assert r.id is not None and r.created_at is not None
+    # + its outbox event
+    assert _count(session, n) == (2 if returning else 3)
+    assert await reservations.create("A01", user["id"], datetime(2030, 1, 7), datetime(2030, 1, 8)) is None
+
+    checked = await reservations.check_in(r.id)
+    assert checked.id == r.id and checked.checked_in is True
+    assert await reservations.check_in(9999) is None
+
+    parking = ParkingRepository(session)
+    assert (await parking.get_config())["slots_max"] == 60  # auto-created
+    assert (await parking.update_config(slots_max=12))["slots_max"] == 12
+    cfg = await parking.create_or_reset_config(slots_max=30)
+    assert cfg["id"] == 1 and cfg["slots_max"] == 30
@@ -0,0 +1,53 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata, spots_table
+from model.reservation import Reservation
+from utils.serialization import dumps, json as json_response
+
+
+class Role(Enum):
+    MANAGER = "MANAGER"
+
+
+def test_encodes_slotted_dataclasses_and_datetimes():
+    r = Reservation(id=1, spot_id="A01", user_id=2,
+                    start_date=datetime(2030, 1, 7, 8), end_date=datetime(2030, 1, 7, 18, 0, 0, 5))
+    assert json.loads(dumps([r])) == [{
+        "id": 1, "spot_id": "A01", "user_id": 2,
+        "start_date": "2030-01-07T08:00:00", "end_date": "2030-01-07T18:00:00.000005",
+        "checked_in": False, "released_at": None, "created_at": None, "updated_at": None,
+        "series_id": None,
+    }]
+
+
+def test_encodes_enums_decimals_sets_and_dates():
+    out = json.loads(dumps({"role": Role.MANAGER, "rate": Decimal("0.5"), "roles": {"EMPLOYEE"}, "day": date(2030, 1, 7)}))
+    assert out == {"role": "MANAGER", "rate": 0.5, "roles": ["EMPLOYEE"], "day": "2030-01-07"}
+
+
+def test_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        dumps({"x": object()})
+
+
+@pytest.mark.asyncio
+async def test_encodes_row_mappings(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ser.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.execute(spots_table.insert().values(id="A01", is_free=True, electrical=False))
+    async with async_sessionmaker(engine)() as s:
+        row = (await s.execute(select(spots_table.c.id, spots_table.c.is_free))).mappings().one()
+        res = json_response([row], status=201)
+    await engine.dispose()
+
+    assert res.status == 201 and res.content_type == "application/json"
+    assert json.loads(res.body) == [{"id": "A01", "is_free": True}]
@@ -0,0 +1,92 @@
+from datetime import date, datetime, time
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db import metadata, reservations_table, spots_table
+from model.allocation import AllocationRequest
+from model.reservation_series import ReservationSeries
+from repositories.reservation_index import SpotIntervalIndex
+from repositories.reservation_repository import ReservationRepository
+from services.spot_allocator import FirstFitScoring, PreferenceScoring, make_scoring
+
+SPOTS = [f"{row}{i:02d}" for row in "ABCDEF" for i in range(1, 11)]
+START, END = datetime(2030, 1, 8, 8), datetime(2030, 1, 8, 18)  # a Tuesday
+FREE = {"A07", "B03", "D05"}  # 57 of the 60 spots are taken: 95% full
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test_allocator.db'}", future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.execute(insert(spots_table), [
+            {"id": s, "is_free": True, "electrical": s[0] in "AF"} for s in SPOTS
+        ])
+        await conn.execute(insert(reservations_table), [
+            {"spot_id": s, "user_id": 1, "start_date": START, "end_date": END, "checked_in": False}
+            for s in SPOTS if s not in FREE
+        ])
+    yield engine
+    await engine.dispose()
+
+
+def _request(**kwargs):
+    return AllocationRequest(start_date=datetime(2030, 1, 8, 9), end_date=datetime(2030, 1, 8, 12), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_books_in_one_statement_when_the_lot_is_almost_full(engine):
+    statements = []
+    listener = lambda _c, _cur, statement, *_args: statements.append(statement)
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        r = await ReservationRepository(s).create_any(2, _request(), PreferenceScoring())
+    event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+    # non-electrical request: the charging spot A07 comes last
+    assert r.spot_id == "B03" and r.user_id == 2
+    assert [st.split()[0] for st in statements if "reservations" in st] == ["INSERT"]
+
+
+@pytest.mark.asyncio
+async def test_scoring_favours_associated_spot_then_row(engine):
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        repo = ReservationRepository(s)
+        assert (await repo.create_any(2, _request(associated_spot="D05", preferred_row="B"), PreferenceScoring())).spot_id == "D05"
+        assert (await repo.create_any(2, _request(preferred_row="A"), PreferenceScoring())).spot_id == "A07"
+        assert (await repo.create_any(2, _request(), make_scoring("first_fit"))).spot_id == "B03"
+        assert await repo.create_any(2, _request(), FirstFitScoring()) is None
+
+
+@pytest.mark.asyncio
+async def test_electrical_requirement_and_series_are_respected(engine):
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        repo = ReservationRepository(s)
+        await repo.create_series(ReservationSeries(
+            id=None, spot_id="B03", user_id=3, weekdays=1 << 1, start_time=time(7), end_time=time(19),
+            first_day=date(2030, 1, 1), last_day=date(2030, 1, 31),
+        ))
+        assert (await repo.create_any(2, _request(), PreferenceScoring())).spot_id == "D05"
+        assert (await repo.create_any(2, _request(electrical=True), PreferenceScoring())).spot_id == "A07"
+        assert await repo.create_any(2, _request(electrical=True), PreferenceScoring()) is None
+
+
+@pytest.mark.asyncio
+async def test_stale_index_falls_back_to_the_database(engine):
+    index = SpotIntervalIndex()
+    async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+        repo = ReservationRepository(s, index=index)
+        await repo.warm_index(horizon=datetime(2030, 1, 1))
+        # bookings made by another worker, unknown to this index...
+        index.add(-1, "B03", START, END)
+        index.add(-2, "D05", START, END)
+        index.add(-3, "A07", START, END)
+        # ... which still lets the DB find the free spots
+        assert (await repo.create_any(2, _request(), PreferenceScoring())).spot_id == "B03"
+        assert index.overlaps("B03", START, END)
+
+    with pytest.raises(ValueError):
+        make_scoring("random")
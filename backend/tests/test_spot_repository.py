@@ -1,9 +1,13 @@
 import pytest
+from datetime import date, datetime, time
 import pytest_asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from db import metadata
+from model.reservation_series import ReservationSeries
 from repositories.spot_repository import SpotRepository
+from repositories.reservation_repository import ReservationRepository
+from services.spot_service import SpotService
 
 
 @pytest_asyncio.fixture
@@ -45,6 +49,18 @@ class TestSpotRepository:
         assert ok is True
         assert await repo.get("A01") is None
 
+    @pytest.mark.asyncio
+    async def test_list_page_and_iter_all(self, session):
+        repo = SpotRepository(session)
+        for sid in ("C01", "A01", "B01", "A02"):
+            await repo.create(sid, electrical=sid.startswith("A"), is_free=True)
+
+        first = await repo.list_page(limit=2)
+        assert [s["id"] for s in first] == ["A01", "A02", "B01"]
+        assert [s["id"] for s in await repo.list_page(limit=2, after_id="A02")] == ["B01", "C01"]
+        assert [s["id"] for s in await repo.list_page(limit=5, electrical=False)] == ["B01", "C01"]
+        assert [s["id"] async for s in repo.iter_all(batch_size=1)] == ["A01", "A02", "B01", "C01"]
+
     @pytest.mark.asyncio
     async def test_list_available_filter_electrical(self, session):
         repo = SpotRepository(session)
@@ -58,3 +74,60 @@ class TestSpotRepository:
 
         available_elec = await repo.list_available(electrical_required=True)
         assert {s["id"] for s in available_elec} == {"A01"}
+
+    @pytest.mark.asyncio
+    async def test_availability_matrix(self, session):
+        repo = SpotRepository(session)
+        res_repo = ReservationRepository(session)
+
+        await repo.create("A01", electrical=True)
+        await repo.create("B01", electrical=False)
+        await repo.create("F10", electrical=True)
+
+        # Tue 8 -> Wed 9 (frontend style end T23:59:59), and one straddling the window start
+        await res_repo.create("A01", 1, datetime(2030, 1, 8), datetime(2030, 1, 9, 23, 59, 59))
+        await res_repo.create("B01", 1, datetime(2030, 1, 1), datetime(2030, 1, 7, 11))
+        # outside the window
+        await res_repo.create("F10", 1, datetime(2030, 2, 1), datetime(2030, 2, 2))
+
+        matrix = await SpotService(repo).availability_matrix(date(2030, 1, 7), date(2030, 1, 13))
+        assert matrix["days"][0] == "2030-01-07" and len(matrix["days"]) == 7
+
+        by_id = {s["id"]: s for s in matrix["spots"]}
+        assert by_id["A01"]["occupied"] == "0110000"
+        assert "mask" not in by_id["A01"]
+        assert by_id["B01"]["occupied"] == "1000000"
+        assert by_id["F10"]["free"] is True
+
+        elec = await SpotService(repo).availability_matrix(
+            date(2030, 1, 7), date(2030, 1, 13), electrical_required=True
+        )
+        assert {s["id"] for s in elec["spots"]} == {"A01", "F10"}
+
+    @pytest.mark.asyncio
+    async def test_availability_matrix_counts_series_occurrences(self, session):
+        repo = SpotRepository(session)
+        res_repo = ReservationRepository(session)
+        await repo.create("A01", electrical=True)
+        await repo.create("B01", electrical=False)
+
+        # Tuesdays and Thursdays until Thu 10 on A01, Mondays from Mon 14 on B01
+        tu_th = await res_repo.create_series(ReservationSeries(
+            id=None, spot_id="A01", user_id=1, weekdays=1 << 1 | 1 << 3, start_time=time(8), end_time=time(18),
+            first_day=date(2030, 1, 1), last_day=date(2030, 1, 10),
+        ))
+        await res_repo.create_series(ReservationSeries(
+            id=None, spot_id="B01", user_id=1, weekdays=1, start_time=time(8), end_time=time(18),
+            first_day=date(2030, 1, 13), last_day=date(2030, 3, 1),
+        ))
+        # a checked-in occurrence has its own row: the day stays occupied once
+        await res_repo.check_in_occurrence(tu_th, date(2030, 1, 8))
+
+        matrix = await SpotService(repo).availability_matrix(date(2030, 1, 7), date(2030, 1, 21))
+        by_id = {s["id"]: s["occupied"] for s in matrix["spots"]}
+        assert by_id == {"A01": "010100000000000", "B01": "000000010000001"}
+
+        elec = await SpotService(repo).availability_matrix(
+            date(2030, 1, 7), date(2030, 1, 21), electrical_required=True
+        )
+        assert [s["id"] for s in elec["spots"]] == ["A01"]
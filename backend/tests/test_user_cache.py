@@ -0,0 +1,69 @@
+from repositories.user_cache import UserCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _user(uid, email=None, roles=("EMPLOYEE",)):
+    return {"id": uid, "email": email or f"u{uid}@b.com", "nom": "N", "prenom": "P", "roles": list(roles)}
+
+
+def test_hit_by_id_and_email_and_counters():
+    cache = UserCache()
+    assert cache.get_by_email("u1@b.com") is None
+
+    cache.put(_user(1))
+    assert cache.get_by_email("u1@b.com")["id"] == 1
+    assert cache.get_by_id(1)["email"] == "u1@b.com"
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["db_round_trips_saved"] == 4
+
+
+def test_returned_records_are_copies():
+    cache = UserCache()
+    cache.put(_user(1))
+    cache.get_by_id(1)["roles"].append("MANAGER")
+    assert cache.get_by_id(1)["roles"] == ["EMPLOYEE"]
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = UserCache(ttl_s=10, clock=clock)
+    cache.put(_user(1))
+
+    clock.now = 9.9
+    assert cache.get_by_id(1) is not None
+    clock.now = 10.0
+    assert cache.get_by_id(1) is None
+    assert cache.get_by_email("u1@b.com") is None
+
+
+def test_lru_eviction():
+    cache = UserCache(max_size=2)
+    cache.put(_user(1))
+    cache.put(_user(2))
+    cache.get_by_id(1)  # 2 becomes least recently used
+    cache.put(_user(3))
+
+    assert cache.get_by_id(2) is None and cache.get_by_email("u2@b.com") is None
+    assert cache.get_by_id(1) is not None and cache.get_by_id(3) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_email_key_and_blocks_stale_put():
+    cache = UserCache()
+    cache.put(_user(1, "old@b.com"))
+
+    token = cache.write_token()  # a read starts...
+    cache.invalidate(1)          # ...a write lands meanwhile
+    cache.put(_user(1, "old@b.com"), token)
+
+    assert cache.get_by_email("old@b.com") is None
+    assert cache.get_by_id(1) is None
@@ -3,6 +3,7 @@ import pytest_asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from db import metadata
+from repositories.user_cache import UserCache
 from repositories.user_repository import UserRepository
 
 
@@ -61,6 +62,29 @@ class TestUserRepository:
         emails = {u["email"] for u in all_users}
         assert emails == {"a@b.com", "m@b.com"}
 
+    @pytest.mark.asyncio
+    async def test_list_page_and_iter_all(self, session):
+        repo = UserRepository(session)
+        for i in range(5):
+            await repo.create(
+                email=f"u{i}@b.com", nom="N", prenom="P",
+                roles=["EMPLOYEE", "MANAGER"] if i % 2 else ["EMPLOYEE"],
+                spot_associe="A01" if i == 3 else None,
+            )
+
+        first = await repo.list_page(limit=2)
+        assert len(first) == 3  # limit + 1: there is a next page
+        second = await repo.list_page(limit=2, after_id=first[1]["id"])
+        assert [u["email"] for u in first[:2] + second] == [f"u{i}@b.com" for i in range(5)]
+        # roles are complete even though the page is cut on users, not on (user, role) rows
+        assert set(first[1]["roles"]) == {"EMPLOYEE", "MANAGER"}
+
+        streamed = [u async for u in repo.iter_all(batch_size=2)]
+        assert [(u["id"], sorted(u["roles"])) for u in streamed] == [
+            (u["id"], sorted(u["roles"])) for u in await repo.list()
+        ]
+        assert [u["email"] for u in await repo.list_page(limit=10, spot_associe="A01")] == ["u3@b.com"]
+
     @pytest.mark.asyncio
     async def test_update_user(self, session):
         repo = UserRepository(session)
@@ -98,3 +122,52 @@ class TestUserRepository:
 
         assert await repo.get_by_id(u["id"]) is None
         assert await repo.get_by_email("del@b.com") is None
+
+    @pytest.mark.asyncio
+    async def test_cache_is_invalidated_by_writes(self, session):
+        cache = UserCache()
+        repo = UserRepository(session, cache=cache)
+        u = await repo.create(email="c@b.com", nom="Cache", prenom="Me", roles=["EMPLOYEE"])
+
+        await repo.get_by_email("c@b.com")
+        hits = cache.hits
+        assert (await repo.get_by_email("c@b.com"))["id"] == u["id"]
+        assert cache.hits == hits + 1
+
+        await repo.add_role(u["id"], "MANAGER")
+        assert set((await repo.get_by_email("c@b.com"))["roles"]) == {"EMPLOYEE", "MANAGER"}
+
+        await repo.remove_role(u["id"], "EMPLOYEE")
+        assert (await repo.get_by_id(u["id"]))["roles"] == ["MANAGER"]
+
+        await repo.set_roles(u["id"], ["SECRETAIRE"])
+        assert (await repo.get_by_email("c@b.com"))["roles"] == ["SECRETAIRE"]
+
+        await repo.update_user(u["id"], email="new@b.com")
+        assert await repo.get_by_email("c@b.com") is None
+        assert (await repo.get_by_email("new@b.com"))["id"] == u["id"]
+
+        await repo.delete(u["id"])
+        assert await repo.get_by_email("new@b.com") is None
+        assert await repo.get_by_id(u["id"]) is None
+
+    @pytest.mark.asyncio
+    async def test_set_roles_invalidates_after_commit(self, session):
+        cache = UserCache()
+        repo = UserRepository(session, cache=cache)
+        u = await repo.create(email="r@b.com", nom="Race", prenom="Me", roles=["EMPLOYEE"])
+        other = async_sessionmaker(session.bind, expire_on_commit=False)()
+
+        commit = session.commit
+
+        async def read_then_commit():
+            # another request reads (and caches) the roles before the write commits
+            assert (await UserRepository(other, cache=cache).get_by_id(u["id"]))["roles"] == ["EMPLOYEE"]
+            await commit()
+
+        session.commit = read_then_commit
+        await repo.set_roles(u["id"], ["MANAGER"])
+        session.commit = commit
+        await other.close()
+
+        assert (await repo.get_by_id(u["id"]))["roles"] == ["MANAGER"]
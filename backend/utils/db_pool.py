@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sanic.log import logger
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Connection pool of the engines of db.make_engine: sizing from the environment,
+# the time each checkout waited for a connection, and the checkouts that found
+# the pool exhausted. Instead of a ping on every checkout (pool_pre_ping), the
+# idle connections are pinged from a background task (run_background.py).
+
+# Set while ping_idle_connections checks out: its checkouts are pings, not waits of
+# the application. A context variable, so requests checking out meanwhile still count.
+_pinging: ContextVar[bool] = ContextVar("db_pool_pinging", default=False)
+
+
+@dataclass(slots=True)
+class PoolSettings:
+    size: int = 10              # connections kept open
+    max_overflow: int = 10      # opened beyond `size` under load, closed when returned
+    timeout_s: float = 10.0     # checkout wait before sqlalchemy.exc.TimeoutError
+    recycle_s: float = 1800.0   # reconnect older connections (below MySQL wait_timeout, proxy idle limits)
+    pre_ping: bool = False      # ping on every checkout (one more round trip per session)
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        return cls(
+            size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", "10")),
+            timeout_s=float(os.getenv("DB_POOL_TIMEOUT_S", "10")),
+            recycle_s=float(os.getenv("DB_POOL_RECYCLE_S", "1800")),
+            pre_ping=os.getenv("DB_POOL_PRE_PING", "0") == "1",
+        )
+
+
+class PoolStats:
+    """Checkouts of one pool (per worker process): waits, exhaustion, timeouts, dead connections."""
+
+    __slots__ = ("checkouts", "wait_seconds", "max_wait_s", "exhausted", "timeouts", "pings", "dead",
+                 "on_wait", "warn_every_s", "_warned_at")
+
+    def __init__(self, *, warn_every_s: float = 10.0):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_s = 0.0
+        self.exhausted = 0       # checkouts that found every connection in use
+        self.timeouts = 0        # ... and gave up after the pool timeout
+        self.pings = 0           # idle connections checked by ping_idle_connections
+        self.dead = 0            # ... found disconnected
+        # called with the wait of every checkout (the /metrics histogram)
+        self.on_wait: Optional[Callable[[float], None]] = None
+        self.warn_every_s = warn_every_s
+        self._warned_at = float("-inf")
+
+    def checkout(self, seconds: float, exhausted: bool, timed_out: bool, pool) -> None:
+        self.checkouts += 1
+        self.wait_seconds += seconds
+        self.max_wait_s = max(self.max_wait_s, seconds)
+        if self.on_wait is not None:
+            self.on_wait(seconds)
+        if not exhausted:
+            return
+        self.exhausted += 1
+        self.timeouts += timed_out
+        now = time.monotonic()
+        if now - self._warned_at >= self.warn_every_s:
+            self._warned_at = now
+            logger.warning(
+                f"DB pool exhausted ({pool.checkedout()} connections in use, size {pool.size()}): "
+                f"waited {seconds * 1000:.1f} ms{' then timed out' if timed_out else ''} "
+                f"({self.exhausted} exhausted checkouts, {self.timeouts} timeouts so far)"
+            )
+
+    def stats(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_s * 1000, 3),
+            "exhausted": self.exhausted,
+            "timeouts": self.timeouts,
+            "pings": self.pings,
+            "dead": self.dead,
+        }
+
+
+class MonitoredPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool timing each checkout into `self.stats`.
+
+    The wait covers the whole checkout: taking an idle connection, opening a
+    new one within the overflow, or queueing until one is returned.
+    """
+
+    stats: PoolStats
+
+    def __init__(self, *args, stats: Optional[PoolStats] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats or PoolStats()
+
+    def _do_get(self):
+        if _pinging.get():
+            return super()._do_get()  # counted in stats.pings / stats.dead only
+        exhausted = (
+            self._max_overflow > -1 and self._overflow >= self._max_overflow and self.checkedin() == 0
+        )
+        t0 = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.checkout(time.perf_counter() - t0, exhausted, True, self)
+            raise
+        self.stats.checkout(time.perf_counter() - t0, exhausted, False, self)
+        return entry
+
+    def recreate(self) -> "MonitoredPool":
+        # engine.dispose() swaps in a new pool: keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_options(url: str, settings: PoolSettings) -> dict:
+    """Keyword arguments of create_async_engine for `settings`."""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # one in-memory database per connection: keep SQLAlchemy's single shared connection
+        return {}
+    return {
+        "poolclass": MonitoredPool,
+        "pool_size": settings.size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.timeout_s,
+        "pool_recycle": settings.recycle_s,
+        "pool_pre_ping": settings.pre_ping,
+    }
+
+
+def pool_stats(engine) -> Optional[PoolStats]:
+    return getattr(engine.pool, "stats", None)
+
+
+async def ping_idle_connections(engine) -> int:
+    """Ping each idle connection once; returns the number found dead.
+
+    The pool hands out idle connections first in, first out, so consecutive
+    checkouts go through all of them. Connections in use need no check. A dead
+    one invalidates the pool: SQLAlchemy reconnects every older connection at
+    its next checkout, so the loop stops there.
+    """
+    pool = engine.pool
+    stats = pool_stats(engine)
+    if not callable(getattr(pool, "checkedin", None)):
+        return 0
+    token = _pinging.set(True)
+    try:
+        return await _ping_idle(engine, pool, stats)
+    finally:
+        _pinging.reset(token)
+
+
+async def _ping_idle(engine, pool, stats: Optional[PoolStats]) -> int:
+    for _ in range(pool.checkedin()):
+        if pool.checkedin() == 0:  # taken by requests in the meantime
+            break
+        try:
+            async with engine.connect() as conn:
+                await conn.exec_driver_sql("SELECT 1")
+        except exc.DBAPIError as e:
+            if not e.connection_invalidated:
+                raise
+            if stats is not None:
+                stats.pings += 1
+                stats.dead += 1
+            logger.warning(f"Idle DB connection found dead, pool invalidated: {e.orig}")
+            return 1
+        if stats is not None:
+            stats.pings += 1
+    return 0
@@ -0,0 +1,332 @@
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sanic.log import logger
+
+from utils.db_pool import pool_stats
+from utils.query_stats import BACKGROUND as BACKGROUND_QUERIES, QueryStats, current_queries
+
+# Prometheus text exposition (format 0.0.4) without a client library: counters,
+# gauges and histograms are plain dicts keyed by label values, updated in O(1)
+# (O(log buckets) for a histogram) from the request path and rendered on scrape.
+# Metrics are per worker process.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Incremented from the code path; `fn` adds series read at scrape time ({labels: value})."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._fn = fn
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self):
+        values = {**self._values, **self._fn()} if self._fn is not None else self._values
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Gauge(_Metric):
+    """Set from the code path, or read at scrape time from `fn` (a value, or {labels: value})."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self):
+        values = self._values
+        if self._fn is not None:
+            current = self._fn()
+            if current is None:
+                return
+            values = current if isinstance(current, dict) else {(): current}
+        for labels, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def _samples(self):
+        bounds = (*self.buckets, float("inf"))
+        for labels, (counts, total, n) in self._series.items():
+            cumulative = 0
+            for bound, c in zip(bounds, counts):
+                cumulative += c
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {n}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None) -> Counter:
+        return self._add(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# --- application metrics (app.ctx.metrics) ---
+
+BACKGROUND = "background"  # route label of the statements run outside a request
+
+
+class AppMetrics(Registry):
+    def __init__(self):
+        super().__init__()
+        self.http_requests = self.counter(
+            "http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+        self.http_latency = self.histogram(
+            "http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+        self.http_in_flight = self.gauge("http_requests_in_flight", "HTTP requests being handled")
+        self.db_queries = self.counter(
+            "db_queries_total", "SQL statements executed", ("route",),
+            fn=lambda: {(BACKGROUND,): BACKGROUND_QUERIES.count})
+        self.db_query_seconds = self.counter(
+            "db_query_seconds_total", "Time spent executing SQL statements", ("route",),
+            fn=lambda: {(BACKGROUND,): BACKGROUND_QUERIES.seconds})
+        self.db_repeated_queries = self.counter(
+            "db_repeated_queries_total", "Executions of a statement already run by the same request", ("route",))
+        self.db_queries_per_request = self.histogram(
+            "http_request_db_queries", "SQL statements per HTTP request", ("route",), COUNT_BUCKETS)
+        self.amqp_publish = self.histogram(
+            "amqp_publish_confirm_seconds", "Publish-to-confirm latency of an AMQP batch")
+        self.amqp_published = self.counter("amqp_published_total", "AMQP messages confirmed by the broker")
+        self.job_duration = self.histogram(
+            "background_job_duration_seconds", "Duration of the scheduled / background jobs", ("job",))
+        self.job_failures = self.counter(
+            "background_job_failures_total", "Scheduled / background jobs that raised", ("job",))
+        self._pools: Dict[str, object] = {}  # track_pool: label -> engine
+
+    def track_pool(self, engine, name: str = "primary") -> None:
+        """Connection pool gauges labelled pool=`name`, read on scrape (pools without a size,
+        e.g. StaticPool, report nothing).
+
+        Pools of utils/db_pool.py also report the wait of each checkout, the
+        checkouts that found the pool exhausted and the dead idle connections.
+        """
+        if name in self._pools:
+            raise ValueError(f"pool {name} already tracked")
+        self._pools[name] = engine
+        if len(self._pools) == 1:
+            self._register_pool_metrics()
+        stats = pool_stats(engine)
+        if stats is not None:
+            stats.on_wait = lambda seconds: self.db_pool_wait.observe(seconds, name)
+
+    def _register_pool_metrics(self) -> None:
+        pools = self._pools
+
+        def reading(method: str):
+            # engine.pool, not the pool of today: engine.dispose() replaces it
+            def read():
+                values = {}
+                for name, engine in pools.items():
+                    fn = getattr(engine.pool, method, None)
+                    if callable(fn):
+                        values[(name,)] = fn()
+                return values
+            return read
+
+        def counting(field: str):
+            def read():
+                return {
+                    (name,): getattr(stats, field)
+                    for name, stats in ((n, pool_stats(e)) for n, e in pools.items()) if stats is not None
+                }
+            return read
+
+        self.gauge("db_pool_size", "Connections kept by the pool", ("pool",), fn=reading("size"))
+        self.gauge("db_pool_checked_out", "Connections in use", ("pool",), fn=reading("checkedout"))
+        self.gauge("db_pool_checked_in", "Idle connections in the pool", ("pool",), fn=reading("checkedin"))
+        self.gauge("db_pool_overflow", "Connections opened beyond the pool size", ("pool",), fn=reading("overflow"))
+        self.db_pool_wait = self.histogram(
+            "db_pool_wait_seconds", "Time a checkout waited for a connection", ("pool",), buckets=WAIT_BUCKETS)
+        self.counter("db_pool_exhausted_total", "Checkouts that found every connection in use", ("pool",),
+                     fn=counting("exhausted"))
+        self.counter("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection", ("pool",),
+                     fn=counting("timeouts"))
+        self.counter("db_pool_dead_connections_total", "Idle connections found dead by the liveness check",
+                     ("pool",), fn=counting("dead"))
+
+    def amqp_confirmed(self, seconds: float, messages: int) -> None:
+        self.amqp_publish.observe(seconds)
+        self.amqp_published.inc(amount=messages)
+
+    def timed(self, job: str):
+        """`async with metrics.timed("job"):` records the duration of one run of a job."""
+        return _TimedJob(self, job)
+
+
+class _TimedJob:
+    __slots__ = ("metrics", "job", "t0")
+
+    def __init__(self, metrics: AppMetrics, job: str):
+        self.metrics = metrics
+        self.job = job
+
+    async def __aenter__(self):
+        self.t0 = time.perf_counter()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.metrics.job_duration.observe(time.perf_counter() - self.t0, self.job)
+        if exc_type is not None:
+            self.metrics.job_failures.inc(self.job)
+        return False
+
+
+def route_label(request) -> str:
+    # the route pattern ("/reservations/<reservation_id:int>"), never the raw path
+    route = getattr(request, "route", None)
+    return f"/{route.path}" if route is not None else "unmatched"
+
+
+def install(app, metrics: AppMetrics, *, server_timing: bool = True, repeat_warning: int = 10) -> None:
+    """Request middleware feeding `metrics`, and GET /metrics.
+
+    The statements of each request (see utils/query_stats.py) are also sent back
+    in a Server-Timing header, and a statement run `repeat_warning` times by one
+    request (an N+1) is logged.
+    """
+    from sanic.response import HTTPResponse
+
+    @app.on_request(priority=1000)
+    async def _metrics_start(request):
+        request.ctx.metrics_t0 = time.perf_counter()
+        request.ctx.queries = QueryStats(parent=current_queries.get())
+        request.ctx.queries_token = current_queries.set(request.ctx.queries)
+        metrics.http_in_flight.inc()
+
+    @app.on_response(priority=1000)
+    async def _metrics_end(request, response):
+        t0 = getattr(request.ctx, "metrics_t0", None)
+        if t0 is None:  # the request middleware did not run (e.g. malformed request)
+            return
+        request.ctx.metrics_t0 = None
+        try:
+            current_queries.reset(request.ctx.queries_token)
+        except ValueError:  # not the context of the request middleware
+            current_queries.set(None)
+        metrics.http_in_flight.dec()
+        elapsed = time.perf_counter() - t0
+        route = route_label(request)
+        status = response.status if response is not None else 500
+        metrics.http_requests.inc(request.method, route, status)
+        metrics.http_latency.observe(elapsed, request.method, route)
+        queries = request.ctx.queries
+        metrics.db_queries.inc(route, amount=queries.count)
+        metrics.db_query_seconds.inc(route, amount=queries.seconds)
+        metrics.db_queries_per_request.observe(queries.count, route)
+        repeated = queries.repeated
+        if repeated:
+            metrics.db_repeated_queries.inc(route, amount=repeated)
+            statement, n = queries.most_repeated()
+            if n >= repeat_warning:
+                logger.warning(f"{request.method} {route}: statement run {n} times (N+1?): {' '.join(statement.split())[:200]}")
+        if server_timing and response is not None:
+            response.headers["Server-Timing"] = queries.server_timing(elapsed)
+
+    @app.get("/metrics")
+    async def metrics_endpoint(_request):
+        return HTTPResponse(metrics.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+# Statements of every engine from make_engine are timed by the cursor events
+# below and charged to the QueryStats of the current context: the one of the
+# HTTP request (set by the metrics middleware, see utils/metrics.py), of a
+# `collect()` block, or BACKGROUND outside of both.
+
+
+class QueryStats:
+    """SQL statements run in one scope: count, DB time, executions per statement text."""
+
+    __slots__ = ("count", "seconds", "statements", "parent")
+
+    def __init__(self, parent: Optional["QueryStats"] = None, *, track_statements: bool = True):
+        self.count = 0
+        self.seconds = 0.0
+        # statement text -> executions (None: not tracked, e.g. the process-wide BACKGROUND)
+        self.statements: Optional[Dict[str, int]] = {} if track_statements else None
+        # an enclosing scope sees the statements of its nested ones
+        self.parent = parent
+
+    def add(self, statement: str, seconds: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+            if stats.statements is not None:
+                stats.statements[statement] = stats.statements.get(statement, 0) + 1
+            stats = stats.parent
+
+    @property
+    def repeated(self) -> int:
+        """Executions of a statement text already run in this scope (N+1 patterns)."""
+        return sum(n - 1 for n in (self.statements or {}).values() if n > 1)
+
+    def most_repeated(self) -> Optional[Tuple[str, int]]:
+        if not self.statements:
+            return None
+        statement, n = max(self.statements.items(), key=lambda item: item[1])
+        return (statement, n) if n > 1 else None
+
+    def report(self) -> List[str]:
+        """One line per distinct statement, most executed first."""
+        ranked = sorted((self.statements or {}).items(), key=lambda item: -item[1])
+        return [f"{n:>4} x {' '.join(statement.split())}" for statement, n in ranked]
+
+    def server_timing(self, total_s: Optional[float] = None) -> str:
+        """Server-Timing header value: DB time (with the statement counts), then the total."""
+        parts = [f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries, {self.repeated} repeated"']
+        if total_s is not None:
+            parts.append(f"total;dur={total_s * 1000:.2f}")
+        return ", ".join(parts)
+
+
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+# Statements run outside any request or collect() block, process-wide
+BACKGROUND = QueryStats(track_statements=False)
+
+
+def _before(conn, _cursor, _statement, _parameters, _context, _executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after(conn, _cursor, statement, _parameters, _context, _executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    (current_queries.get() or BACKGROUND).add(statement, elapsed)
+
+
+def _failed(context):
+    # a failed statement gets no after_cursor_execute: take its start time back here,
+    # or the pooled connection keeps it forever (and the next _after pops the wrong one)
+    conn = context.connection
+    started = conn.info.get("query_started") if conn is not None else None
+    if context.execution_context is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    (current_queries.get() or BACKGROUND).add(context.statement, elapsed)
+
+
+def track_queries(engine) -> None:
+    """Time every statement of `engine` (sync or async) into the current QueryStats, failed ones included."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "after_cursor_execute", _after):
+        event.listen(sync_engine, "before_cursor_execute", _before)
+        event.listen(sync_engine, "after_cursor_execute", _after)
+        event.listen(sync_engine, "handle_error", _failed)
+
+
+@contextmanager
+def collect() -> Iterator[QueryStats]:
+    """`with collect() as stats:` counts the statements run inside the block."""
+    stats = QueryStats(parent=current_queries.get())
+    token = current_queries.set(stats)
+    try:
+        yield stats
+    finally:
+        current_queries.reset(token)
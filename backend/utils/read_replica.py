@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Read/write routing of app.ctx.Session (see db.make_session_factory). Sessions
+# go to the primary unless the operation is declared read-only: a handler
+# decorated with @read_only, or an explicit Session(read_only=True). Those go to
+# the replica (DATABASE_REPLICA_URL), except for a client that wrote in the last
+# `sticky_s` seconds, which keeps reading from the primary (read-your-writes
+# despite the replication lag). A write marks its user (per worker) and sets a
+# cookie (for the other workers).
+
+STICKY_COOKIE = "rw_until"
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+_read_only: ContextVar[bool] = ContextVar("db_read_only", default=False)
+
+
+class ReadYourWrites:
+    """Users who wrote recently, per worker (bounded, oldest forgotten first)."""
+
+    def __init__(self, sticky_s: float = 5.0, *, max_users: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.sticky_s = sticky_s
+        self.max_users = max_users
+        self._clock = clock
+        self._until: "OrderedDict[int, float]" = OrderedDict()
+
+    def wrote(self, user_id: int) -> None:
+        self._until[user_id] = self._clock() + self.sticky_s
+        self._until.move_to_end(user_id)
+        while len(self._until) > self.max_users:
+            self._until.popitem(last=False)
+
+    def is_sticky(self, user_id: Optional[int]) -> bool:
+        until = self._until.get(user_id)
+        if until is None:
+            return False
+        if until <= self._clock():
+            del self._until[user_id]
+            return False
+        return True
+
+
+class SessionRouter:
+    """Session factory of the app: `Session()` on the primary, or on the replica for reads."""
+
+    def __init__(self, primary, replica=None, *, sticky_s: float = 5.0):
+        self.primary = primary
+        self.replica = replica  # None: every session on the primary
+        self.sticky = ReadYourWrites(sticky_s)
+        self.replica_sessions = 0
+        self.sticky_sessions = 0  # read-only sessions kept on the primary by a recent write
+
+    def __call__(self, *, read_only: Optional[bool] = None) -> AsyncSession:
+        if read_only is None:
+            read_only = _read_only.get()
+        if read_only and self.replica is not None:
+            self.replica_sessions += 1
+            return self.replica()
+        return self.primary()
+
+    def reads_primary(self, request) -> bool:
+        """True when the client of `request` wrote recently (this worker, or the cookie of another)."""
+        if self.sticky.is_sticky(getattr(request.ctx, "user_id", None)):
+            return True
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "replica": self.replica is not None,
+            "replica_sessions": self.replica_sessions,
+            "sticky_sessions": self.sticky_sessions,
+        }
+
+
+def on_replica(session) -> bool:
+    """True for a replica session: repositories must not write, nor fill per-worker caches from it."""
+    return bool(session.info.get("replica", False))
+
+
+def read_only(handler):
+    """Route decorator (below the auth one): the sessions of the handler read from the replica."""
+
+    @wraps(handler)
+    async def wrapper(request, *args, **kwargs):
+        router = request.app.ctx.Session
+        use_replica = getattr(router, "replica", None) is not None
+        if use_replica and router.reads_primary(request):
+            router.sticky_sessions += 1
+            use_replica = False
+        token = _read_only.set(use_replica)
+        try:
+            return await handler(request, *args, **kwargs)
+        finally:
+            _read_only.reset(token)
+
+    return wrapper
+
+
+def install(app, router: SessionRouter) -> None:
+    """Marks the clients of successful writes as sticky to the primary."""
+    if router.replica is None:
+        return
+
+    @app.on_response
+    async def _read_your_writes(request, response):
+        if request.method not in WRITE_METHODS or response is None or response.status >= 400:
+            return
+        user_id = getattr(request.ctx, "user_id", None)
+        if user_id is not None:
+            router.sticky.wrote(user_id)
+        response.add_cookie(
+            STICKY_COOKIE, f"{time.time() + router.sticky.sticky_s:.3f}",
+            max_age=max(1, round(router.sticky.sticky_s)), httponly=True, samesite="Lax",
+        )
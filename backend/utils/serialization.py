@@ -1,17 +1,37 @@
 from __future__ import annotations
-from datetime import datetime, date
-from typing import Any
 
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import Any, Optional
 
-def jsonable(value: Any) -> Any:
-    """Convertit récursivement les objets non JSON (datetime, etc.) en valeurs sérialisables."""
-    if isinstance(value, (datetime, date)):
-        return value.isoformat()
+import orjson
+from sanic.response import HTTPResponse
 
-    if isinstance(value, dict):
-        return {k: jsonable(v) for k, v in value.items()}
+# orjson encodes dataclasses (slotted ones included), datetime/date (ISO 8601),
+# enums, dicts and lists natively, straight to bytes; `_default` only sees the rest.
+_OPTIONS = orjson.OPT_NON_STR_KEYS
 
-    if isinstance(value, (list, tuple, set)):
-        return [jsonable(v) for v in value]
 
-    return value
+def _default(value: Any) -> Any:
+    if isinstance(value, Mapping):  # SQLAlchemy RowMapping
+        return dict(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a response payload (entities, rows, datetimes...) to JSON bytes."""
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+def json(
+    body: Any,
+    status: int = 200,
+    headers: Optional[dict[str, str]] = None,
+    content_type: str = "application/json",
+) -> HTTPResponse:
+    """Drop-in for sanic.response.json, encoding with `dumps`."""
+    return HTTPResponse(dumps(body), status=status, headers=headers, content_type=content_type)
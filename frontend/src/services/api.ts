@@ -27,6 +27,20 @@ export interface ParkingSpot {
     reserved_to?: string; // ISO
 }
 
+export interface SpotAvailability {
+    id: string;
+    electrical: boolean;
+    occupied: string; // "0110000" : character i = day i
+    free: boolean;
+}
+
+export interface AvailabilityMatrix {
+    from: string;
+    to: string;
+    days: string[];
+    spots: SpotAvailability[];
+}
+
 export interface Reservation {
     id: number;
     spot_id: string;
@@ -34,6 +48,8 @@ export interface Reservation {
     start_date: string;
     end_date: string;
     checked_in: boolean;
+    released_at?: string | null; // set when the spot was freed for a missing check-in
+    series_id?: number | null; // occurrence of a recurring series (id is null until checked in)
     created_at: string;
 }
 
@@ -74,6 +90,11 @@ export const parkingApi = {
         return response.data;
     },
 
+    getAvailability: async (from: string, to: string, electricalRequired: boolean = false): Promise<AvailabilityMatrix> => {
+        const response = await api.get(`/spots/availability?from=${from}&to=${to}&electrical_required=${electricalRequired}`);
+        return response.data;
+    },
+
     // User Profile & Reservations
     getMe: async () => {
         const response = await api.get('/users/me');